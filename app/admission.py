@@ -0,0 +1,206 @@
+"""Контроль допуска вызовов к SaluteSpeech: лимиты одновременных стримов.
+
+SaluteSpeech ограничивает число одновременных вызовов на аккаунт; без
+лимита на нашей стороне пик звонков превращается в пачку RESOURCE_EXHAUSTED.
+Governor держит не больше limit вызовов одного вида (STT или TTS), остальные
+ждут в короткой очереди по приоритету (живой звонок раньше предсинтеза) и
+получают быстрый отказ, если очередь полна или ожидание дольше max_wait.
+
+Лимит адаптивный (AIMD): RESOURCE_EXHAUSTED от upstream уменьшает его
+в decrease раз (не чаще раза в cooldown), каждые limit успешных вызовов
+возвращают по единице, пока лимит не дойдёт до заданного.
+Лимиты действуют на процесс: при WORKERS > 1 делите квоту на воркеры.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import grpc
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты ожидания: меньше — раньше
+LIVE = 0
+BATCH = 1
+
+THROTTLING_CODES = (grpc.StatusCode.RESOURCE_EXHAUSTED,)
+
+
+class AdmissionRejected(Exception):
+    """Вызов не допущен: лимит upstream занят и ждать нельзя."""
+
+
+class Governor:
+    """Лимит одновременных вызовов одного вида с очередью ожидания по приоритету."""
+
+    def __init__(
+        self,
+        kind: str,
+        limit: int,
+        max_queue: int = 20,
+        max_wait: float = 0.5,
+        min_limit: int = 1,
+        decrease: float = 0.75,
+        cooldown: float = 2.0,
+    ):
+        self.kind = kind
+        self.max_limit = max(1, limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._decrease = decrease
+        self._cooldown = cooldown
+        self._limit = float(self.max_limit)
+        self._throttled_at = float("-inf")
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._limit_gauge = metrics.ADMISSION_LIMIT.labels(kind)
+        self._active_gauge = metrics.ADMISSION_ACTIVE.labels(kind)
+        self._limit_gauge.set(self.max_limit)
+        self.rejected = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int = LIVE) -> None:
+        """Занимает слот; AdmissionRejected — очередь полна или слот не освободился за max_wait."""
+        if self._active < self.limit and not self.waiting:
+            self._take()
+            return
+        if self.waiting >= self.max_queue and not self._preempt(priority):
+            self._reject("queue_full")
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._forget(entry)
+                self._reject("timeout")
+        except BaseException:
+            if not future.done():
+                self._forget(entry)
+            elif not future.cancelled() and future.exception() is None:
+                # Слот уже передан этому вызову — возвращаем его
+                self.release()
+            raise
+
+    def try_acquire(self) -> bool:
+        """Занимает свободный слот без ожидания; False — слотов нет или их ждут другие."""
+        if self._active < self.limit and not self.waiting:
+            self._take()
+            return True
+        return False
+
+    def release(self) -> None:
+        self._active -= 1
+        self._active_gauge.dec()
+        self._wake()
+
+    def throttled(self) -> None:
+        """Upstream ответил RESOURCE_EXHAUSTED: снижает лимит."""
+        now = time.monotonic()
+        if now - self._throttled_at < self._cooldown:
+            return
+        self._throttled_at = now
+        previous = self.limit
+        self._limit = max(float(self.min_limit), self._limit * self._decrease)
+        self._limit_gauge.set(self.limit)
+        logger.warning(f"Admission {self.kind}: upstream ограничивает вызовы, лимит {previous} → {self.limit}")
+
+    def succeeded(self) -> None:
+        """Вызов завершился без ограничения: лимит постепенно возвращается к заданному."""
+        if self._limit < self.max_limit:
+            self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+            self._limit_gauge.set(self.limit)
+            self._wake()
+
+    def report(self, error: BaseException | None) -> None:
+        """Учитывает исход вызова для адаптивного лимита."""
+        if isinstance(error, grpc.aio.AioRpcError) and error.code() in THROTTLING_CODES:
+            self.throttled()
+        elif error is None:
+            self.succeeded()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = LIVE):
+        """`async with governor.slot(): ...` — слот на время вызова, исход идёт в адаптивный лимит."""
+        await self.acquire(priority)
+        try:
+            yield
+        except BaseException as e:
+            self.report(e)
+            raise
+        else:
+            self.report(None)
+        finally:
+            self.release()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "limit": self.limit,
+            "active": self._active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+    def _take(self) -> None:
+        self._active += 1
+        self._active_gauge.inc()
+
+    def _wake(self) -> None:
+        while self._waiters and self._active < self.limit:
+            *_, future = heapq.heappop(self._waiters)
+            self._take()
+            future.set_result(None)
+
+    def _preempt(self, priority: int) -> bool:
+        """Очередь полна: вытесняет самый поздний ожидающий вызов с более низким приоритетом."""
+        victim = max(self._waiters)
+        if victim[0] <= priority:
+            return False
+        self._waiters.remove(victim)
+        heapq.heapify(self._waiters)
+        self.rejected += 1
+        metrics.ADMISSION_REJECTED.labels(self.kind, "preempted").inc()
+        victim[2].set_exception(AdmissionRejected(f"SaluteSpeech {self.kind} capacity taken by a live call"))
+        return True
+
+    def _forget(self, entry: tuple[int, int, asyncio.Future]) -> None:
+        entry[2].cancel()
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        metrics.ADMISSION_REJECTED.labels(self.kind, reason).inc()
+        raise AdmissionRejected(
+            f"SaluteSpeech {self.kind} capacity exhausted: {self._active}/{self.limit} calls active, "
+            f"{self.waiting} waiting ({reason})"
+        )
+
+
+@asynccontextmanager
+async def admitted(governor: Governor | None, priority: int = LIVE):
+    """slot() governor или ничего, если контроль допуска выключен."""
+    if governor is None:
+        yield
+        return
+    async with governor.slot(priority):
+        yield
@@ -0,0 +1,183 @@
+"""Утилиты работы с PCM аудио: WAV, ресемплинг, G.711."""
+import re
+import struct
+from math import gcd
+
+import numpy as np
+
+DEFAULT_VOICE_SAMPLE_RATE = 24000
+# Частоты PCM, которые адаптер отдаёт jambonz (с ресемплингом от частоты голоса)
+OUTPUT_SAMPLE_RATES = (8000, 16000, 24000, 48000)
+
+# Размер RIFF/data для WAV, длина которого заранее неизвестна (стриминг)
+WAV_UNKNOWN_SIZE = 0xFFFFFFFF
+
+_VOICE_RATE_RE = re.compile(r"_(\d{4,5})$")
+
+
+def voice_sample_rate(voice: str) -> int:
+    """Частота PCM голоса SaluteSpeech по суффиксу имени (Nec_24000 → 24000, Ost_8000 → 8000)."""
+    match = _VOICE_RATE_RE.search(voice.split(";")[0])
+    if match:
+        return int(match.group(1))
+    return DEFAULT_VOICE_SAMPLE_RATE
+
+
+def wav_header(
+    sample_rate: int,
+    channels: int = 1,
+    bits_per_sample: int = 16,
+    data_size: int | None = None,
+) -> bytes:
+    """Заголовок WAV (PCM). Без data_size — заголовок для стриминга неизвестной длины."""
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    if data_size is None:
+        riff_size = data_size = WAV_UNKNOWN_SIZE
+    else:
+        riff_size = 36 + data_size
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample,
+        b"data", data_size,
+    )
+
+
+# --- Ресемплинг ---
+
+
+def _design_lowpass(num_taps: int, cutoff: float, beta: float = 8.0) -> np.ndarray:
+    """FIR фильтр нижних частот (windowed sinc, окно Кайзера); cutoff — доля частоты дискретизации."""
+    n = np.arange(num_taps) - (num_taps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(num_taps, beta)
+    return taps / taps.sum()
+
+
+class Resampler:
+    """Потоковый полифазный ресемплер PCM S16LE (mono), например 24000 → 8000.
+
+    Фильтр применяется векторно ко всему chunk; история входа и фаза
+    сохраняются между вызовами process(), поэтому поток на границах
+    chunks непрерывен. Нечётный байт на конце chunk переносится в следующий.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, taps_per_phase: int = 16):
+        g = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self._up = out_rate // g
+        self._down = in_rate // g
+        self.passthrough = self._up == self._down
+
+        # Прототип на частоте in_rate * up, срез ниже Найквиста меньшей из частот
+        num_taps = taps_per_phase * max(self._up, self._down)
+        num_taps += -num_taps % self._up
+        cutoff = 0.5 / max(self._up, self._down) * 0.9
+        prototype = _design_lowpass(num_taps, cutoff) * self._up
+        # phases[p, k] = h[k * up + p]: коэффициенты для x[t // up - k]
+        self._phases = prototype.reshape(-1, self._up).T.astype(np.float32)
+        self._k = self._phases.shape[1]
+        self._history = np.zeros(self._k - 1, dtype=np.float32)
+        self._t = 0
+        self._odd = b""
+
+    def reset(self) -> None:
+        """Сбрасывает состояние фильтра (новый поток, barge-in)."""
+        self._history[:] = 0
+        self._t = 0
+        self._odd = b""
+
+    def process(self, pcm: bytes) -> bytes:
+        if self.passthrough:
+            return pcm
+        if self._odd:
+            pcm = self._odd + pcm
+            self._odd = b""
+        if len(pcm) % 2:
+            pcm, self._odd = pcm[:-1], pcm[-1:]
+        x = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+        if not len(x):
+            return b""
+
+        buf = np.concatenate((self._history, x))
+        up, down = self._up, self._down
+        # Выходные отсчёты t (в сетке in_rate * up), для которых вход уже есть
+        count = max(0, -(-(len(x) * up - self._t) // down))
+        ts = self._t + down * np.arange(count)
+        bases = ts // up + (self._k - 1)
+        windows = buf[bases[:, None] - np.arange(self._k)[None, :]]
+        y = np.einsum("nk,nk->n", windows, self._phases[ts % up])
+
+        self._t = self._t + down * count - len(x) * up
+        if self._k > 1:
+            self._history = buf[-(self._k - 1):].copy()
+        return np.clip(np.rint(y), -32768, 32767).astype("<i2").tobytes()
+
+
+# --- G.711 ---
+
+
+def _build_ulaw_table() -> np.ndarray:
+    """µ-law код для каждого int16 (G.711, 14-битная линейная шкала)."""
+    pcm = np.arange(-32768, 32768, dtype=np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    pcm = np.minimum(np.abs(pcm), 8159) + 0x21
+    seg = np.searchsorted(np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]), pcm)
+    code = np.where(seg >= 8, 0x7F, (seg << 4) | ((pcm >> (seg + 1)) & 0xF))
+    return (code ^ mask).astype(np.uint8)
+
+
+def _build_alaw_table() -> np.ndarray:
+    """A-law код для каждого int16 (G.711, 13-битная линейная шкала)."""
+    pcm = np.arange(-32768, 32768, dtype=np.int32) >> 3
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    pcm = np.where(pcm >= 0, pcm, -pcm - 1)
+    seg = np.searchsorted(np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF]), pcm)
+    mantissa = np.where(seg < 2, pcm >> 1, pcm >> np.maximum(seg, 1)) & 0xF
+    code = np.where(seg >= 8, 0x7F, (seg << 4) | mantissa)
+    return (code ^ mask).astype(np.uint8)
+
+
+# Индекс — int16 отсчёт + 32768
+_ULAW_TABLE = _build_ulaw_table()
+_ALAW_TABLE = _build_alaw_table()
+
+
+def _g711_encode(pcm: bytes, table: np.ndarray) -> bytes:
+    samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+    return table[samples.astype(np.int32) + 32768].tobytes()
+
+
+def ulaw_encode(pcm: bytes) -> bytes:
+    """PCM S16LE → µ-law (байт на отсчёт)."""
+    return _g711_encode(pcm, _ULAW_TABLE)
+
+
+def alaw_encode(pcm: bytes) -> bytes:
+    """PCM S16LE → A-law (байт на отсчёт)."""
+    return _g711_encode(pcm, _ALAW_TABLE)
+
+
+_PCM_ENCODERS = {"pcm": None, "mulaw": ulaw_encode, "alaw": alaw_encode}
+
+
+class PcmEncoder:
+    """Потоковое преобразование PCM S16LE голоса: ресемплинг и кодирование (pcm, mulaw, alaw)."""
+
+    def __init__(self, in_rate: int, out_rate: int, encoding: str = "pcm"):
+        self._resampler = Resampler(in_rate, out_rate)
+        self._encode = _PCM_ENCODERS[encoding]
+        self._odd = b""
+
+    def process(self, pcm: bytes) -> bytes:
+        pcm = self._resampler.process(pcm)
+        if self._encode is None:
+            return pcm
+        # Ресемплер без преобразования частоты отдаёт chunk как есть, в том числе с нечётным байтом
+        if self._odd:
+            pcm = self._odd + pcm
+            self._odd = b""
+        if len(pcm) % 2:
+            pcm, self._odd = pcm[:-1], pcm[-1:]
+        return self._encode(pcm)
@@ -0,0 +1,223 @@
+"""Выходное аудио /tts-stream: кадры фиксированной длины в темпе воспроизведения.
+
+SaluteSpeech отдаёт аудио кусками произвольного размера и быстрее
+реального времени. Если сразу отправлять их в WebSocket, в буфере
+отправки и у jambonz копятся секунды аудио, которые barge-in уже не
+отменит, а кадры для jambonz получаются неровными. FramePacer режет PCM
+на кадры по frame_ms в преаллоцированном кольцевом буфере и отправляет
+их в темпе воспроизведения с небольшим опережением lead_ms. Поэтому в
+пути не больше lead_ms аудио, а clear срабатывает почти сразу.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRing:
+    """Кольцевой буфер PCM на capacity байт, читается кадрами по frame_bytes.
+
+    Данные копируются один раз, в буфер при write(). Кадр отдаётся как
+    memoryview на буфер, без копии; кадр на стыке кольца собирается в
+    отдельный преаллоцированный буфер. Кадр действителен до consume().
+    """
+
+    def __init__(self, frame_bytes: int, capacity: int, sample_bytes: int = 2):
+        self.frame_bytes = frame_bytes
+        self.sample_bytes = sample_bytes
+        frames = max(2, -(-capacity // frame_bytes))
+        self._buffer = memoryview(bytearray(frames * frame_bytes))
+        self._scratch = memoryview(bytearray(frame_bytes))
+        self._read = 0
+        self._size = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self._size
+
+    def write(self, data: bytes | memoryview) -> int:
+        """Копирует в буфер столько data, сколько помещается; возвращает число байт."""
+        source = memoryview(data)
+        count = min(len(source), self.free)
+        start = (self._read + self._size) % self.capacity
+        first = min(count, self.capacity - start)
+        self._buffer[start:start + first] = source[:first]
+        self._buffer[:count - first] = source[first:count]
+        self._size += count
+        return count
+
+    def frame(self, pad: bool = False) -> tuple[memoryview | None, int]:
+        """Следующий кадр и сколько байт он занимает в буфере.
+
+        Неполный кадр отдаётся только с pad=True, дополненный тишиной, и
+        только из целых отсчётов: неполный отсчёт остаётся в буфере, чтобы
+        следующие кадры не сдвинулись на байт. (None, 0) — кадра нет.
+        """
+        size = min(self.frame_bytes, self._size)
+        if not size or (size < self.frame_bytes and not pad):
+            return None, 0
+        if size < self.frame_bytes:
+            size -= size % self.sample_bytes
+        end = self._read + size
+        if size == self.frame_bytes and end <= self.capacity:
+            return self._buffer[self._read:end], size
+        first = min(size, self.capacity - self._read)
+        self._scratch[:first] = self._buffer[self._read:self._read + first]
+        self._scratch[first:size] = self._buffer[:size - first]
+        self._scratch[size:] = bytes(self.frame_bytes - size)
+        return self._scratch, size
+
+    def consume(self, size: int) -> None:
+        self._read = (self._read + size) % self.capacity
+        self._size -= size
+
+    def clear(self) -> int:
+        """Сбрасывает содержимое; возвращает число отброшенных байт."""
+        dropped = self._size
+        self._read = 0
+        self._size = 0
+        return dropped
+
+
+class FramePacer:
+    """Отправляет PCM S16LE кадрами по frame_ms в реальном темпе с опережением lead_ms.
+
+    write() ждёт места в буфере на buffer_ms аудио, и это backpressure для
+    синтеза. Неполный кадр дополняется тишиной, только когда jambonz
+    доиграл всё отправленное (конец реплики или недобор): пауза между
+    chunks синтеза короче опережения не вставляет тишину в середину
+    реплики. После паузы отсчёт темпа начинается заново, и первые
+    lead_ms снова уходят сразу. clear() сбрасывает
+    неотправленное аудио и прерывает ожидающие write().
+    """
+
+    def __init__(
+        self,
+        send: Callable[[memoryview], Awaitable[None]],
+        sample_rate: int,
+        frame_ms: int = 20,
+        lead_ms: int = 200,
+        buffer_ms: int = 500,
+    ):
+        self._send = send
+        self._frame_seconds = frame_ms / 1000
+        self._lead_seconds = lead_ms / 1000
+        frame_bytes = sample_rate * 2 * frame_ms // 1000
+        self._ring = FrameRing(frame_bytes, sample_rate * 2 * max(buffer_ms, frame_ms) // 1000)
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._generation = 0
+        self._epoch: float | None = None
+        self._frames = 0
+        self._task: asyncio.Task | None = None
+
+        self.frames_sent = 0
+        self.padded_frames = 0
+        self.dropped_bytes = 0
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._ring.size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "frames_sent": self.frames_sent,
+            "padded_frames": self.padded_frames,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def write(self, pcm: bytes) -> None:
+        """Добавляет PCM; ждёт места в буфере. Аудио, не поместившееся до clear(), отбрасывается."""
+        generation = self._generation
+        data = memoryview(pcm)
+        while data:
+            written = self._ring.write(data)
+            data = data[written:]
+            if written:
+                self._readable.set()
+            if data:
+                self._writable.clear()
+                await self._writable.wait()
+                if generation != self._generation:
+                    return
+
+    def clear(self) -> int:
+        """Barge-in: сбрасывает неотправленное аудио; возвращает число отброшенных байт."""
+        dropped = self._ring.clear()
+        self.dropped_bytes += dropped
+        self._generation += 1
+        self._epoch = None
+        self._writable.set()
+        return dropped
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.clear()
+
+    def _playout_end(self, now: float) -> float:
+        """Когда jambonz доиграет отправленное; если уже доиграл — через frame_ms."""
+        if self._epoch is not None:
+            end = self._epoch + self._frames * self._frame_seconds
+            if end > now:
+                return end
+        return now + self._frame_seconds
+
+    async def _wait_frame(self) -> None:
+        """Ждёт полный кадр; неполный — только до конца воспроизведения отправленного."""
+        loop = asyncio.get_running_loop()
+        ring = self._ring
+        deadline = None
+        while ring.size < ring.frame_bytes:
+            self._readable.clear()
+            if not ring.size:
+                deadline = None
+                await self._readable.wait()
+                continue
+            if deadline is None:
+                deadline = self._playout_end(loop.time())
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._readable.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wait_frame()
+            now = loop.time()
+            if self._epoch is None or now > self._epoch + self._frames * self._frame_seconds:
+                # Начало, clear или недобор: jambonz уже доиграл отправленное
+                self._epoch, self._frames = now, 0
+            delay = self._epoch + self._frames * self._frame_seconds - self._lead_seconds - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            frame, size = self._ring.frame(pad=True)
+            if frame is None:
+                continue
+            generation = self._generation
+            await self._send(frame)
+            if generation == self._generation:
+                self._ring.consume(size)
+                self._writable.set()
+            self._frames += 1
+            self.frames_sent += 1
+            if size < self._ring.frame_bytes:
+                self.padded_frames += 1
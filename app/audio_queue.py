@@ -0,0 +1,251 @@
+"""Очередь входящего аудио STT: склейка кадров и ограниченный буфер.
+
+jambonz шлёт кадры по ~20 мс; каждый отдельным RecognitionRequest —
+это лишний protobuf и HTTP/2 framing на каждый кадр. AudioQueue
+склеивает кадры в chunks заданной длительности (с таймером максимальной
+задержки) и держит ограниченный буфер с явной политикой переполнения,
+чтобы при зависшем upstream память не росла без предела.
+"""
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# drop_oldest — отбросить самый старый chunk, block — ждать места (backpressure
+# на WebSocket), fail — завершить сессию ошибкой
+OVERFLOW_POLICIES = ("drop_oldest", "block", "fail")
+
+
+class AudioQueueOverflow(Exception):
+    """Очередь аудио переполнена при политике fail."""
+
+
+class AudioQueue:
+    """Склеивает кадры в chunks по chunk_ms и буферизует не более max_queue_ms аудио.
+
+    chunk_ms=0 — кадры передаются как есть. Неполный chunk отправляется,
+    если новых кадров нет max_latency_ms (по умолчанию chunk_ms).
+    close() отправляет остаток; после него get() возвращает None.
+    depth_gauge (Gauge метрики) следит за числом chunks в очереди;
+    оставшиеся при завершении сессии chunks снимает discard().
+    """
+
+    def __init__(
+        self,
+        bytes_per_second: int,
+        chunk_ms: int = 0,
+        max_latency_ms: int | None = None,
+        max_queue_ms: int = 10000,
+        overflow: str = "drop_oldest",
+        depth_gauge=None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self._chunk_bytes = bytes_per_second * max(0, chunk_ms) // 1000
+        self._chunk_bytes -= self._chunk_bytes % 2
+        self._max_latency = (chunk_ms if max_latency_ms is None else max_latency_ms) / 1000
+        self._max_bytes = max(bytes_per_second * max_queue_ms // 1000, self._chunk_bytes, 1)
+        self._overflow = overflow
+        self._depth_gauge = depth_gauge
+
+        self._pending = bytearray()
+        self._pending_frames = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+        self._chunks: deque[bytes] = deque()
+        self._queued_bytes = 0
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._closed = False
+
+        self.frames = 0
+        self.chunks = 0
+        self.coalesced_frames = 0
+        self.dropped_chunks = 0
+        self.dropped_bytes = 0
+
+    @property
+    def depth(self) -> int:
+        """Число chunks в очереди."""
+        return len(self._chunks)
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "frames": self.frames,
+            "chunks": self.chunks,
+            "coalesced_frames": self.coalesced_frames,
+            "dropped_chunks": self.dropped_chunks,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+    async def put(self, frame: bytes) -> None:
+        """Добавляет кадр. При политике block может ждать, при fail — бросает AudioQueueOverflow."""
+        if self._closed or not frame:
+            return
+        self.frames += 1
+        if not self._chunk_bytes:
+            await self._enqueue(frame)
+            return
+
+        self._pending += frame
+        self._pending_frames += 1
+        if len(self._pending) >= self._chunk_bytes:
+            await self._enqueue(self._take_pending())
+        elif self._flush_handle is None and self._max_latency > 0:
+            self._flush_handle = asyncio.get_running_loop().call_later(self._max_latency, self._flush_on_timer)
+
+    async def close(self) -> None:
+        """Отправляет накопленный остаток и завершает очередь."""
+        if self._closed:
+            return
+        if self._pending:
+            self._append(self._take_pending())
+        self._closed = True
+        self._readable.set()
+        self._writable.set()
+
+    async def get(self) -> bytes | None:
+        """Следующий chunk; None — очередь закрыта и пуста."""
+        while not self._chunks:
+            if self._closed:
+                return None
+            self._readable.clear()
+            await self._readable.wait()
+        chunk = self._chunks.popleft()
+        self._queued_bytes -= len(chunk)
+        if self._depth_gauge is not None:
+            self._depth_gauge.dec()
+        self._writable.set()
+        return chunk
+
+    def unget(self, chunk: bytes) -> None:
+        """Возвращает chunk в начало очереди: его забрал вызов, который уже завершён."""
+        self._chunks.appendleft(chunk)
+        self._queued_bytes += len(chunk)
+        if self._depth_gauge is not None:
+            self._depth_gauge.inc()
+        self._readable.set()
+
+    def discard(self) -> None:
+        """Сбрасывает неотправленные chunks (сессия завершена)."""
+        if self._depth_gauge is not None and self._chunks:
+            self._depth_gauge.dec(len(self._chunks))
+        self._chunks.clear()
+        self._queued_bytes = 0
+
+    def _take_pending(self) -> bytes:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        chunk = bytes(self._pending)
+        self.coalesced_frames += self._pending_frames - 1
+        self._pending.clear()
+        self._pending_frames = 0
+        return chunk
+
+    def _flush_on_timer(self) -> None:
+        # Новых кадров нет max_latency: отправляем неполный chunk. Таймер не может
+        # ждать места, поэтому при политике block chunk дописывается сверх лимита
+        self._flush_handle = None
+        if not self._pending or self._closed:
+            return
+        chunk = self._take_pending()
+        if self._overflow == "drop_oldest":
+            self._drop_for(len(chunk))
+        self._append(chunk)
+
+    async def _enqueue(self, chunk: bytes) -> None:
+        while self._chunks and self._queued_bytes + len(chunk) > self._max_bytes:
+            if self._overflow == "block":
+                self._writable.clear()
+                await self._writable.wait()
+                if self._closed:
+                    return
+            elif self._overflow == "fail":
+                raise AudioQueueOverflow(
+                    f"STT audio queue overflow: {self._queued_bytes} bytes buffered, upstream is not reading"
+                )
+            else:
+                self._drop_for(len(chunk))
+        self._append(chunk)
+
+    def _drop_for(self, size: int) -> None:
+        while self._chunks and self._queued_bytes + size > self._max_bytes:
+            dropped = self._chunks.popleft()
+            self._queued_bytes -= len(dropped)
+            if self._depth_gauge is not None:
+                self._depth_gauge.dec()
+            self.dropped_chunks += 1
+            self.dropped_bytes += len(dropped)
+            if self.dropped_chunks == 1:
+                logger.warning("STT: очередь аудио переполнена, старые chunks отбрасываются")
+
+    def _append(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+        self._queued_bytes += len(chunk)
+        if self._depth_gauge is not None:
+            self._depth_gauge.inc()
+        self.chunks += 1
+        self._readable.set()
+
+
+class ReplayBuffer:
+    """Аудио, отправленное в текущий Recognize после последнего финального результата.
+
+    Позиции считаются в байтах от начала вызова: по ним processed_audio_end
+    финального результата отсекает подтверждённое аудио. При переподключении
+    оставшиеся chunks отправляются в новый вызов первыми (restart() переносит
+    их в начало нового вызова). Буфер ограничен max_bytes: при переполнении
+    теряются самые старые chunks, и повтор будет неполным.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max(1, max_bytes)
+        self._chunks: deque[bytes] = deque()
+        self._size = 0
+        # Позиция первого байта буфера в текущем вызове
+        self._start = 0
+        self.dropped_bytes = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def position(self) -> int:
+        """Байт аудио, отправленных в текущий вызов."""
+        return self._start + self._size
+
+    def append(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        while self._size > self._max_bytes:
+            dropped = self._chunks.popleft()
+            self._size -= len(dropped)
+            self._start += len(dropped)
+            self.dropped_bytes += len(dropped)
+
+    def ack(self, position: int | None = None) -> None:
+        """Отбрасывает аудио до position (None — всё отправленное): upstream его распознал."""
+        end = self.position if position is None else min(position, self.position)
+        while self._chunks and self._start < end:
+            head = self._chunks[0]
+            if self._start + len(head) <= end:
+                self._chunks.popleft()
+                self._size -= len(head)
+                self._start += len(head)
+            else:
+                cut = end - self._start
+                self._chunks[0] = head[cut:]
+                self._size -= cut
+                self._start = end
+
+    def restart(self) -> list[bytes]:
+        """Chunks для повтора в новом вызове; их позиции отсчитываются заново от нуля."""
+        self._start = 0
+        return list(self._chunks)
@@ -1,15 +1,22 @@
 """Модуль авторизации SaluteSpeech OAuth2."""
+import asyncio
 import base64
 import os
+import random
 import time
 import uuid
 import logging
 import httpx
 
+from app import metrics
+from app.token_store import TokenStore
+
 logger = logging.getLogger(__name__)
 
 SBER_OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
 TOKEN_REFRESH_MARGIN_MS = 60_000
+# Фоновое обновление начинается заранее, чтобы запросы не ждали OAuth
+TOKEN_RENEW_AHEAD_MS = 120_000
 
 # Путь к сертификатам Минцифры РФ
 CERTS_DIR = os.path.join(os.path.dirname(__file__), "..", "certs")
@@ -17,13 +24,82 @@ CA_BUNDLE = os.path.join(CERTS_DIR, "combined-ca-bundle.pem")
 
 
 class SberAuth:
-    """Менеджер OAuth2 токенов для SaluteSpeech API."""
+    """Менеджер OAuth2 токенов для SaluteSpeech API.
+
+    Обновление single-flight: конкурентные вызовы get_token ждут один запрос
+    к OAuth. После start() токен обновляется в фоне до истечения, поэтому
+    сессии его не ждут. HTTP клиент один на процесс.
 
-    def __init__(self, client_id: str, client_secret: str, scope: str = "SALUTE_SPEECH_PERS"):
+    С store токен общий для воркеров и реплик: сначала читается из store,
+    к OAuth идёт только процесс, взявший lock store.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        scope: str = "SALUTE_SPEECH_PERS",
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        retry_interval: float = 5.0,
+        store: TokenStore | None = None,
+        oauth_url: str = SBER_OAUTH_URL,
+    ):
         self._auth_key = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
         self._scope = scope
+        self._oauth_url = oauth_url
         self._token: str | None = None
         self._expires_at: int = 0
+        # Токен, отвергнутый upstream (UNAUTHENTICATED): из store его не брать
+        self._rejected: str | None = None
+
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._retry_interval = retry_interval
+        self._store = store
+
+        self._client: httpx.AsyncClient | None = None
+        self._inflight: asyncio.Task | None = None
+        self._renew_task: asyncio.Task | None = None
+
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.retries = 0
+        self.store_hits = 0
+        self.last_refresh_ms = 0.0
+        self.max_refresh_ms = 0.0
+        self._total_refresh_ms = 0.0
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "retries": self.retries,
+            "store_hits": self.store_hits,
+            "last_refresh_ms": self.last_refresh_ms,
+            "avg_refresh_ms": self._total_refresh_ms / self.refreshes if self.refreshes else 0.0,
+            "max_refresh_ms": self.max_refresh_ms,
+        }
+
+    async def start(self) -> None:
+        """Запускает фоновое обновление токена."""
+        if self._renew_task is None:
+            self._renew_task = asyncio.create_task(self._renew_loop())
+
+    async def close(self) -> None:
+        """Останавливает фоновое обновление и закрывает HTTP клиент."""
+        for task in (self._renew_task, self._inflight):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._renew_task = None
+        self._inflight = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     def _is_token_valid(self) -> bool:
         if not self._token:
@@ -34,35 +110,134 @@ class SberAuth:
     async def get_token(self) -> str:
         if self._is_token_valid():
             return self._token
-        await self._refresh_token()
+        await self._refresh()
         return self._token
 
-    async def _refresh_token(self) -> None:
-        logger.info("Запрос нового access token у SaluteSpeech")
+    def invalidate(self, token: str) -> None:
+        """Upstream отверг token: следующий get_token запросит новый, а не вернёт его же.
 
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Accept": "application/json",
-            "RqUID": str(uuid.uuid4()),
-            "Authorization": f"Basic {self._auth_key}",
-        }
-        data = {"scope": self._scope}
+        Токен из store, совпадающий с отвергнутым, тоже не используется.
+        """
+        self._rejected = token
+        if self._token == token:
+            self._token = None
+            self._expires_at = 0
+
+    async def _refresh(self) -> None:
+        """Single-flight: один запрос к OAuth на всех ожидающих."""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._refresh_token())
+            # Ошибку получают ожидающие; если все они отменены — не логировать её как потерянную
+            self._inflight.add_done_callback(lambda task: task.cancelled() or task.exception())
+        # shield: отмена одной сессии не отменяет обновление для остальных
+        await asyncio.shield(self._inflight)
+
+    def _renew_delay_ms(self, expires_at: int) -> float:
+        return expires_at - TOKEN_REFRESH_MARGIN_MS - TOKEN_RENEW_AHEAD_MS - time.time() * 1000
+
+    async def _renew_loop(self) -> None:
+        while True:
+            delay_ms = self._renew_delay_ms(self._expires_at)
+            if self._token and delay_ms > 0:
+                await asyncio.sleep(delay_ms / 1000)
+            try:
+                await self._refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Фоновое обновление токена не удалось: {e}, повтор через {self._retry_interval}s")
+                await asyncio.sleep(self._retry_interval)
+
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # Отключаем проверку SSL для OAuth (сертификаты Минцифры не в системном хранилище)
+            self._client = httpx.AsyncClient(verify=False, timeout=10.0)
+        return self._client
+
+    async def _refresh_token(self) -> None:
+        if self._store is None:
+            await self._fetch_token()
+            return
+        stage = "store"
+        try:
+            if await self._adopt_stored():
+                return
+            async with self._store.lock():
+                # Пока ждали lock, токен мог обновить другой процесс
+                if await self._adopt_stored():
+                    return
+                stage = "oauth"
+                await self._fetch_token()
+                stage = "store"
+                await self._store.save(self._token, self._expires_at)
+        except Exception as e:
+            if stage == "oauth":
+                raise
+            if self._renew_delay_ms(self._expires_at) > 0:
+                # Токен получен, не удалось только сохранить его или снять lock
+                logger.warning(f"Хранилище токена недоступно, токен не сохранён: {e}")
+                return
+            logger.warning(f"Хранилище токена недоступно: {e}, запрос токена без него")
+            await self._fetch_token()
 
-        # Отключаем проверку SSL для OAuth (сертификаты Минцифры не в системном хранилище)
-        async with httpx.AsyncClient(verify=False) as client:
-            response = await client.post(
-                SBER_OAUTH_URL,
-                headers=headers,
-                data=data,
-                timeout=10.0,
-            )
+    async def _adopt_stored(self) -> bool:
+        """Берёт токен из store, если до его фонового обновления ещё есть время."""
+        stored = await self._store.load()
+        if stored is None or stored[0] == self._rejected or self._renew_delay_ms(stored[1]) <= 0:
+            return False
+        self._token, self._expires_at = stored
+        self.store_hits += 1
+        logger.info("Access token получен из общего хранилища")
+        return True
 
-        if response.status_code != 200:
-            logger.error(f"Ошибка получения токена: {response.status_code} {response.text}")
-            raise RuntimeError(f"Failed to get SaluteSpeech token: {response.status_code}")
+    async def _fetch_token(self) -> None:
+        logger.info("Запрос нового access token у SaluteSpeech")
+        started = time.perf_counter()
+        try:
+            token_data = await self._request_token()
+        except Exception:
+            self.refresh_failures += 1
+            metrics.OAUTH_REFRESH_FAILURES.inc()
+            raise
 
-        token_data = response.json()
         self._token = token_data["access_token"]
         self._expires_at = token_data["expires_at"]
 
-        logger.info("Access token успешно получен")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.OAUTH_REFRESH.observe(elapsed_ms / 1000)
+        self.refreshes += 1
+        self.last_refresh_ms = elapsed_ms
+        self.max_refresh_ms = max(self.max_refresh_ms, elapsed_ms)
+        self._total_refresh_ms += elapsed_ms
+        logger.info(f"Access token успешно получен за {elapsed_ms:.0f}ms")
+
+    async def _request_token(self) -> dict:
+        """POST к OAuth с повторами: сетевые ошибки, 429 и 5xx — с экспоненциальным backoff."""
+        data = {"scope": self._scope}
+        attempt = 0
+        while True:
+            headers = {
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+                "RqUID": str(uuid.uuid4()),
+                "Authorization": f"Basic {self._auth_key}",
+            }
+            try:
+                response = await self._http_client().post(self._oauth_url, headers=headers, data=data)
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                logger.error(f"Ошибка получения токена: {response.status_code} {response.text}")
+                if response.status_code != 429 and response.status_code < 500:
+                    raise RuntimeError(f"Failed to get SaluteSpeech token: {response.status_code}")
+                error = f"HTTP {response.status_code}"
+
+            if attempt >= self._max_retries:
+                raise RuntimeError(f"Failed to get SaluteSpeech token: {error}")
+            delay = self._backoff_base * 2 ** attempt * random.uniform(0.5, 1.5)
+            attempt += 1
+            self.retries += 1
+            logger.warning(f"OAuth: {error}, повтор {attempt}/{self._max_retries} через {delay:.2f}s")
+            await asyncio.sleep(delay)
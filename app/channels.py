@@ -0,0 +1,244 @@
+"""Пул долгоживущих gRPC каналов к SaluteSpeech.
+
+Каналы создаются один раз при старте приложения и переиспользуются
+всеми STT/TTS вызовами: DNS, TCP, TLS и HTTP/2 setup выполняются
+не на каждую реплику, а один раз на канал.
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import grpc
+
+logger = logging.getLogger(__name__)
+
+SALUTE_SPEECH_HOST = "smartspeech.sber.ru:443"
+
+# Путь к сертификатам Минцифры РФ
+CERTS_DIR = os.path.join(os.path.dirname(__file__), "..", "certs")
+CA_CERT_PATH = os.path.join(CERTS_DIR, "russian-trusted-chain.pem")
+
+CHANNEL_OPTIONS = [
+    ("grpc.ssl_target_name_override", "smartspeech.sber.ru"),
+    ("grpc.default_authority", "smartspeech.sber.ru"),
+    ("grpc.dns_resolver", "native"),
+    # Keepalive: детекция мёртвых соединений
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # Без этого gRPC может склеить каналы с одинаковыми параметрами в один subchannel
+    ("grpc.use_local_subchannel_pool", 1),
+]
+
+# Состояния, в которых канал пересоздаётся
+_BROKEN_STATES = (
+    grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+    grpc.ChannelConnectivity.SHUTDOWN,
+)
+
+
+def get_ssl_credentials():
+    """Создаёт SSL credentials с сертификатами Минцифры РФ."""
+    root_certs = None
+    if os.path.exists(CA_CERT_PATH):
+        with open(CA_CERT_PATH, "rb") as f:
+            root_certs = f.read()
+    return grpc.ssl_channel_credentials(root_certificates=root_certs)
+
+
+class PooledChannel:
+    """gRPC канал пула и число активных стримов на нём."""
+
+    def __init__(self, index: int, channel: grpc.aio.Channel):
+        self.index = index
+        self.channel = channel
+        self.active_streams = 0
+        self.retired = False
+
+
+class ChannelLease:
+    """Занятый слот стрима на канале пула. Освобождается через ChannelPool.release."""
+
+    def __init__(self, pooled: PooledChannel):
+        self.pooled = pooled
+        self.released = False
+
+    @property
+    def channel(self) -> grpc.aio.Channel:
+        return self.pooled.channel
+
+
+class ChannelPool:
+    """Процессный пул HTTP/2 каналов к SaluteSpeech.
+
+    Стримы распределяются на наименее загруженный канал. Когда загрузка
+    всех каналов приближается к лимиту конкурентных стримов сервера,
+    открывается дополнительный канал (до max_channels). Упавшие каналы
+    пересоздаются при следующем выборе, старые закрываются после
+    завершения своих стримов.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_streams_per_channel: int = 100,
+        max_channels: int = 16,
+        high_water: float = 0.8,
+        ready_timeout: float = 5.0,
+        target: str = SALUTE_SPEECH_HOST,
+        insecure: bool = False,
+    ):
+        self._size = max(1, size)
+        self._max_streams = max(1, max_streams_per_channel)
+        self._max_channels = max(self._size, max_channels)
+        self._high_water_streams = max(1, int(self._max_streams * high_water))
+        self._ready_timeout = ready_timeout
+        self._target = target
+        # Без TLS — только для локальной заглушки SaluteSpeech (нагрузочные тесты)
+        self._insecure = insecure
+        self._credentials = None
+        self._channels: list[PooledChannel] = []
+        self._retired: list[PooledChannel] = []
+        self._next_index = 0
+        self._closing_tasks: set[asyncio.Task] = set()
+        self._warming_tasks: set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def channels(self) -> list[PooledChannel]:
+        return list(self._channels)
+
+    def _create_channel(self) -> PooledChannel:
+        if self._insecure:
+            channel = grpc.aio.insecure_channel(self._target, options=CHANNEL_OPTIONS)
+        else:
+            if self._credentials is None:
+                self._credentials = get_ssl_credentials()
+            channel = grpc.aio.secure_channel(self._target, self._credentials, options=CHANNEL_OPTIONS)
+        pooled = PooledChannel(self._next_index, channel)
+        self._next_index += 1
+        logger.debug(f"gRPC канал #{pooled.index} создан")
+        return pooled
+
+    async def _warm(self, pooled: PooledChannel) -> None:
+        try:
+            await asyncio.wait_for(pooled.channel.channel_ready(), timeout=self._ready_timeout)
+            logger.debug(f"gRPC канал #{pooled.index} готов")
+        except asyncio.TimeoutError:
+            logger.warning(f"gRPC канал #{pooled.index} не подключился за {self._ready_timeout}s")
+        except Exception as e:
+            logger.warning(f"gRPC канал #{pooled.index} ошибка прогрева: {e}")
+
+    async def start(self) -> None:
+        """Открывает каналы и прогревает их (TLS + HTTP/2) до первого запроса."""
+        self._channels = [self._create_channel() for _ in range(self._size)]
+        await asyncio.gather(*(self._warm(pooled) for pooled in self._channels))
+        logger.info(f"gRPC пул: {len(self._channels)} каналов к {self._target}")
+
+    def _is_broken(self, pooled: PooledChannel) -> bool:
+        try:
+            return pooled.channel.get_state(try_to_connect=False) in _BROKEN_STATES
+        except Exception:
+            return True
+
+    def _retire(self, pooled: PooledChannel) -> None:
+        """Выводит канал из ротации; закрывает его, когда стримов на нём не осталось."""
+        if pooled.retired:
+            return
+        pooled.retired = True
+        if pooled in self._channels:
+            self._channels.remove(pooled)
+        if pooled.active_streams == 0:
+            self._schedule_close(pooled)
+        else:
+            self._retired.append(pooled)
+
+    def _add_channel(self) -> PooledChannel:
+        """Добавляет канал в ротацию и прогревает его в фоне (без ожидания в запросе)."""
+        pooled = self._create_channel()
+        self._channels.append(pooled)
+        task = asyncio.create_task(self._warm(pooled))
+        self._warming_tasks.add(task)
+        task.add_done_callback(self._warming_tasks.discard)
+        return pooled
+
+    def _schedule_close(self, pooled: PooledChannel) -> None:
+        task = asyncio.create_task(pooled.channel.close())
+        self._closing_tasks.add(task)
+        task.add_done_callback(self._closing_tasks.discard)
+
+    def _replace_broken(self) -> None:
+        for pooled in list(self._channels):
+            if self._is_broken(pooled):
+                logger.warning(f"gRPC канал #{pooled.index} в состоянии ошибки, пересоздаём")
+                self._retire(pooled)
+        while len(self._channels) < self._size:
+            self._add_channel()
+
+    def _pick(self, exclude: grpc.aio.Channel | None = None) -> PooledChannel:
+        self._replace_broken()
+
+        candidates = [p for p in self._channels if p.channel is not exclude] or self._channels
+        pooled = min(candidates, key=lambda p: p.active_streams)
+
+        # Все каналы близки к лимиту стримов сервера — шардируем на новый канал
+        if pooled.active_streams >= self._high_water_streams and len(self._channels) < self._max_channels:
+            pooled = self._add_channel()
+            logger.info(f"gRPC пул расширен до {len(self._channels)} каналов")
+        elif pooled.active_streams >= self._max_streams:
+            logger.warning(f"gRPC пул: все {len(self._channels)} каналов на лимите стримов")
+        return pooled
+
+    def acquire(self, exclude: grpc.aio.Channel | None = None) -> ChannelLease:
+        """Занимает слот стрима на наименее загруженном канале."""
+        if self._closed:
+            raise RuntimeError("gRPC channel pool is closed")
+        pooled = self._pick(exclude)
+        pooled.active_streams += 1
+        return ChannelLease(pooled)
+
+    def release(self, lease: ChannelLease) -> None:
+        """Освобождает слот стрима."""
+        if lease.released:
+            return
+        lease.released = True
+        pooled = lease.pooled
+        pooled.active_streams -= 1
+        if pooled.retired and pooled.active_streams == 0 and not self._closed:
+            self._retired.remove(pooled)
+            self._schedule_close(pooled)
+
+    def report_failure(self, channel: grpc.aio.Channel) -> None:
+        """Помечает канал как сломанный (например после UNAVAILABLE), чтобы он был пересоздан."""
+        for pooled in self._channels:
+            if pooled.channel is channel:
+                logger.warning(f"gRPC канал #{pooled.index} помечен как сломанный")
+                self._retire(pooled)
+                break
+
+    @asynccontextmanager
+    async def stream(self, exclude: grpc.aio.Channel | None = None):
+        """Контекст одного gRPC стрима: `async with pool.stream() as channel: ...`."""
+        lease = self.acquire(exclude)
+        try:
+            yield lease.channel
+        finally:
+            self.release(lease)
+
+    async def close(self) -> None:
+        """Закрывает все каналы пула."""
+        self._closed = True
+        channels = self._channels + self._retired
+        self._channels = []
+        self._retired = []
+        for task in self._warming_tasks:
+            task.cancel()
+        await asyncio.gather(
+            *(pooled.channel.close() for pooled in channels),
+            *self._closing_tasks,
+            *self._warming_tasks,
+            return_exceptions=True,
+        )
+        logger.info("gRPC пул закрыт")
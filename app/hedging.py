@@ -0,0 +1,162 @@
+"""Хеджирование вызовов синтеза: второй запрос, если первый chunk задерживается.
+
+Небольшая доля вызовов Synthesize отвечает первым аудио намного дольше
+остальных, и именно этот хвост звонящий слышит как «зависание» бота.
+Если первый chunk не пришёл за дедлайн (перцентиль недавних задержек
+первого chunk), такой же запрос уходит на другой канал пула; побеждает
+вызов, первым отдавший аудио, проигравший отменяется.
+
+Доля хеджей ограничена бюджетом (token bucket): каждый вызов пополняет
+его на budget, каждый хедж расходует единицу, так что при деградации
+SaluteSpeech хеджи не удваивают нагрузку на него. Хедж — такой же
+одновременный вызов, поэтому при контроле допуска он занимает свой слот
+governor; если свободного слота нет, хедж не отправляется.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable
+
+import grpc
+
+from app import admission, metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Попытка синтеза: exclude — канал, который не брать; on_channel получает занятый канал
+Attempt = Callable[[grpc.aio.Channel | None, Callable[[grpc.aio.Channel], None] | None], AsyncIterator[bytes]]
+
+
+class HedgePolicy:
+    """Дедлайн хеджа по перцентилю задержки первого chunk и бюджет хеджей."""
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        budget: float = 0.05,
+        min_delay: float = 0.2,
+        initial_delay: float = 1.5,
+        window: int = 500,
+        min_samples: int = 20,
+        max_tokens: float = 10.0,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+        self._delay: float | None = None
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def delay(self) -> float:
+        """Сколько ждать первый chunk до хеджа, сек."""
+        if len(self._samples) < self.min_samples:
+            return self.initial_delay
+        if self._delay is None:
+            ordered = sorted(self._samples)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+            self._delay = max(self.min_delay, ordered[index])
+        return self._delay
+
+    def observe(self, first_chunk_seconds: float) -> None:
+        self._samples.append(first_chunk_seconds)
+        self._delay = None
+
+    def on_request(self) -> None:
+        self._tokens = min(self._max_tokens, self._tokens + self.budget)
+
+    def try_hedge(self) -> bool:
+        """Расходует единицу бюджета; False — бюджет исчерпан."""
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+async def _discard(task: asyncio.Task, stream: AsyncIterator[bytes]) -> None:
+    """Отменяет проигравший вызов: его finally отменяет gRPC и освобождает канал."""
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await stream.aclose()
+
+
+async def hedged_stream(
+    attempt: Attempt,
+    policy: HedgePolicy,
+    endpoint: str,
+    governor: admission.Governor | None = None,
+) -> AsyncIterator[bytes]:
+    """Аудио вызова attempt с хеджем по policy; chunks победителя отдаются по мере прихода.
+
+    Слот основного вызова занимает вызывающий; хедж берёт у governor
+    дополнительный слот без ожидания и отдаёт его, когда его вызов закрыт.
+    """
+    policy.on_request()
+    started = time.perf_counter()
+    primary_channels: list[grpc.aio.Channel] = []
+    primary = attempt(None, primary_channels.append)
+    streams = {asyncio.ensure_future(anext(primary)): primary}
+    winner = first = hedge = None
+    error: BaseException | None = None
+
+    def release_hedge(stream: AsyncIterator[bytes]) -> None:
+        nonlocal hedge
+        if stream is hedge and governor is not None:
+            hedge = None
+            governor.release()
+
+    try:
+        done, _ = await asyncio.wait(streams, timeout=policy.delay())
+        if not done:
+            if governor is not None and not governor.try_acquire():
+                metrics.TTS_HEDGES_THROTTLED.labels(endpoint).inc()
+                logger.info(f"TTS hedge ({endpoint}): нет свободного слота SaluteSpeech, ждём основной вызов")
+            elif policy.try_hedge():
+                exclude = primary_channels[0] if primary_channels else None
+                hedge = attempt(exclude, None)
+                streams[asyncio.ensure_future(anext(hedge))] = hedge
+                metrics.TTS_HEDGES_FIRED.labels(endpoint).inc()
+                tracing.mark("hedge")
+                logger.info(f"TTS hedge ({endpoint}): нет аудио за {policy.delay() * 1000:.0f}ms, второй вызов")
+            else:
+                if governor is not None:
+                    governor.release()
+                metrics.TTS_HEDGES_THROTTLED.labels(endpoint).inc()
+
+        while streams and winner is None:
+            done, _ = await asyncio.wait(streams, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stream = streams.pop(task)
+                exception = task.exception()
+                if exception is None or isinstance(exception, StopAsyncIteration):
+                    if winner is None:
+                        winner = stream
+                        first = None if exception else task.result()
+                        continue
+                elif error is None or stream is primary:
+                    error = exception
+                await stream.aclose()
+                release_hedge(stream)
+    finally:
+        # Проигравший вызов (или все вызовы, если запрос отменён) отменяется
+        for task, stream in streams.items():
+            await _discard(task, stream)
+            release_hedge(stream)
+    if winner is None:
+        raise error
+
+    policy.observe(time.perf_counter() - started)
+    if winner is not primary:
+        metrics.TTS_HEDGES_WON.labels(endpoint).inc()
+    try:
+        if first is None:
+            return
+        yield first
+        async for chunk in winner:
+            yield chunk
+    finally:
+        await winner.aclose()
+        release_hedge(winner)
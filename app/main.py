@@ -5,13 +5,19 @@ import os
 os.environ.setdefault("GRPC_DNS_RESOLVER", "native")
 
 import logging
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from dotenv import load_dotenv
 
-from app.auth import SberAuth
-from app import stt, tts, tts_stream
+from app.audio_queue import OVERFLOW_POLICIES
+from app.auth import SBER_OAUTH_URL, SberAuth
+from app.token_store import FileTokenStore, KeyValueTokenStore, TokenStore
+from app.channels import SALUTE_SPEECH_HOST, ChannelPool
+from app.admission import Governor
+from app.hedging import HedgePolicy
+from app.tts_cache import TTSCache
+from app import metrics, stt, tts, tts_stream, presynth, tracing
 
 load_dotenv()
 
@@ -23,8 +29,27 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-@asynccontextmanager
-async def lifespan(fastapi_app: FastAPI):
+def build_token_store() -> TokenStore | None:
+    """Общее хранилище OAuth токена: файл для воркеров одного хоста или Redis для кластера."""
+    redis_url = os.getenv("SBER_TOKEN_REDIS_URL")
+    if redis_url:
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("SBER_TOKEN_REDIS_URL requires the redis package: pip install redis")
+        return KeyValueTokenStore(redis.asyncio.from_url(redis_url))
+    token_file = os.getenv("SBER_TOKEN_FILE")
+    if token_file:
+        return FileTokenStore(token_file)
+    return None
+
+
+async def init_services(stack: AsyncExitStack) -> None:
+    """Создаёт общие сервисы процесса и раздаёт их модулям endpoints.
+
+    Завершение сервисов регистрируется в stack. Используется lifespan
+    приложения и CLI предсинтеза.
+    """
     client_id = os.getenv("SBER_CLIENT_ID")
     client_secret = os.getenv("SBER_CLIENT_SECRET")
     scope = os.getenv("SBER_SCOPE", "SALUTE_SPEECH_PERS")
@@ -32,15 +57,129 @@ async def lifespan(fastapi_app: FastAPI):
     if not client_id or not client_secret:
         raise RuntimeError("SBER_CLIENT_ID and SBER_CLIENT_SECRET environment variables are required")
 
-    sber_auth = SberAuth(client_id=client_id, client_secret=client_secret, scope=scope)
+    sber_auth = SberAuth(
+        client_id=client_id,
+        client_secret=client_secret,
+        scope=scope,
+        store=build_token_store(),
+        oauth_url=os.getenv("SBER_OAUTH_URL", SBER_OAUTH_URL),
+    )
+    await sber_auth.start()
+    stack.push_async_callback(sber_auth.close)
+
+    trace_exporter = os.getenv("TRACE_EXPORTER", "json")
+    if trace_exporter not in tracing.EXPORTERS:
+        raise RuntimeError(f"TRACE_EXPORTER must be one of {', '.join(tracing.EXPORTERS)}")
+    exporter = tracing.configure(
+        rate=float(os.getenv("TRACE_SAMPLE_RATE", "0")),
+        exporter=trace_exporter,
+        otlp_endpoint=os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),
+    )
+    if exporter is not None:
+        stack.push_async_callback(exporter.close)
+
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Gauge завершившегося воркера не должны учитываться в livesum
+        stack.callback(metrics.multiprocess.mark_process_dead, os.getpid())
 
     stt.sber_auth = sber_auth
     tts.sber_auth = sber_auth
     tts_stream.sber_auth = sber_auth
 
-    logger.info("sber-speech-adapter (v2) запущен")
+    channel_pool = ChannelPool(
+        size=int(os.getenv("SBER_GRPC_CHANNELS", "2")),
+        max_streams_per_channel=int(os.getenv("SBER_GRPC_MAX_STREAMS", "100")),
+        max_channels=int(os.getenv("SBER_GRPC_MAX_CHANNELS", "16")),
+        target=os.getenv("SBER_GRPC_TARGET", SALUTE_SPEECH_HOST),
+        insecure=os.getenv("SBER_GRPC_INSECURE", "false").lower() in ("1", "true", "yes"),
+    )
+    await channel_pool.start()
+    stack.push_async_callback(channel_pool.close)
+
+    stt.channel_pool = channel_pool
+    tts.channel_pool = channel_pool
+    tts_stream.channel_pool = channel_pool
+
+    stt.upstream_encoding = os.getenv("STT_UPSTREAM_ENCODING", "pcm")
+    if stt.upstream_encoding not in stt.UPSTREAM_ENCODINGS:
+        raise RuntimeError(f"STT_UPSTREAM_ENCODING must be one of {', '.join(stt.UPSTREAM_ENCODINGS)}")
+    stt.coalesce_ms = int(os.getenv("STT_COALESCE_MS", "0"))
+    if os.getenv("STT_COALESCE_FLUSH_MS"):
+        stt.coalesce_flush_ms = int(os.getenv("STT_COALESCE_FLUSH_MS"))
+    stt.queue_max_ms = int(os.getenv("STT_QUEUE_MAX_MS", "10000"))
+    stt.queue_overflow = os.getenv("STT_QUEUE_OVERFLOW", "drop_oldest")
+    if stt.queue_overflow not in OVERFLOW_POLICIES:
+        raise RuntimeError(f"STT_QUEUE_OVERFLOW must be one of {', '.join(OVERFLOW_POLICIES)}")
+    stt.vad_enabled = os.getenv("STT_VAD", "false").lower() in ("1", "true", "yes")
+    stt.vad_threshold_db = float(os.getenv("STT_VAD_THRESHOLD_DB", "-45"))
+    stt.vad_hangover_ms = int(os.getenv("STT_VAD_HANGOVER_MS", "300"))
+    stt.vad_preroll_ms = int(os.getenv("STT_VAD_PREROLL_MS", "200"))
+    stt.vad_keepalive_ms = int(os.getenv("STT_VAD_KEEPALIVE_MS", "0"))
+    stt.reconnect_retries = int(os.getenv("STT_RECONNECT_RETRIES", "3"))
+    stt.replay_max_ms = int(os.getenv("STT_REPLAY_MAX_MS", "30000"))
+
+    tts.http_streaming = os.getenv("TTS_HTTP_STREAMING", "false").lower() in ("1", "true", "yes")
+    tts.parallel_min_chars = int(os.getenv("TTS_PARALLEL_MIN_CHARS", "0"))
+    tts.parallel_concurrency = int(os.getenv("TTS_PARALLEL_CONCURRENCY", "4"))
+
+    admission_settings = dict(
+        max_queue=int(os.getenv("ADMISSION_QUEUE_SIZE", "20")),
+        max_wait=int(os.getenv("ADMISSION_MAX_WAIT_MS", "500")) / 1000,
+    )
+    stt_limit = int(os.getenv("STT_MAX_CONCURRENT", "0"))
+    if stt_limit > 0:
+        stt.governor = Governor("stt", stt_limit, **admission_settings)
+    tts_limit = int(os.getenv("TTS_MAX_CONCURRENT", "0"))
+    if tts_limit > 0:
+        tts_governor = Governor("tts", tts_limit, **admission_settings)
+        tts.governor = tts_governor
+        tts_stream.governor = tts_governor
+
+    if os.getenv("TTS_HEDGE", "false").lower() in ("1", "true", "yes"):
+        # Политики раздельные: задержки /tts (весь текст) и сегментов /tts-stream различаются
+        hedge_settings = dict(
+            percentile=float(os.getenv("TTS_HEDGE_PERCENTILE", "95")),
+            budget=float(os.getenv("TTS_HEDGE_BUDGET", "0.05")),
+            min_delay=int(os.getenv("TTS_HEDGE_MIN_MS", "200")) / 1000,
+            initial_delay=int(os.getenv("TTS_HEDGE_INITIAL_MS", "1500")) / 1000,
+        )
+        tts.hedge_policy = HedgePolicy(**hedge_settings)
+        tts_stream.hedge_policy = HedgePolicy(**hedge_settings)
+
+    cache_memory_mb = int(os.getenv("TTS_CACHE_MEMORY_MB", "64"))
+    cache_dir = os.getenv("TTS_CACHE_DIR") or None
+    if cache_memory_mb > 0 or cache_dir:
+        tts_cache = TTSCache(
+            memory_max_bytes=cache_memory_mb * 1024 * 1024,
+            disk_dir=cache_dir,
+            disk_max_bytes=int(os.getenv("TTS_CACHE_DISK_MB", "1024")) * 1024 * 1024,
+            ttl_seconds=float(os.getenv("TTS_CACHE_TTL_SEC", "86400")),
+            disk_rescan_seconds=float(os.getenv("TTS_CACHE_DISK_RESCAN_SEC", "60")),
+        )
+        tts.tts_cache = tts_cache
+        tts_stream.tts_cache = tts_cache
+
+    tts_stream.default_mode = os.getenv("TTS_STREAM_MODE", "pipeline")
+    tts_stream.default_aggregate = os.getenv("TTS_STREAM_AGGREGATE", "false").lower() in ("1", "true", "yes")
+    for name in tts_stream.aggregator_defaults:
+        value = os.getenv(f"TTS_STREAM_{name.upper()}")
+        if value:
+            tts_stream.aggregator_defaults[name] = int(value)
+    tts_stream.output_sample_rate = int(os.getenv("TTS_STREAM_SAMPLE_RATE", "8000"))
+    tts_stream.output_frame_ms = int(os.getenv("TTS_STREAM_FRAME_MS", "20"))
+    tts_stream.output_lead_ms = int(os.getenv("TTS_STREAM_LEAD_MS", "200"))
+    tts_stream.default_lookahead = int(os.getenv("TTS_STREAM_LOOKAHEAD", "2"))
+    tts_stream.reorder_buffer_bytes = int(os.getenv("TTS_STREAM_BUFFER_KB", "2048")) * 1024
+
 
-    yield
+@asynccontextmanager
+async def lifespan(fastapi_app: FastAPI):
+    async with AsyncExitStack() as stack:
+        await init_services(stack)
+
+        logger.info("sber-speech-adapter (v2) запущен")
+
+        yield
 
     logger.info("sber-speech-adapter остановлен")
 
@@ -55,6 +194,7 @@ fastapi_app = FastAPI(
 fastapi_app.include_router(stt.router)
 fastapi_app.include_router(tts.router)
 fastapi_app.include_router(tts_stream.router)
+fastapi_app.include_router(presynth.router)
 
 
 @fastapi_app.get("/health")
@@ -62,11 +202,16 @@ async def health():
     return {"status": "ok", "service": "sber-speech-adapter", "api_version": "v2"}
 
 
+@fastapi_app.get("/metrics")
+async def prometheus_metrics():
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
+
+
 app = fastapi_app
 
 
 if __name__ == "__main__":
-    import uvicorn
+    from app.server import run
 
-    port = int(os.getenv("PORT", "3000"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    run()
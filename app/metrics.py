@@ -0,0 +1,121 @@
+"""Метрики Prometheus, отдаются на /metrics.
+
+Метрики с метками объявляются здесь один раз; на горячих путях (кадры,
+chunks аудио) используются заранее привязанные дочерние метрики, чтобы
+inc/observe не искали метки на каждый chunk. С WORKERS > 1 воркеры пишут
+метрики в PROMETHEUS_MULTIPROC_DIR, /metrics собирает их со всех процессов.
+"""
+import os
+
+import grpc
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Задержки от миллисекунд (кэш, первый chunk) до десятков секунд (синтез длинного текста)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STT_SESSION_SETUP = Histogram(
+    "stt_session_setup_seconds",
+    "STT: от start message до открытия Recognize",
+    buckets=LATENCY_BUCKETS,
+)
+STT_FIRST_PARTIAL = Histogram(
+    "stt_first_partial_seconds",
+    "STT: от start message до первого результата распознавания",
+    buckets=LATENCY_BUCKETS,
+)
+STT_FIRST_FINAL = Histogram(
+    "stt_first_final_seconds",
+    "STT: от start message до первого финального результата",
+    buckets=LATENCY_BUCKETS,
+)
+TTS_FIRST_AUDIO = Histogram(
+    "tts_first_audio_seconds",
+    "TTS: от запроса (сегмента для /tts-stream) до первого chunk аудио",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+TTS_SYNTHESIS = Histogram(
+    "tts_synthesis_seconds",
+    "TTS: полное время синтеза запроса (сегмента для /tts-stream)",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+OAUTH_REFRESH = Histogram(
+    "oauth_refresh_seconds",
+    "Получение OAuth токена, включая повторы",
+    buckets=LATENCY_BUCKETS,
+)
+OAUTH_REFRESH_FAILURES = Counter("oauth_refresh_failures_total", "Неудачные обновления OAuth токена")
+GRPC_ERRORS = Counter("grpc_errors_total", "Ошибки gRPC вызовов SaluteSpeech", ["endpoint", "code"])
+QUEUE_DEPTH = Gauge(
+    "queue_depth",
+    "Элементов в очередях активных сессий",
+    ["queue"],
+    multiprocess_mode="livesum",
+)
+AUDIO_BYTES = Counter(
+    "audio_bytes_total",
+    "Аудио через адаптер: in — от jambonz (STT) или SaluteSpeech (TTS), out — дальше по цепочке",
+    ["endpoint", "direction"],
+)
+STT_RECONNECTS = Counter("stt_reconnects_total", "STT: Recognize переоткрыт после обрыва с повтором аудио")
+ADMISSION_LIMIT = Gauge(
+    "admission_limit",
+    "Текущий (адаптивный) лимит одновременных вызовов SaluteSpeech",
+    ["kind"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_ACTIVE = Gauge(
+    "admission_active",
+    "Вызовы SaluteSpeech, допущенные контролем допуска",
+    ["kind"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Вызовы, отклонённые контролем допуска: queue_full, timeout или preempted (вытеснен живым звонком)",
+    ["kind", "reason"],
+)
+TTS_HEDGES_FIRED = Counter("tts_hedges_fired_total", "TTS: вторые (хедж) вызовы синтеза", ["endpoint"])
+TTS_HEDGES_WON = Counter("tts_hedges_won_total", "TTS: хедж отдал аудио раньше первого вызова", ["endpoint"])
+TTS_HEDGES_THROTTLED = Counter(
+    "tts_hedges_throttled_total",
+    "TTS: дедлайн хеджа истёк, но бюджет хеджей исчерпан",
+    ["endpoint"],
+)
+
+STT_QUEUE_DEPTH = QUEUE_DEPTH.labels("stt_request_queue")
+TTS_STREAM_QUEUE_DEPTH = QUEUE_DEPTH.labels("tts_synth_queue")
+
+STT_BYTES_IN = AUDIO_BYTES.labels("stt", "in")
+STT_BYTES_OUT = AUDIO_BYTES.labels("stt", "out")
+TTS_BYTES_IN = AUDIO_BYTES.labels("tts", "in")
+TTS_BYTES_OUT = AUDIO_BYTES.labels("tts", "out")
+TTS_STREAM_BYTES_IN = AUDIO_BYTES.labels("tts_stream", "in")
+TTS_STREAM_BYTES_OUT = AUDIO_BYTES.labels("tts_stream", "out")
+
+TTS_FIRST_AUDIO_HTTP = TTS_FIRST_AUDIO.labels("tts")
+TTS_SYNTHESIS_HTTP = TTS_SYNTHESIS.labels("tts")
+TTS_FIRST_AUDIO_STREAM = TTS_FIRST_AUDIO.labels("tts_stream")
+TTS_SYNTHESIS_STREAM = TTS_SYNTHESIS.labels("tts_stream")
+
+
+def count_grpc_error(endpoint: str, error: grpc.aio.AioRpcError) -> None:
+    GRPC_ERRORS.labels(endpoint, error.code().name).inc()
+
+
+def render() -> tuple[bytes, str]:
+    """Текст метрик и его content type."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,251 @@
+"""Пакетный предсинтез промптов для прогрева TTS кэша.
+
+Манифест — JSON (список или {"prompts": [...]}) или JSONL, элемент:
+{"text": "..."} или {"ssml": "..."}, опционально "voice" и "language".
+
+Запуск из CLI (с дисковым кэшем TTS_CACHE_DIR, общим с адаптером):
+    python -m app.presynth prompts.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import AsyncExitStack
+from typing import Any
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from pydantic import BaseModel, ValidationError
+
+from app import admission, tts
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 64
+MAX_JOBS = 100
+MAX_REPORTED_ERRORS = 50
+# Upstream занят живыми звонками: промпт ждёт и пробует снова
+ADMISSION_RETRY_DELAY = 1.0
+MAX_ADMISSION_RETRIES = 60
+
+
+class Prompt(BaseModel):
+    """Промпт манифеста."""
+    text: str | None = None
+    ssml: str | None = None
+    voice: str = "Nec_24000"
+    language: str = "ru-RU"
+
+    @property
+    def content(self) -> str:
+        return self.ssml if self.ssml is not None else self.text
+
+    @property
+    def content_type(self) -> str:
+        return "ssml" if self.ssml is not None else "text"
+
+
+def parse_manifest(content: str) -> list[Prompt]:
+    """Парсит манифест JSON или JSONL в список промптов."""
+    content = content.strip()
+    if not content:
+        return []
+
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        # JSONL: по объекту на строку
+        data = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    if isinstance(data, dict):
+        data = data.get("prompts", [data])
+    if not isinstance(data, list):
+        raise ValueError("Manifest must be a list of prompts")
+
+    prompts = []
+    for i, item in enumerate(data):
+        try:
+            prompt = Prompt(**item)
+        except (TypeError, ValidationError) as e:
+            raise ValueError(f"Invalid prompt #{i}: {e}")
+        if not prompt.content or not prompt.content.strip():
+            raise ValueError(f"Invalid prompt #{i}: text or ssml is required")
+        prompts.append(prompt)
+    return prompts
+
+
+class PresynthJob:
+    """Состояние задачи предсинтеза: прогресс, ошибки, объём аудио."""
+
+    def __init__(self, total: int, concurrency: int):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.concurrency = concurrency
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.errors: list[dict[str, Any]] = []
+        self.status = "pending"
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "concurrency": self.concurrency,
+            "elapsed_sec": elapsed,
+            "errors": self.errors,
+        }
+
+
+jobs: dict[str, PresynthJob] = {}
+
+
+async def run_presynthesis(prompts: list[Prompt], job: PresynthJob) -> PresynthJob:
+    """Синтезирует промпты через общий путь TTS (с кэшем), не более job.concurrency одновременно."""
+    semaphore = asyncio.Semaphore(job.concurrency)
+    job.status = "running"
+    job.started_at = time.time()
+
+    async def _one(index: int, prompt: Prompt) -> None:
+        async with semaphore:
+            try:
+                for attempt in range(MAX_ADMISSION_RETRIES + 1):
+                    try:
+                        audio = await tts.get_or_synthesize(
+                            text=prompt.content,
+                            voice=prompt.voice.split(";")[0],
+                            language=prompt.language,
+                            content_type=prompt.content_type,
+                            priority=admission.BATCH,
+                        )
+                        break
+                    except admission.AdmissionRejected:
+                        if attempt == MAX_ADMISSION_RETRIES:
+                            raise
+                        await asyncio.sleep(ADMISSION_RETRY_DELAY)
+                job.completed += 1
+                job.bytes += len(audio)
+            except Exception as e:
+                job.failed += 1
+                logger.warning(f"Предсинтез: промпт #{index} ошибка: {e}")
+                if len(job.errors) < MAX_REPORTED_ERRORS:
+                    job.errors.append({"index": index, "error": str(e)})
+
+    await asyncio.gather(*(_one(i, p) for i, p in enumerate(prompts)))
+
+    job.status = "done"
+    job.finished_at = time.time()
+    logger.info(
+        f"Предсинтез {job.id}: {job.completed}/{job.total} готово, "
+        f"{job.failed} ошибок, {job.bytes} bytes"
+    )
+    return job
+
+
+def _register_job(job: PresynthJob) -> None:
+    jobs[job.id] = job
+    # Храним только последние задачи
+    while len(jobs) > MAX_JOBS:
+        jobs.pop(next(iter(jobs)))
+
+
+def _check_admin(request: Request) -> None:
+    # Admin endpoints требуют "Authorization: Bearer <ADMIN_TOKEN>";
+    # без ADMIN_TOKEN они выключены (запуск синтеза тратит квоту Sber)
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail={"error": "Admin API disabled: ADMIN_TOKEN is not set"})
+    # Сравнение за постоянное время: по задержке ответа токен не подобрать
+    expected = f"Bearer {admin_token}".encode()
+    if not hmac.compare_digest(request.headers.get("authorization", "").encode(), expected):
+        raise HTTPException(status_code=401, detail={"error": "Unauthorized"})
+
+
+@router.post("/admin/presynth", status_code=202)
+async def presynth_endpoint(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> dict[str, Any]:
+    """Запускает предсинтез манифеста (JSON/JSONL в теле запроса) в фоне."""
+    _check_admin(request)
+
+    try:
+        prompts = parse_manifest((await request.body()).decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail={"error": str(e)})
+
+    job = PresynthJob(total=len(prompts), concurrency=max(1, min(concurrency, MAX_CONCURRENCY)))
+    _register_job(job)
+    background_tasks.add_task(run_presynthesis, prompts, job)
+
+    logger.info(f"Предсинтез {job.id}: {job.total} промптов, concurrency={job.concurrency}")
+    return job.to_dict()
+
+
+@router.get("/admin/presynth/{job_id}")
+async def presynth_status_endpoint(job_id: str, request: Request) -> dict[str, Any]:
+    """Прогресс задачи предсинтеза."""
+    _check_admin(request)
+
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": "Job not found"})
+    return job.to_dict()
+
+
+async def _report_progress(job: PresynthJob, interval: float = 2.0) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(f"Предсинтез: {job.completed + job.failed}/{job.total}, {job.bytes} bytes")
+
+
+async def _main(manifest_path: str, concurrency: int) -> int:
+    from app.main import init_services
+
+    with open(manifest_path, encoding="utf-8") as f:
+        prompts = parse_manifest(f.read())
+
+    if not os.getenv("TTS_CACHE_DIR"):
+        logger.warning("TTS_CACHE_DIR не задан: результат останется только в памяти этого процесса")
+
+    job = PresynthJob(total=len(prompts), concurrency=max(1, min(concurrency, MAX_CONCURRENCY)))
+
+    async with AsyncExitStack() as stack:
+        await init_services(stack)
+        progress_task = asyncio.create_task(_report_progress(job))
+        try:
+            await run_presynthesis(prompts, job)
+        finally:
+            progress_task.cancel()
+
+    print(json.dumps(job.to_dict(), ensure_ascii=False, indent=2))
+    return 1 if job.failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Предсинтез промптов в TTS кэш")
+    parser.add_argument("manifest", help="Путь к манифесту JSON/JSONL")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.manifest, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
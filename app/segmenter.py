@@ -0,0 +1,175 @@
+"""Сегментация текста для синтеза.
+
+TextAggregator собирает поток мелких фрагментов (токены LLM) в
+сегменты по границам предложений/клауз, чтобы каждый gRPC вызов
+получал фразу целиком: меньше вызовов и ровнее интонация.
+split_text/split_ssml режут готовый текст теми же правилами для
+параллельного синтеза длинных /tts запросов.
+"""
+import asyncio
+import re
+from typing import Callable
+
+# Конец предложения: .!?… (и закрывающие кавычки/скобки), за которыми идёт пробел
+SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'»)\]]*(?=\s)")
+# Конец клаузы: , ; : или тире между пробелами
+CLAUSE_END_RE = re.compile(r"[,;:]+(?=\s)|\s[—–-](?=\s)")
+# Корневой элемент SSML и теги внутри него
+SSML_SPEAK_RE = re.compile(r"^\s*<speak(\s[^>]*)?>(.*)</speak>\s*$", re.DOTALL)
+SSML_TAG_RE = re.compile(r"<[^>]*>")
+
+
+class TextAggregator:
+    """Копит текст до границы предложения/клаузы, лимита длины или паузы.
+
+    - граница предложения — если накоплено не меньше min_chars;
+    - граница клаузы — если накоплено не меньше clause_chars;
+    - без границ — режем по пробелу при max_chars;
+    - нет нового текста idle_timeout секунд — отдаём всё накопленное.
+    """
+
+    def __init__(
+        self,
+        on_segment: Callable[[str], None],
+        min_chars: int = 20,
+        clause_chars: int = 80,
+        max_chars: int = 250,
+        idle_timeout: float = 0.5,
+    ):
+        self._on_segment = on_segment
+        self.min_chars = max(1, min_chars)
+        self.clause_chars = max(self.min_chars, clause_chars)
+        self.max_chars = max(self.clause_chars, max_chars)
+        self.idle_timeout = idle_timeout
+        self._buffer = ""
+        self._idle_handle: asyncio.TimerHandle | None = None
+
+    @property
+    def pending(self) -> str:
+        return self._buffer
+
+    def feed(self, text: str) -> None:
+        """Добавляет фрагмент; отдаёт готовые сегменты через on_segment."""
+        self._buffer += text
+        while True:
+            cut = self._find_cut(self._buffer)
+            if not cut:
+                break
+            segment, self._buffer = self._buffer[:cut], self._buffer[cut:]
+            self._emit(segment)
+        self._schedule_idle()
+
+    def flush(self) -> None:
+        """Отдаёт всё накопленное (flush от jambonz или пауза)."""
+        self._cancel_idle()
+        segment, self._buffer = self._buffer, ""
+        self._emit(segment)
+
+    def clear(self) -> None:
+        """Сбрасывает накопленное без синтеза (barge-in)."""
+        self._cancel_idle()
+        self._buffer = ""
+
+    def _find_cut(self, text: str) -> int:
+        """Позиция первого разреза в text (0 — резать пока рано).
+
+        Берём первую подходящую границу, а не последнюю: остаток режется
+        следующими итерациями feed, и ни один сегмент не превышает max_chars.
+        """
+        limit = self.max_chars
+        for match in SENTENCE_END_RE.finditer(text):
+            if match.end() > limit:
+                break
+            if len(text[:match.end()].strip()) >= self.min_chars:
+                return match.end()
+
+        if len(text) >= self.clause_chars:
+            for match in CLAUSE_END_RE.finditer(text):
+                if match.end() > limit:
+                    break
+                if len(text[:match.end()].strip()) >= self.clause_chars:
+                    return match.end()
+
+        if len(text) > limit:
+            space = text.rfind(" ", 0, limit + 1)
+            return space if space > 0 else limit
+        return 0
+
+    def _emit(self, segment: str) -> None:
+        segment = segment.strip()
+        if segment:
+            self._on_segment(segment)
+
+    def _schedule_idle(self) -> None:
+        self._cancel_idle()
+        if self._buffer.strip() and self.idle_timeout > 0:
+            self._idle_handle = asyncio.get_running_loop().call_later(self.idle_timeout, self.flush)
+
+    def _cancel_idle(self) -> None:
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+
+def split_text(text: str, min_chars: int = 40, max_chars: int = 250) -> list[str]:
+    """Режет текст на предложения правилами TextAggregator (без ожидания пауз)."""
+    segments: list[str] = []
+    aggregator = TextAggregator(
+        segments.append,
+        min_chars=min_chars,
+        clause_chars=max_chars // 2,
+        max_chars=max_chars,
+        idle_timeout=0,
+    )
+    aggregator.feed(text)
+    aggregator.flush()
+    return segments
+
+
+def split_ssml(ssml: str, min_chars: int = 40) -> list[str]:
+    """Режет SSML на документы <speak> по концам предложений вне вложенных тегов.
+
+    Разрез возможен только на верхнем уровне <speak>: внутри <prosody>,
+    <say-as> и т.п. текст не делится, чтобы разметка каждой части осталась
+    корректной. Атрибуты <speak> переносятся в каждую часть. Некорректный
+    SSML возвращается одним элементом.
+    """
+    match = SSML_SPEAK_RE.match(ssml)
+    if match is None:
+        return [ssml]
+    attributes, body = match.group(1) or "", match.group(2)
+
+    pieces: list[str] = []
+    piece = ""
+    piece_chars = 0
+    depth = 0
+    position = 0
+    for tag in [*SSML_TAG_RE.finditer(body), None]:
+        text = body[position:tag.start() if tag else len(body)]
+        if depth == 0:
+            start = 0
+            for end in SENTENCE_END_RE.finditer(text):
+                piece_chars += len(text[start:end.end()].strip())
+                piece += text[start:end.end()]
+                start = end.end()
+                if piece_chars >= min_chars:
+                    pieces.append(piece)
+                    piece, piece_chars = "", 0
+            text = text[start:]
+        piece += text
+        piece_chars += len(text.strip())
+        if tag is None:
+            break
+        markup = tag.group()
+        if markup.startswith("</"):
+            depth -= 1
+        elif not markup.endswith("/>") and not markup.startswith(("<?", "<!")):
+            depth += 1
+        if depth < 0:
+            return [ssml]
+        piece += markup
+        position = tag.end()
+    if depth != 0:
+        return [ssml]
+    pieces.append(piece)
+    return [f"<speak{attributes}>{p.strip()}</speak>" for p in pieces if p.strip()]
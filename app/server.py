@@ -0,0 +1,54 @@
+"""Запуск адаптера в одном или нескольких процессах.
+
+Один event loop упирается в одно ядро: protobuf, JSON и обработка аудио
+идут в том же потоке, что и WebSocket. WORKERS > 1 запускает pre-fork
+супервизор uvicorn: родитель открывает сокет, воркеры принимают на нём
+соединения. Каждый воркер проходит lifespan и создаёт свои сервисы
+(пул gRPC каналов, кэш, SberAuth); OAuth токен между воркерами общий
+через файл (SBER_TOKEN_FILE), чтобы его обновлял один процесс, а метрики
+собираются через PROMETHEUS_MULTIPROC_DIR.
+
+    WORKERS=4 python -m app.server
+"""
+import logging
+import os
+import tempfile
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+def default_token_file() -> str:
+    """Файл токена воркеров одного сервера, если не задано общее хранилище.
+
+    Каталог создаёт супервизор через mkdtemp (права 0700, случайное имя):
+    в общем /tmp другой пользователь не подложит файл или symlink на
+    предсказуемое имя и не прочитает токен. Воркеры получают путь через окружение.
+    """
+    return os.path.join(tempfile.mkdtemp(prefix="sber-speech-adapter-token-"), "token.json")
+
+
+def run(app: str = "app.main:app", host: str = "0.0.0.0", port: int | None = None, workers: int | None = None) -> None:
+    """Запускает uvicorn; app — import string, его импортирует каждый воркер."""
+    port = port if port is not None else int(os.getenv("PORT", "3000"))
+    workers = workers if workers is not None else int(os.getenv("WORKERS", "1"))
+
+    if workers > 1 and not (os.getenv("SBER_TOKEN_FILE") or os.getenv("SBER_TOKEN_REDIS_URL")):
+        # Воркеры наследуют окружение супервизора
+        os.environ["SBER_TOKEN_FILE"] = default_token_file()
+        logger.info(f"Общий OAuth токен воркеров: {os.environ['SBER_TOKEN_FILE']}")
+    if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Метрики воркеров пишутся в общий каталог, /metrics любого воркера отдаёт сумму
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="sber-speech-adapter-metrics-")
+
+    uvicorn.run(app, host=host, port=port, workers=workers, log_level=os.getenv("LOG_LEVEL", "info").lower())
+
+
+def main() -> None:
+    logging.basicConfig(level=getattr(logging, os.getenv("LOG_LEVEL", "info").upper()))
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 import asyncio
 import logging
 import json
-import os
+import time
 from typing import Any
 
 import grpc
@@ -10,37 +10,134 @@ from google.protobuf.duration_pb2 import Duration
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 from app.generated import recognitionv2_pb2, recognitionv2_pb2_grpc
+from app import admission, metrics, tracing
+from app.audio import alaw_encode, ulaw_encode
+from app.audio_queue import AudioQueue, ReplayBuffer
+from app.vad import VadGate
 from app.auth import SberAuth
+from app.channels import ChannelPool, ChannelLease
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-SALUTE_SPEECH_HOST = "smartspeech.sber.ru:443"
-
-# Путь к сертификатам Минцифры РФ
-CERTS_DIR = os.path.join(os.path.dirname(__file__), "..", "certs")
-CA_CERT_PATH = os.path.join(CERTS_DIR, "russian-trusted-chain.pem")
-
 sber_auth: SberAuth | None = None
+channel_pool: ChannelPool | None = None
+# Лимит одновременных Recognize (STT_MAX_CONCURRENT), None — без лимита
+governor: admission.Governor | None = None
+
+# Склейка кадров jambonz в chunks (STT_COALESCE_MS, 0 — без склейки) и таймер
+# отправки неполного chunk (STT_COALESCE_FLUSH_MS, по умолчанию = STT_COALESCE_MS)
+coalesce_ms: int = 0
+coalesce_flush_ms: int | None = None
+# Лимит аудио в очереди к upstream и политика переполнения (drop_oldest/block/fail)
+queue_max_ms: int = 10000
+queue_overflow: str = "drop_oldest"
+
+# Кодирование аудио к SaluteSpeech (STT_UPSTREAM_ENCODING, в start message — options.upstreamEncoding):
+# pcm — PCM S16LE как от jambonz, mulaw/alaw — G.711, вдвое меньше трафика (только 8 кГц)
+upstream_encoding: str = "pcm"
+UPSTREAM_ENCODINGS = ("pcm", "mulaw", "alaw")
+_G711_ENCODERS = {"mulaw": ulaw_encode, "alaw": alaw_encode}
+_PROTO_ENCODINGS = {"pcm": "PCM_S16LE", "mulaw": "MULAW", "alaw": "ALAW"}
+
+# Каналы в одной сессии (start message — channels или options.channels): jambonz шлёт оба
+# плеча звонка чередующимися отсчётами, SaluteSpeech распознаёт их в одном Recognize
+MAX_CHANNELS = 2
+
+# VAD-гейт: тишина не отправляется в SaluteSpeech (STT_VAD, в start message — options.vad).
+# Порог уровня речи в dBFS, hangover после речи, pre-roll перед ней; keepalive_ms > 0 —
+# вместо тишины кадр нулей на каждые keepalive_ms, чтобы upstream не простаивал
+vad_enabled: bool = False
+vad_threshold_db: float = -45.0
+vad_hangover_ms: int = 300
+vad_preroll_ms: int = 200
+vad_keepalive_ms: int = 0
+
+# Переподключение Recognize при обрыве (STT_RECONNECT_RETRIES, 0 — выключено): аудио после
+# последнего финального результата (не больше STT_REPLAY_MAX_MS) повторяется в новый вызов
+reconnect_retries: int = 3
+replay_max_ms: int = 30000
+reconnect_backoff: float = 0.2
+RECONNECT_CODES = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.INTERNAL,
+    grpc.StatusCode.UNKNOWN,
+    grpc.StatusCode.ABORTED,
+    grpc.StatusCode.UNAUTHENTICATED,
+)
+
+
+# Метаданные звонка из start message (верхний уровень или options), попадающие в trace сессии
+TRACE_METADATA_KEYS = ("callSid", "accountSid", "applicationSid", "tenant", "env")
+
+
+def trace_metadata(msg: dict[str, Any]) -> dict[str, str]:
+    """callSid и метаданные арендатора из start message для trace сессии."""
+    options = msg.get("options") or {}
+    metadata = {}
+    for key in TRACE_METADATA_KEYS:
+        value = msg.get(key, options.get(key))
+        if value is not None:
+            metadata[key] = str(value)
+    return metadata
+
+
+def timeout_seconds(raw: Any, minimum: int) -> int:
+    """Таймаут jambonz в секундах: jambonz может передавать секунды (< 100) или миллисекунды (>= 100).
+
+    SaluteSpeech принимает от minimum до 20 секунд.
+    """
+    seconds = int(raw) if int(raw) < 100 else int(raw) // 1000
+    return max(minimum, min(seconds, 20))
+
 
+def build_vad_gate(options: dict[str, Any]) -> VadGate | None:
+    """VAD-гейт сессии или None, если он выключен.
 
-def get_ssl_credentials():
-    """Создаёт SSL credentials с сертификатами Минцифры РФ."""
-    root_certs = None
-    if os.path.exists(CA_CERT_PATH):
-        with open(CA_CERT_PATH, "rb") as f:
-            root_certs = f.read()
-    return grpc.ssl_channel_credentials(root_certificates=root_certs)
+    При no_speech_timeout SaluteSpeech должен «услышать» тишину, чтобы сработал
+    таймаут, поэтому hangover не короче no_speech_timeout: гейт отбрасывает
+    только тишину сверх него (удержание, долгие паузы).
+    """
+    if not options.get("vad"):
+        return None
+    hangover_ms = vad_hangover_ms
+    if options.get("no_speech_timeout") is not None:
+        hangover_ms = max(hangover_ms, timeout_seconds(options["no_speech_timeout"], 2) * 1000)
+    return VadGate(
+        sample_rate=options["sample_rate"],
+        threshold_db=vad_threshold_db,
+        hangover_ms=hangover_ms,
+        preroll_ms=vad_preroll_ms,
+        keepalive_ms=vad_keepalive_ms,
+        channels=options.get("channels", 1),
+    )
 
 
 def parse_start_message(msg: dict[str, Any]) -> dict[str, Any]:
     """Парсит start message от jambonz в параметры для SaluteSpeech."""
     options = msg.get("options", {})
+    sample_rate = msg.get("sampleRateHz", 8000)
+
+    encoding = options.get("upstreamEncoding", upstream_encoding)
+    if encoding not in UPSTREAM_ENCODINGS:
+        logger.warning(f"STT: неизвестный upstreamEncoding={encoding}, используем pcm")
+        encoding = "pcm"
+    elif encoding != "pcm" and sample_rate != 8000:
+        logger.warning(f"STT: G.711 только для 8 кГц, sample_rate={sample_rate} — используем pcm")
+        encoding = "pcm"
+
+    channels = msg.get("channels", options.get("channels", 1))
+    if not isinstance(channels, int) or not 1 <= channels <= MAX_CHANNELS:
+        logger.warning(f"STT: channels={channels} не поддерживается, используем 1")
+        channels = 1
 
     return {
         "language": msg.get("language", "ru-RU"),
-        "sample_rate": msg.get("sampleRateHz", 8000),
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "upstream_encoding": encoding,
+        "vad": bool(options.get("vad", vad_enabled)),
         "enable_partial_results": msg.get("interimResults", True),
         "hints": options.get("hints", []),
         "no_speech_timeout": options.get("no_speech_timeout"),
@@ -53,8 +150,9 @@ def format_transcription(
     is_final: bool,
     confidence: float = 1.0,
     language: str = "ru-RU",
+    channel: int = 1,
 ) -> dict[str, Any]:
-    """Форматирует результат распознавания в формат jambonz."""
+    """Форматирует результат распознавания в формат jambonz (channel — с единицы)."""
     return {
         "type": "transcription",
         "is_final": is_final,
@@ -65,7 +163,7 @@ def format_transcription(
             }
         ],
         "language": language,
-        "channel": 1,
+        "channel": channel,
     }
 
 
@@ -95,9 +193,12 @@ def build_recognition_options(options: dict[str, Any]) -> recognitionv2_pb2.Reco
     )
 
     kwargs = dict(
-        audio_encoding=recognitionv2_pb2.RecognitionOptions.AudioEncoding.PCM_S16LE,
+        audio_encoding=getattr(
+            recognitionv2_pb2.RecognitionOptions.AudioEncoding,
+            _PROTO_ENCODINGS[options.get("upstream_encoding", "pcm")],
+        ),
         sample_rate=options.get("sample_rate", 8000),
-        channels_count=1,
+        channels_count=options.get("channels", 1),
         language=options.get("language", "ru-RU"),
         hypotheses_count=1,
         enable_partial_results=enable_partial,
@@ -108,17 +209,13 @@ def build_recognition_options(options: dict[str, Any]) -> recognitionv2_pb2.Reco
 
     no_speech = options.get("no_speech_timeout")
     if no_speech is not None:
-        # jambonz может передавать в секундах (< 100) или миллисекундах (>= 100)
-        no_speech_sec = int(no_speech) if int(no_speech) < 100 else int(no_speech) // 1000
-        no_speech_sec = max(2, min(no_speech_sec, 20))  # SaluteSpeech: 2-20 сек
+        no_speech_sec = timeout_seconds(no_speech, 2)
         kwargs["no_speech_timeout"] = Duration(seconds=no_speech_sec)
         logger.info(f"STT no_speech_timeout={no_speech_sec}s (raw={no_speech})")
 
     max_speech = options.get("max_speech_timeout")
     if max_speech is not None:
-        # jambonz может передавать в секундах (< 100) или миллисекундах (>= 100)
-        max_speech_sec = int(max_speech) if int(max_speech) < 100 else int(max_speech) // 1000
-        max_speech_sec = max(1, min(max_speech_sec, 20))  # SaluteSpeech: 0.5-20 сек
+        max_speech_sec = timeout_seconds(max_speech, 1)  # SaluteSpeech: от 0.5 сек
         kwargs["max_speech_timeout"] = Duration(seconds=max_speech_sec)
         logger.info(f"STT max_speech_timeout={max_speech_sec}s (raw={max_speech})")
 
@@ -144,14 +241,19 @@ async def stt_endpoint(websocket: WebSocket):
     logger.info(f"STT WebSocket попытка подключения: client={client}, headers={headers}")
 
     await websocket.accept()
+    span = tracing.start("stt")
     logger.info("STT WebSocket подключен (accepted)")
 
-    grpc_channel = None
+    channel_lease: ChannelLease | None = None
+    response_stream = None
     grpc_task: asyncio.Task | None = None
-    request_queue: asyncio.Queue = asyncio.Queue()
+    request_queue: AudioQueue | None = None
+    vad: VadGate | None = None
+    admitted = False
 
     try:
         token = await sber_auth.get_token()
+        span.mark("token")
 
         start_data = await websocket.receive_text()
         start_msg = json.loads(start_data)
@@ -162,65 +264,208 @@ async def stt_endpoint(websocket: WebSocket):
             return
 
         options = parse_start_message(start_msg)
-        logger.info(f"STT start: language={options['language']}, sample_rate={options['sample_rate']}, partial={options['enable_partial_results']}")
+        # Setup и задержки результатов — от start message: ожидание его — время jambonz, не адаптера
+        started_at = time.perf_counter()
+        span.set(
+            language=options["language"],
+            sample_rate=options["sample_rate"],
+            channels=options["channels"],
+            upstream_encoding=options["upstream_encoding"],
+            **trace_metadata(start_msg),
+        )
+        span.mark("start")
+        logger.info(
+            f"STT start: language={options['language']}, sample_rate={options['sample_rate']}, "
+            f"channels={options['channels']}, "
+            f"partial={options['enable_partial_results']}, upstream={options['upstream_encoding']}, "
+            f"vad={options['vad']}"
+        )
+        vad = build_vad_gate(options)
+
+        # G.711: кодируем PCM до очереди, один байт на отсчёт. Каналы чередуются
+        # по отсчётам и уходят в upstream как есть, с channels_count
+        encode = _G711_ENCODERS.get(options["upstream_encoding"])
+        bytes_per_frame = (1 if encode else 2) * options["channels"]
+        request_queue = AudioQueue(
+            bytes_per_second=options["sample_rate"] * bytes_per_frame,
+            chunk_ms=coalesce_ms,
+            max_latency_ms=coalesce_flush_ms,
+            max_queue_ms=queue_max_ms,
+            overflow=queue_overflow,
+            depth_gauge=metrics.STT_QUEUE_DEPTH,
+        )
         logger.debug(f"STT start_msg: {json.dumps(start_msg, default=str)}")
 
-        credentials = get_ssl_credentials()
-        channel_options = [
-            ("grpc.ssl_target_name_override", "smartspeech.sber.ru"),
-            ("grpc.default_authority", "smartspeech.sber.ru"),
-            ("grpc.dns_resolver", "native"),
-            # Keepalive: детекция мёртвых соединений
-            ("grpc.keepalive_time_ms", 30000),
-            ("grpc.keepalive_timeout_ms", 10000),
-            ("grpc.keepalive_permit_without_calls", 1),
-            ("grpc.http2.max_pings_without_data", 0),
-        ]
-        grpc_channel = grpc.aio.secure_channel(SALUTE_SPEECH_HOST, credentials, options=channel_options)
-        stub = recognitionv2_pb2_grpc.SmartSpeechStub(grpc_channel)
-        metadata = [("authorization", f"Bearer {token}")]
-
-        async def request_generator():
-            yield recognitionv2_pb2.RecognitionRequest(
-                options=build_recognition_options(options)
+        recognition_options = build_recognition_options(options)
+        # Аудио после последнего финального результата — для повтора при переподключении
+        replay = None
+        if reconnect_retries > 0:
+            replay = ReplayBuffer(options["sample_rate"] * bytes_per_frame * replay_max_ms // 1000)
+        # Начало незаконченной фразы каждого канала (позиция его предыдущего eou):
+        # аудио с неё нельзя отбрасывать, пока фраза не распознана
+        utterance_starts: dict[int, int] = {}
+        last_eou: dict[int, int] = {}
+        stream_id = 0
+        upstream_started = False
+
+        def open_recognize(token: str, replayed: list[bytes], exclude: grpc.aio.Channel | None = None) -> None:
+            """Открывает Recognize на канале пула: Options, повтор replayed, затем аудио из очереди."""
+            nonlocal channel_lease, response_stream, stream_id
+            stream_id += 1
+            current_id = stream_id
+            # Стрим на долгоживущем канале из пула (без нового TLS/HTTP2 handshake)
+            channel_lease = channel_pool.acquire(exclude)
+            stub = recognitionv2_pb2_grpc.SmartSpeechStub(channel_lease.channel)
+            metadata = [("authorization", f"Bearer {token}")]
+
+            async def request_generator():
+                nonlocal upstream_started
+                yield recognitionv2_pb2.RecognitionRequest(options=recognition_options)
+                if current_id == 1:
+                    # gRPC запрашивает следующее сообщение, когда записал Options:
+                    # канал подключён и вызов начат
+                    span.mark("channel_ready")
+
+                for chunk in replayed:
+                    yield recognitionv2_pb2.RecognitionRequest(audio_chunk=chunk)
+
+                while True:
+                    chunk = await request_queue.get()
+                    if chunk is None:
+                        break
+                    if current_id != stream_id:
+                        # Вызов уже заменён новым: chunk достаётся ему
+                        request_queue.unget(chunk)
+                        break
+                    if replay is not None:
+                        replay.append(chunk)
+                    if not upstream_started:
+                        upstream_started = True
+                        span.mark("first_upstream_byte")
+                    metrics.STT_BYTES_OUT.inc(len(chunk))
+                    yield recognitionv2_pb2.RecognitionRequest(audio_chunk=chunk)
+
+            response_stream = stub.Recognize(request_generator(), metadata=metadata)
+
+        def audio_position(duration) -> int | None:
+            """processed_audio_end → байт аудио вызова; None, если upstream его не прислал."""
+            seconds = duration.seconds + duration.nanos / 1e9
+            if seconds <= 0:
+                return None
+            return int(seconds * options["sample_rate"]) * bytes_per_frame
+
+        def ack_utterance(channel: int, position: int | None) -> None:
+            """Фраза канала распознана: подтверждает аудио до неё, кроме незаконченных фраз других каналов."""
+            utterance_starts.pop(channel, None)
+            if position is not None:
+                last_eou[channel] = position
+            bounds = list(utterance_starts.values()) + ([position] if position is not None else [])
+            replay.ack(min(bounds) if bounds else None)
+
+        async def reconnect(retry: int, failed_channel: grpc.aio.Channel, code: grpc.StatusCode) -> None:
+            """Новый Recognize на другом канале с повтором неподтверждённого аудио.
+
+            Токен берётся действующий; если upstream отверг его (UNAUTHENTICATED),
+            токен запрашивается заново.
+            """
+            nonlocal channel_lease, token
+            response_stream.cancel()
+            channel_pool.release(channel_lease)
+            channel_lease = None
+            await asyncio.sleep(reconnect_backoff * 2 ** (retry - 1))
+            if code == grpc.StatusCode.UNAUTHENTICATED:
+                sber_auth.invalidate(token)
+            token = await sber_auth.get_token()
+            replayed = replay.restart()
+            # Позиции нового вызова считаются от начала повтора
+            utterance_starts.update(dict.fromkeys(utterance_starts, 0))
+            last_eou.clear()
+            open_recognize(token, replayed, exclude=failed_channel)
+            metrics.STT_RECONNECTS.inc()
+            replayed_bytes = sum(len(chunk) for chunk in replayed)
+            span.mark("reconnect", retry=retry, replayed_bytes=replayed_bytes)
+            logger.warning(
+                f"STT: Recognize переоткрыт (попытка {retry}/{reconnect_retries}), "
+                f"повтор {replayed_bytes} bytes аудио"
+                + (f", потеряно {replay.dropped_bytes} bytes сверх буфера" if replay.dropped_bytes else "")
             )
 
-            while True:
-                chunk = await request_queue.get()
-                if chunk is None:
-                    break
-                yield recognitionv2_pb2.RecognitionRequest(audio_chunk=chunk)
-
-        response_stream = stub.Recognize(request_generator(), metadata=metadata)
+        if governor is not None:
+            # Слот занят на всю сессию, включая переподключения
+            await governor.acquire(admission.LIVE)
+            admitted = True
+        open_recognize(token, [])
+        metrics.STT_SESSION_SETUP.observe(time.perf_counter() - started_at)
 
         async def read_grpc_responses():
-            try:
-                async for response in response_stream:
-                    # v2 использует oneof response
-                    if response.HasField("transcription"):
-                        transcription = response.transcription
-                        if transcription.results:
-                            hypothesis = transcription.results[0]
-                            text = hypothesis.normalized_text or hypothesis.text
-                            is_final = transcription.eou
-
-                            msg = format_transcription(
-                                text=text,
-                                is_final=is_final,
-                                language=options["language"],
-                            )
-                            await websocket.send_text(json.dumps(msg))
-                            logger.debug(f"STT result: final={is_final}, text={text[:80] if text else ''}...")
-            except asyncio.CancelledError:
-                logger.info("gRPC reader отменён")
-            except grpc.aio.AioRpcError as e:
-                logger.error(f"gRPC error: {e.code()} {e.details()}")
+            first_partial = first_final = True
+            retries = 0
+            while True:
                 try:
-                    await websocket.send_text(json.dumps(format_error(str(e.details()))))
-                except Exception:
-                    pass
-            except Exception as e:
-                logger.error(f"gRPC reader непредвиденная ошибка: {e}")
+                    async for response in response_stream:
+                        # v2 использует oneof response
+                        if response.HasField("transcription"):
+                            transcription = response.transcription
+                            # SaluteSpeech нумерует каналы с нуля, jambonz — с единицы
+                            channel = transcription.channel
+                            if transcription.eou and replay is not None:
+                                # Фраза распознана: её аудио повторять не нужно
+                                ack_utterance(channel, audio_position(transcription.processed_audio_end))
+                                retries = 0
+                            elif transcription.results:
+                                utterance_starts.setdefault(channel, last_eou.get(channel, 0))
+                            if transcription.results:
+                                hypothesis = transcription.results[0]
+                                text = hypothesis.normalized_text or hypothesis.text
+                                is_final = transcription.eou
+                                if first_partial:
+                                    first_partial = False
+                                    span.mark("first_partial")
+                                    metrics.STT_FIRST_PARTIAL.observe(time.perf_counter() - started_at)
+                                if is_final:
+                                    span.mark("final")
+                                    if first_final:
+                                        first_final = False
+                                        metrics.STT_FIRST_FINAL.observe(time.perf_counter() - started_at)
+
+                                msg = format_transcription(
+                                    text=text,
+                                    is_final=is_final,
+                                    language=options["language"],
+                                    channel=channel + 1,
+                                )
+                                await websocket.send_text(json.dumps(msg))
+                                logger.debug(f"STT result: final={is_final}, text={text[:80] if text else ''}...")
+                    if governor is not None:
+                        governor.report(None)
+                    return
+                except asyncio.CancelledError:
+                    logger.info("gRPC reader отменён")
+                    return
+                except grpc.aio.AioRpcError as e:
+                    logger.error(f"gRPC error: {e.code()} {e.details()}")
+                    metrics.count_grpc_error("stt", e)
+                    if governor is not None:
+                        governor.report(e)
+                    failed_channel = channel_lease.channel
+                    if e.code() == grpc.StatusCode.UNAVAILABLE:
+                        channel_pool.report_failure(failed_channel)
+                    if replay is not None and e.code() in RECONNECT_CODES and retries < reconnect_retries:
+                        retries += 1
+                        try:
+                            await reconnect(retries, failed_channel, e.code())
+                            continue
+                        except Exception as reconnect_error:
+                            logger.error(f"STT: не удалось переоткрыть Recognize: {reconnect_error}")
+                    span.set(error=e.code().name)
+                    try:
+                        await websocket.send_text(json.dumps(format_error(str(e.details()))))
+                    except Exception:
+                        pass
+                    return
+                except Exception as e:
+                    logger.error(f"gRPC reader непредвиденная ошибка: {e}")
+                    return
 
         grpc_task = asyncio.create_task(read_grpc_responses())
 
@@ -232,24 +477,34 @@ async def stt_endpoint(websocket: WebSocket):
                     data = json.loads(message["text"])
                     if data.get("type") == "stop":
                         logger.info("STT stop received")
-                        await request_queue.put(None)
+                        if vad is not None and (tail := vad.flush()):
+                            await request_queue.put(encode(tail) if encode else tail)
+                        await request_queue.close()
                         break
                 elif "bytes" in message:
-                    await request_queue.put(message["bytes"])
+                    frame = message["bytes"]
+                    metrics.STT_BYTES_IN.inc(len(frame))
+                    if vad is not None:
+                        frame = vad.process(frame)
+                        if not frame:
+                            continue
+                    await request_queue.put(encode(frame) if encode else frame)
 
             elif message["type"] == "websocket.disconnect":
                 logger.info("WebSocket disconnected")
-                await request_queue.put(None)
+                await request_queue.close()
                 break
 
         await grpc_task
 
     except WebSocketDisconnect:
         logger.info("STT WebSocket отключён клиентом")
-        await request_queue.put(None)
+        if request_queue is not None:
+            await request_queue.close()
 
     except Exception as e:
         logger.error(f"STT ошибка: {e}")
+        span.set(error=str(e))
         try:
             await websocket.send_text(json.dumps(format_error(str(e))))
         except Exception:
@@ -264,8 +519,28 @@ async def stt_endpoint(websocket: WebSocket):
             except (asyncio.CancelledError, asyncio.TimeoutError):
                 logger.warning("gRPC task принудительно отменён")
 
-        if grpc_channel:
-            await grpc_channel.close()
+        # Канал общий: вызов отменяем явно, закрывать канал нельзя
+        if response_stream is not None:
+            response_stream.cancel()
+        if channel_lease:
+            channel_pool.release(channel_lease)
+        if admitted:
+            governor.release()
+        if request_queue is not None:
+            request_queue.discard()
+            stats = request_queue.stats()
+            logger.info(
+                f"STT аудио: {stats['frames']} кадров → {stats['chunks']} chunks, "
+                f"склеено {stats['coalesced_frames']}, отброшено {stats['dropped_chunks']} "
+                f"({stats['dropped_bytes']} bytes)"
+            )
+        if vad is not None:
+            logger.info(
+                f"STT VAD: подавлено {vad.suppressed_fraction:.1%} аудио "
+                f"({vad.suppressed_bytes} из {vad.total_bytes} bytes, keepalive {vad.keepalive_bytes} bytes)"
+            )
+            span.set(vad_suppressed=round(vad.suppressed_fraction, 3))
+        span.end()
         try:
             await websocket.close()
         except Exception:
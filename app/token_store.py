@@ -0,0 +1,184 @@
+"""Общее хранилище OAuth токена для нескольких воркеров и реплик.
+
+Каждый процесс с собственным SberAuth получает свой токен — OAuth трафик
+растёт с числом воркеров, а новые реплики стартуют с запроса к OAuth.
+TokenStore хранит токен вне процесса: воркеры читают действующий токен
+без сетевого запроса, а обновляет его один процесс, взявший lock.
+
+FileTokenStore — файл с flock для воркеров одного хоста,
+KeyValueTokenStore — любое KV хранилище кластера с интерфейсом KeyValue.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Protocol
+
+logger = logging.getLogger(__name__)
+
+# Период опроса занятого lock и сколько его ждать
+LOCK_POLL_INTERVAL = 0.05
+LOCK_TIMEOUT = 60.0
+
+
+class TokenStoreLockTimeout(Exception):
+    """Lock обновления токена не освободился за LOCK_TIMEOUT."""
+
+
+class TokenStore(Protocol):
+    """Хранилище токена: чтение, запись и lock обновления между процессами."""
+
+    async def load(self) -> tuple[str, int] | None:
+        """(access_token, expires_at в мс) или None, если токена нет."""
+
+    async def save(self, token: str, expires_at: int) -> None:
+        ...
+
+    def lock(self) -> AsyncIterator[None]:
+        """Async context manager: пока он держится, токен обновляет только этот процесс."""
+
+
+class FileTokenStore:
+    """Токен в JSON файле, lock — flock на соседнем .lock файле (воркеры одного хоста).
+
+    Файлы создаются с правами 0600 и открываются с O_NOFOLLOW: symlink
+    на месте файла токена или lock — ошибка, а не чтение или запись чужого файла.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock_path = f"{path}.lock"
+
+    async def load(self) -> tuple[str, int] | None:
+        try:
+            with os.fdopen(os.open(self._path, os.O_RDONLY | os.O_NOFOLLOW)) as f:
+                data = json.load(f)
+            return data["access_token"], int(data["expires_at"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Токен в {self._path} не читается: {e}")
+            return None
+
+    async def save(self, token: str, expires_at: int) -> None:
+        # Запись через временный файл и rename: читатели не видят половину JSON
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"access_token": token, "expires_at": expires_at}, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @asynccontextmanager
+    async def lock(self) -> AsyncIterator[None]:
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            # Неблокирующий flock с опросом: ожидание не занимает поток и отменяемо
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        raise TokenStoreLockTimeout(f"Token lock {self._lock_path} is held too long")
+                    await asyncio.sleep(LOCK_POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class KeyValue(Protocol):
+    """Минимальный KV интерфейс; совпадает с подмножеством redis.asyncio.Redis."""
+
+    async def get(self, key: str) -> bytes | str | None:
+        ...
+
+    async def set(self, key: str, value: str, px: int | None = None, nx: bool = False) -> bool | None:
+        """px — TTL в мс; nx — записать, только если ключа нет (возвращает falsy, если он есть)."""
+
+    async def delete(self, key: str) -> int:
+        ...
+
+
+class InMemoryKeyValue:
+    """KeyValue в памяти процесса: замена кластерного хранилища для тестов и одного процесса."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[str, float | None]] = {}
+
+    async def get(self, key: str) -> str | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and time.monotonic() >= expires:
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: str, px: int | None = None, nx: bool = False) -> bool | None:
+        if nx and await self.get(key) is not None:
+            return None
+        self._data[key] = (value, time.monotonic() + px / 1000 if px else None)
+        return True
+
+    async def delete(self, key: str) -> int:
+        return 1 if self._data.pop(key, None) is not None else 0
+
+
+class KeyValueTokenStore:
+    """Токен в KV хранилище кластера, lock — ключ с nx и TTL (переживает падение держателя)."""
+
+    def __init__(self, client: KeyValue, key: str = "sber-speech-adapter:token", lock_ttl_ms: int = 30_000):
+        self._client = client
+        self._key = key
+        self._lock_key = f"{key}:lock"
+        self._lock_ttl_ms = lock_ttl_ms
+
+    async def load(self) -> tuple[str, int] | None:
+        raw = await self._client.get(self._key)
+        if raw is None:
+            return None
+        try:
+            data = json.loads(raw)
+            return data["access_token"], int(data["expires_at"])
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Токен в KV ключе {self._key} не читается: {e}")
+            return None
+
+    async def save(self, token: str, expires_at: int) -> None:
+        value = json.dumps({"access_token": token, "expires_at": expires_at})
+        # Ключ живёт не дольше токена
+        ttl_ms = expires_at - int(time.time() * 1000)
+        await self._client.set(self._key, value, px=ttl_ms if ttl_ms > 0 else None)
+
+    @asynccontextmanager
+    async def lock(self) -> AsyncIterator[None]:
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not await self._client.set(self._lock_key, owner, px=self._lock_ttl_ms, nx=True):
+            if time.monotonic() > deadline:
+                raise TokenStoreLockTimeout(f"Token lock {self._lock_key} is held too long")
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            # Не снимаем чужой lock, если наш истёк по TTL
+            current = await self._client.get(self._lock_key)
+            if isinstance(current, bytes):
+                current = current.decode()
+            if current == owner:
+                await self._client.delete(self._lock_key)
@@ -0,0 +1,264 @@
+"""Трассировка сессий: тайминги адаптера с привязкой к callSid jambonz.
+
+jambonz передаёт метаданные звонка в имени голоса (Ost_8000;callSid=...,env=dev)
+или в start message. Сессия открывает span с этими метаданными и отмечает
+в нём этапы (токен получен, канал готов, первый chunk, результат), сегменты
+TTS — дочерние span. Текущий span лежит в contextvar: код на любой глубине
+вызывает tracing.mark(), задачи сессии наследуют его при создании.
+
+Решение о сэмплировании (TRACE_SAMPLE_RATE) принимается при старте сессии;
+несэмплированная сессия получает NOOP span, у которого все методы пустые.
+Экспорт: json — строка лога на span, otlp — OTLP/HTTP JSON пачками в коллектор.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Доля сэмплируемых сессий (TRACE_SAMPLE_RATE), 0 — трассировка выключена
+sample_rate: float = 0.0
+EXPORTERS = ("json", "otlp")
+
+SERVICE_NAME = "sber-speech-adapter"
+
+
+class Span:
+    """Сэмплированный span: этапы — события с временем от начала span."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "events", "_start_ns", "_start", "_ended")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.events: list[tuple[str, float, dict[str, Any]]] = []
+        self._start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self._ended = False
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def mark(self, name: str, **attributes: Any) -> None:
+        self.events.append((name, time.perf_counter() - self._start, attributes))
+
+    def span(self, name: str, **attributes: Any) -> "Span":
+        return Span(name, self.trace_id, self.span_id, attributes)
+
+    def end(self) -> None:
+        if self._ended:
+            return
+        self._ended = True
+        if _exporter is not None:
+            _exporter.export(self, time.perf_counter() - self._start)
+
+    def to_dict(self, duration: float) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self._start_ns / 1e9,
+            "duration_ms": round(duration * 1000, 2),
+            "attributes": self.attributes,
+            "events": [
+                {"name": name, "offset_ms": round(offset * 1000, 2), **attrs}
+                for name, offset, attrs in self.events
+            ],
+        }
+
+    @property
+    def start_ns(self) -> int:
+        return self._start_ns
+
+
+class _NoopSpan:
+    """Span несэмплированной сессии: ничего не хранит и не экспортирует."""
+
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def mark(self, name: str, **attributes: Any) -> None:
+        pass
+
+    def span(self, name: str, **attributes: Any) -> "_NoopSpan":
+        return self
+
+    def end(self) -> None:
+        pass
+
+
+NOOP = _NoopSpan()
+
+_current: ContextVar[Span | _NoopSpan] = ContextVar("trace_span", default=NOOP)
+
+
+def split_voice(voice: str) -> tuple[str, dict[str, str]]:
+    """Имя голоса и метаданные jambonz: Ost_8000;callSid=abc,env=dev → (Ost_8000, {callSid: abc, env: dev})."""
+    name, _, tail = voice.partition(";")
+    metadata = {}
+    for item in tail.replace(";", ",").split(","):
+        key, sep, value = item.partition("=")
+        if sep and key.strip():
+            metadata[key.strip()] = value.strip()
+    return name, metadata
+
+
+def start(name: str, **attributes: Any) -> Span | _NoopSpan:
+    """Открывает корневой span сессии и делает его текущим в контексте."""
+    if not sample_rate or _exporter is None or (sample_rate < 1 and random.random() >= sample_rate):
+        _current.set(NOOP)
+        return NOOP
+    span = Span(name, os.urandom(16).hex(), None, attributes)
+    _current.set(span)
+    return span
+
+
+def current() -> Span | _NoopSpan:
+    return _current.get()
+
+
+def mark(name: str, **attributes: Any) -> None:
+    """Этап в текущем span (NOOP, если сессия не сэмплирована)."""
+    _current.get().mark(name, **attributes)
+
+
+def child(name: str, **attributes: Any) -> Span | _NoopSpan:
+    """Дочерний span текущего span, становится текущим.
+
+    Вызывается в начале отдельной задачи (сегмент TTS): contextvar задачи
+    меняется, span сессии в других задачах остаётся текущим.
+    """
+    span = _current.get().span(name, **attributes)
+    _current.set(span)
+    return span
+
+
+class JsonExporter:
+    """Строка JSON на span в лог app.tracing."""
+
+    def export(self, span: Span, duration: float) -> None:
+        logger.info(json.dumps(span.to_dict(duration), ensure_ascii=False, default=str))
+
+    async def close(self) -> None:
+        pass
+
+
+class OtlpExporter:
+    """OTLP/HTTP JSON (/v1/traces): span копятся и отправляются пачкой раз в interval."""
+
+    def __init__(self, endpoint: str, interval: float = 1.0, max_batch: int = 512):
+        self._endpoint = endpoint
+        self._interval = interval
+        self._max_batch = max_batch
+        self._batch: list[dict[str, Any]] = []
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+
+    def export(self, span: Span, duration: float) -> None:
+        if len(self._batch) >= self._max_batch * 4:
+            # Коллектор не успевает: теряем span, а не память
+            return
+        self._batch.append(_otlp_span(span, duration))
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        while self._batch:
+            batch, self._batch = self._batch[:self._max_batch], self._batch[self._max_batch:]
+            payload = {
+                "resourceSpans": [{
+                    "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                    "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": batch}],
+                }]
+            }
+            if self._client is None:
+                self._client = httpx.AsyncClient(timeout=5.0)
+            try:
+                response = await self._client.post(self._endpoint, json=payload)
+                if response.status_code >= 400:
+                    logger.warning(f"OTLP: коллектор ответил {response.status_code}, {len(batch)} span потеряно")
+            except httpx.HTTPError as e:
+                logger.warning(f"OTLP: экспорт не удался: {e}, {len(batch)} span потеряно")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _otlp_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _otlp_span(span: Span, duration: float) -> dict[str, Any]:
+    start_ns = span.start_ns
+    result = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 2,  # SERVER
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(start_ns + int(duration * 1e9)),
+        "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+        "events": [
+            {
+                "name": name,
+                "timeUnixNano": str(start_ns + int(offset * 1e9)),
+                "attributes": [_otlp_attribute(k, v) for k, v in attrs.items()],
+            }
+            for name, offset, attrs in span.events
+        ],
+    }
+    if span.parent_id:
+        result["parentSpanId"] = span.parent_id
+    return result
+
+
+_exporter: JsonExporter | OtlpExporter | None = None
+
+
+def configure(rate: float, exporter: str = "json", otlp_endpoint: str | None = None) -> JsonExporter | OtlpExporter | None:
+    """Настраивает сэмплирование и экспорт; возвращает экспортёр (его close() — при остановке)."""
+    global sample_rate, _exporter
+    if exporter not in EXPORTERS:
+        raise ValueError(f"Unknown trace exporter: {exporter}")
+    sample_rate = max(0.0, min(rate, 1.0))
+    if not sample_rate:
+        _exporter = None
+    elif exporter == "otlp":
+        if not otlp_endpoint:
+            raise ValueError("OTLP exporter requires an endpoint")
+        _exporter = OtlpExporter(otlp_endpoint)
+    else:
+        _exporter = JsonExporter()
+    return _exporter
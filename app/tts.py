@@ -1,35 +1,43 @@
 """TTS endpoint для jambonz (SaluteSpeech v2 API)."""
+import asyncio
 import logging
-import os
+import time
+from contextlib import aclosing
 from io import BytesIO
+from typing import AsyncIterator, Awaitable, Callable, Literal
 
 import grpc
-from fastapi import APIRouter, Response, HTTPException
+from fastapi import APIRouter, Header, Response, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.generated import synthesisv2_pb2, synthesisv2_pb2_grpc
+from app import admission, hedging, metrics, tracing
+from app.audio import OUTPUT_SAMPLE_RATES, PcmEncoder, voice_sample_rate, wav_header
 from app.auth import SberAuth
+from app.channels import ChannelPool
+from app.segmenter import split_ssml, split_text
+from app.tts_cache import TTSCache, make_cache_key
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-SALUTE_SPEECH_HOST = "smartspeech.sber.ru:443"
-
-# Путь к сертификатам Минцифры РФ
-CERTS_DIR = os.path.join(os.path.dirname(__file__), "..", "certs")
-CA_CERT_PATH = os.path.join(CERTS_DIR, "russian-trusted-chain.pem")
-
 sber_auth: SberAuth | None = None
+channel_pool: ChannelPool | None = None
+tts_cache: TTSCache | None = None
 
-
-def get_ssl_credentials():
-    """Создаёт SSL credentials с сертификатами Минцифры РФ."""
-    root_certs = None
-    if os.path.exists(CA_CERT_PATH):
-        with open(CA_CERT_PATH, "rb") as f:
-            root_certs = f.read()
-    return grpc.ssl_channel_credentials(root_certificates=root_certs)
+# Режим по умолчанию для запросов без поля stream (TTS_HTTP_STREAMING)
+http_streaming: bool = False
+# Хеджирование вызовов Synthesize (TTS_HEDGE), None — выключено
+hedge_policy: hedging.HedgePolicy | None = None
+# Лимит одновременных Synthesize (TTS_MAX_CONCURRENT), общий с /tts-stream; None — без лимита
+governor: admission.Governor | None = None
+# Тексты не короче стольких символов синтезируются по предложениям параллельно
+# (TTS_PARALLEL_MIN_CHARS), 0 — выключено; в запросе переопределяется полем split
+parallel_min_chars: int = 0
+# Сколько предложений одного запроса синтезируется одновременно (TTS_PARALLEL_CONCURRENCY)
+parallel_concurrency: int = 4
 
 
 class TTSRequest(BaseModel):
@@ -38,16 +46,181 @@ class TTSRequest(BaseModel):
     voice: str = "Nec_24000"
     language: str = "ru-RU"
     type: str = "text"
+    # True — отдавать аудио chunked по мере синтеза, None — по настройке сервера
+    stream: bool | None = None
+    # True — синтезировать по предложениям параллельно, None — по длине текста
+    split: bool | None = None
+    # Формат ответа; без него — по заголовку Accept, иначе wav
+    format: Literal["wav", "l16", "alaw", "mulaw", "opus"] | None = None
+    # Частота PCM ответа; без неё — rate из Accept или частота голоса
+    sample_rate: int | None = None
 
 
-async def synthesize_speech(
+# Media type из Accept → формат ответа /tts
+ACCEPT_FORMATS = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/l16": "l16",
+    "audio/pcma": "alaw",
+    "audio/x-alaw-basic": "alaw",
+    "audio/pcmu": "mulaw",
+    "audio/basic": "mulaw",
+    "audio/x-mulaw": "mulaw",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/*": "wav",
+    "*/*": "wav",
+}
+
+
+class AudioFormat:
+    """Формат ответа /tts и как его получить от SaluteSpeech.
+
+    wav, l16 (PCM S16LE без заголовка), alaw, mulaw — на частоте sample_rate,
+    opus — Ogg/Opus от SaluteSpeech как есть. Если частота совпадает с частотой
+    голоса, SaluteSpeech сразу отдаёт WAV или A-law; иначе запрашивается PCM
+    и ресемплируется/кодируется на лету (µ-law SaluteSpeech не синтезирует).
+    """
+
+    def __init__(self, name: str, voice_rate: int, sample_rate: int | None = None):
+        self.name = name
+        self.voice_rate = voice_rate
+        self.sample_rate = voice_rate if name == "opus" or sample_rate is None else sample_rate
+
+    @property
+    def media_type(self) -> str:
+        if self.name == "wav":
+            return "audio/wav"
+        if self.name == "opus":
+            return "audio/ogg;codecs=opus"
+        media = {"l16": "audio/l16", "alaw": "audio/pcma", "mulaw": "audio/pcmu"}[self.name]
+        return f"{media};rate={self.sample_rate}"
+
+    @property
+    def cache_encoding(self) -> str:
+        """Кодировка для ключа кэша: у каждого формата и частоты своя запись."""
+        if self.sample_rate == self.voice_rate:
+            return self.name
+        return f"{self.name}@{self.sample_rate}"
+
+    @property
+    def upstream_encoding(self) -> int:
+        """Кодировка, которую просить у SaluteSpeech при синтезе одним вызовом."""
+        encodings = synthesisv2_pb2.Options.AudioEncoding
+        if self.name == "opus":
+            return encodings.OPUS
+        if self.name == "alaw" and self.sample_rate == self.voice_rate:
+            return encodings.PCM_ALAW
+        return encodings.PCM_S16LE
+
+    def encoder(self) -> PcmEncoder | None:
+        """Преобразование PCM голоса в формат ответа; None — PCM подходит как есть."""
+        if self.name == "opus":
+            raise ValueError("Opus is served as synthesized, not encoded from PCM")
+        encoding = {"alaw": "alaw", "mulaw": "mulaw"}.get(self.name, "pcm")
+        if encoding == "pcm" and self.sample_rate == self.voice_rate:
+            return None
+        return PcmEncoder(self.voice_rate, self.sample_rate, encoding)
+
+
+def negotiate_format(
+    voice: str,
+    requested: str | None = None,
+    sample_rate: int | None = None,
+    accept: str | None = None,
+) -> AudioFormat:
+    """Формат ответа: поле format запроса, затем Accept (по q), по умолчанию wav.
+
+    Accept без аудио форматов (например, application/json от HTTP клиента
+    общего назначения) не ошибка: отдаётся wav, как до согласования формата.
+    ValueError — частота не поддерживается.
+    """
+    name = requested
+    if name is None and accept:
+        ranges = []
+        for position, media_range in enumerate(accept.split(",")):
+            media, *params = [part.strip() for part in media_range.split(";")]
+            values = dict(param.partition("=")[::2] for param in params)
+            try:
+                quality = float(values.get("q", "1"))
+            except ValueError:
+                quality = 0.0
+            if media.lower() in ACCEPT_FORMATS and quality > 0:
+                ranges.append((-quality, position, ACCEPT_FORMATS[media.lower()], values.get("rate")))
+        if ranges:
+            _, _, name, rate = min(ranges)
+            if sample_rate is None and rate and rate.isdigit():
+                sample_rate = int(rate)
+        else:
+            logger.debug(f"TTS: Accept без аудио форматов ({accept}), отдаём wav")
+    if sample_rate is not None and sample_rate not in OUTPUT_SAMPLE_RATES:
+        raise ValueError(f"Unsupported sample_rate {sample_rate}, expected one of {OUTPUT_SAMPLE_RATES}")
+    return AudioFormat(name or "wav", voice_sample_rate(voice), sample_rate)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse, который всегда закрывает генератор тела.
+
+    При обрыве клиента Starlette бросает исключение в цикле отправки и
+    оставляет генератор приостановленным на yield; aclose() гарантирует,
+    что его finally (отмена gRPC вызова, освобождение канала) выполнится сразу.
+    cleanup вызывается после него — в том числе если тело так и не началось.
+    """
+
+    def __init__(self, content, *args, cleanup: Callable[[], Awaitable[None]] | None = None, **kwargs):
+        super().__init__(content, *args, **kwargs)
+        self._cleanup = cleanup
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            if self._cleanup is not None:
+                await self._cleanup()
+
+
+async def synthesize_speech_stream(
     text: str,
     voice: str,
     language: str,
     content_type: str,
     token: str,
-) -> bytes:
-    """Синтезирует речь через SaluteSpeech gRPC v2 API (bidirectional streaming)."""
+    audio_encoding: int = synthesisv2_pb2.Options.AudioEncoding.PCM_S16LE,
+    priority: int = admission.LIVE,
+) -> AsyncIterator[bytes]:
+    """Синтезирует речь и отдаёт аудио chunks по мере их прихода от SaluteSpeech.
+
+    Вызов занимает слот governor с приоритетом priority. С hedge_policy вызов
+    хеджируется: если первый chunk задерживается, такой же вызов уходит на
+    другой канал, аудио отдаётся от победителя.
+    """
+
+    def attempt(exclude, on_channel):
+        return _synthesis_call(text, voice, language, content_type, token, audio_encoding, exclude, on_channel)
+
+    async with admission.admitted(governor, priority):
+        if hedge_policy is None:
+            chunks = attempt(None, None)
+        else:
+            chunks = hedging.hedged_stream(attempt, hedge_policy, "tts", governor)
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                yield chunk
+
+
+async def _synthesis_call(
+    text: str,
+    voice: str,
+    language: str,
+    content_type: str,
+    token: str,
+    audio_encoding: int,
+    exclude: grpc.aio.Channel | None = None,
+    on_channel: Callable[[grpc.aio.Channel], None] | None = None,
+) -> AsyncIterator[bytes]:
+    """Один вызов Synthesize на канале пула (exclude — канал, который не брать)."""
 
     # Определяем тип контента
     if content_type == "ssml":
@@ -55,28 +228,23 @@ async def synthesize_speech(
     else:
         proto_content_type = synthesisv2_pb2.Text.ContentType.TEXT
 
-    # Подключаемся к SaluteSpeech с сертификатами Минцифры
-    credentials = get_ssl_credentials()
-    channel_options = [
-        ("grpc.ssl_target_name_override", "smartspeech.sber.ru"),
-        ("grpc.default_authority", "smartspeech.sber.ru"),
-        ("grpc.dns_resolver", "native"),
-    ]
-    channel = grpc.aio.secure_channel(SALUTE_SPEECH_HOST, credentials, options=channel_options)
-    stub = synthesisv2_pb2_grpc.SmartSpeechStub(channel)
-
     # Метаданные с токеном
     metadata = [("authorization", f"Bearer {token}")]
 
+    span = tracing.current()
+
     # Генератор запросов для bidirectional streaming
     async def request_generator():
         # Сначала отправляем Options
         options = synthesisv2_pb2.Options(
-            audio_encoding=synthesisv2_pb2.Options.AudioEncoding.WAV,
+            audio_encoding=audio_encoding,
             language=language,
             voice=voice,
         )
         yield synthesisv2_pb2.SynthesisRequest(options=options)
+        # gRPC запрашивает следующее сообщение, когда записал предыдущее:
+        # канал подключён и вызов начат
+        span.mark("channel_ready")
 
         # Затем отправляем Text
         text_msg = synthesisv2_pb2.Text(
@@ -85,45 +253,385 @@ async def synthesize_speech(
         )
         yield synthesisv2_pb2.SynthesisRequest(text=text_msg)
 
-    # Собираем аудио из стрима
-    audio_buffer = BytesIO()
+    # Стрим на долгоживущем канале из пула (без нового TLS/HTTP2 handshake)
+    async with channel_pool.stream(exclude) as channel:
+        if on_channel is not None:
+            on_channel(channel)
+        stub = synthesisv2_pb2_grpc.SmartSpeechStub(channel)
+        response_stream = stub.Synthesize(request_generator(), metadata=metadata)
+        first_audio = False
+
+        try:
+            async for response in response_stream:
+                # v2 использует oneof response
+                if response.HasField("audio") and response.audio.audio_chunk:
+                    if not first_audio:
+                        first_audio = True
+                        tracing.mark("first_chunk")
+                    metrics.TTS_BYTES_IN.inc(len(response.audio.audio_chunk))
+                    yield response.audio.audio_chunk
+            tracing.mark("last_chunk")
+        except grpc.aio.AioRpcError as e:
+            metrics.count_grpc_error("tts", e)
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                channel_pool.report_failure(channel)
+            raise
+        finally:
+            # Канал общий: незавершённый вызов (например, клиент отключился) отменяем явно
+            response_stream.cancel()
+
+
+def split_for_synthesis(text: str, content_type: str, split: bool | None = None) -> list[str]:
+    """Части текста для синтеза: предложения при параллельном режиме, иначе текст целиком."""
+    if split is None:
+        split = parallel_min_chars > 0 and len(text) >= parallel_min_chars
+    if not split:
+        return [text]
+    sentences = split_ssml(text) if content_type == "ssml" else split_text(text)
+    return sentences or [text]
 
-    response_stream = stub.Synthesize(request_generator(), metadata=metadata)
 
-    async for response in response_stream:
-        # v2 использует oneof response
-        if response.HasField("audio"):
-            audio_buffer.write(response.audio.audio_chunk)
+async def synthesize_sentences_stream(
+    sentences: list[str],
+    voice: str,
+    language: str,
+    content_type: str,
+    token: str,
+    priority: int = admission.LIVE,
+) -> AsyncIterator[bytes]:
+    """PCM предложений по порядку; синтезируются они параллельно, не более parallel_concurrency.
+
+    Каждое предложение — отдельный вызов synthesize_speech_stream (со своим
+    слотом governor и хеджем). Аудио первого предложения отдаётся по мере
+    прихода, остальные копятся в своих очередях, пока до них не дойдёт очередь.
+    """
+    semaphore = asyncio.Semaphore(max(1, parallel_concurrency))
+    queues: list[asyncio.Queue] = [asyncio.Queue() for _ in sentences]
+
+    async def produce(index: int, sentence: str) -> None:
+        async with semaphore:
+            span = tracing.child("tts_sentence", index=index, chars=len(sentence))
+            try:
+                chunks = synthesize_speech_stream(
+                    text=sentence,
+                    voice=voice,
+                    language=language,
+                    content_type=content_type,
+                    token=token,
+                    priority=priority,
+                )
+                async with aclosing(chunks):
+                    async for chunk in chunks:
+                        queues[index].put_nowait(chunk)
+                queues[index].put_nowait(None)
+            except Exception as e:
+                span.set(error=str(e))
+                queues[index].put_nowait(e)
+            finally:
+                span.end()
+
+    tasks = [asyncio.create_task(produce(i, s)) for i, s in enumerate(sentences)]
+    try:
+        for queue in queues:
+            while (item := await queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        # Ошибка, обрыв клиента или отмена: незавершённые предложения отменяются
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def synthesize_speech(
+    text: str,
+    voice: str,
+    language: str,
+    content_type: str,
+    token: str,
+    priority: int = admission.LIVE,
+) -> bytes:
+    """Синтезирует речь через SaluteSpeech gRPC v2 API (bidirectional streaming)."""
+    audio_buffer = BytesIO()
 
-    await channel.close()
+    async for chunk in synthesize_speech_stream(
+        text=text,
+        voice=voice,
+        language=language,
+        content_type=content_type,
+        token=token,
+        audio_encoding=synthesisv2_pb2.Options.AudioEncoding.WAV,
+        priority=priority,
+    ):
+        audio_buffer.write(chunk)
 
     return audio_buffer.getvalue()
 
 
-@router.post("/tts")
-async def tts_endpoint(tts_request: TTSRequest) -> Response:
-    """HTTP POST endpoint для TTS."""
+async def synthesize_audio_stream(
+    text: str,
+    voice: str,
+    language: str,
+    content_type: str,
+    token: str,
+    audio_format: AudioFormat,
+    priority: int = admission.LIVE,
+    split: bool | None = None,
+) -> AsyncIterator[bytes]:
+    """Аудио в формате audio_format (для wav — PCM без заголовка) по мере синтеза.
+
+    Длинный текст синтезируется по предложениям параллельно; Opus — всегда
+    одним вызовом, его Ogg потоки не склеиваются. PCM от SaluteSpeech
+    ресемплируется и кодируется в формат ответа на лету.
+    """
+    sentences = [text] if audio_format.name == "opus" else split_for_synthesis(text, content_type, split)
+    if len(sentences) > 1:
+        tracing.current().set(sentences=len(sentences))
+        chunks = synthesize_sentences_stream(sentences, voice, language, content_type, token, priority)
+        encoder = audio_format.encoder()
+    else:
+        audio_encoding = audio_format.upstream_encoding
+        chunks = synthesize_speech_stream(
+            text=text,
+            voice=voice,
+            language=language,
+            content_type=content_type,
+            token=token,
+            audio_encoding=audio_encoding,
+            priority=priority,
+        )
+        pcm = audio_encoding == synthesisv2_pb2.Options.AudioEncoding.PCM_S16LE
+        encoder = audio_format.encoder() if pcm else None
+
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            if encoder is not None:
+                chunk = encoder.process(chunk)
+            if chunk:
+                yield chunk
+
+
+async def get_or_synthesize(
+    text: str,
+    voice: str,
+    language: str,
+    content_type: str,
+    priority: int = admission.LIVE,
+    split: bool | None = None,
+    audio_format: AudioFormat | None = None,
+) -> bytes:
+    """Возвращает аудио из кэша или синтезирует его (одновременные промахи — один вызов).
+
+    priority — приоритет ожидания слота governor (предсинтез — admission.BATCH).
+    audio_format — формат ответа, по умолчанию WAV на частоте голоса; в кэше
+    у каждого формата своя запись. Длинный текст синтезируется по предложениям
+    параллельно (см. split_for_synthesis), их PCM склеивается за одним заголовком WAV.
+    """
+    audio_format = audio_format or AudioFormat("wav", voice_sample_rate(voice))
+
+    async def _synthesize() -> bytes:
+        token = await sber_auth.get_token()
+        tracing.mark("token")
+        if audio_format.cache_encoding == "wav" and len(split_for_synthesis(text, content_type, split)) == 1:
+            # WAV на частоте голоса SaluteSpeech отдаёт сам
+            return await synthesize_speech(
+                text=text,
+                voice=voice,
+                language=language,
+                content_type=content_type,
+                token=token,
+                priority=priority,
+            )
+        audio = BytesIO()
+        async for chunk in synthesize_audio_stream(
+            text, voice, language, content_type, token, audio_format, priority, split
+        ):
+            audio.write(chunk)
+        if audio_format.name == "wav":
+            return wav_header(audio_format.sample_rate, data_size=audio.tell()) + audio.getvalue()
+        return audio.getvalue()
+
+    if tts_cache is None:
+        return await _synthesize()
+
+    key = make_cache_key(text, voice, language, content_type, audio_format.cache_encoding)
+    return await tts_cache.get_or_create(key, _synthesize)
+
+
+async def stream_audio_response(
+    text: str,
+    voice: str,
+    language: str,
+    content_type: str,
+    split: bool | None = None,
+    audio_format: AudioFormat | None = None,
+) -> Response:
+    """Отдаёт аудио chunked по мере синтеза (для WAV — заголовок сразу, затем PCM).
+
+    Первый chunk ожидается до начала ответа, чтобы ошибка SaluteSpeech
+    ещё могла вернуться как 502. Промах регистрируется в single-flight
+    кэша: одновременные запросы того же текста и формата (stream и
+    буферизованные) ждут этот синтез и получают аудио целиком.
+    """
+    started = time.monotonic()
+    audio_format = audio_format or AudioFormat("wav", voice_sample_rate(voice))
+    media_type = audio_format.media_type
+    is_wav = audio_format.name == "wav"
+    cache_key = make_cache_key(text, voice, language, content_type, audio_format.cache_encoding)
+    flight = None
+    if tts_cache is not None:
+        cached = await tts_cache.lookup(cache_key)
+        if cached is not None:
+            logger.info(f"TTS stream: из кэша {len(cached)} bytes")
+            tracing.mark("cache_hit")
+            elapsed = time.monotonic() - started
+            metrics.TTS_FIRST_AUDIO_HTTP.observe(elapsed)
+            metrics.TTS_SYNTHESIS_HTTP.observe(elapsed)
+            metrics.TTS_BYTES_OUT.inc(len(cached))
+            return Response(content=cached, media_type=media_type)
+        flight = tts_cache.begin(cache_key)
+
+    sample_rate = audio_format.sample_rate
+    span = tracing.current()
     try:
         token = await sber_auth.get_token()
+        span.mark("token")
+        # Длинный текст: первое предложение звучит, пока остальные ещё синтезируются
+        chunks = synthesize_audio_stream(text, voice, language, content_type, token, audio_format, split=split)
+        try:
+            first_chunk = await anext(chunks)
+        except BaseException:
+            await chunks.aclose()
+            raise
+    except StopAsyncIteration:
+        empty = wav_header(sample_rate, data_size=0) if is_wav else b""
+        if flight is not None:
+            tts_cache.end(cache_key, flight, empty)
+        return Response(content=empty, media_type=media_type)
+    except BaseException as e:
+        if flight is not None:
+            tts_cache.end(cache_key, flight, error=e)
+        raise
+
+    ttfb_ms = (time.monotonic() - started) * 1000
+    metrics.TTS_FIRST_AUDIO_HTTP.observe(ttfb_ms / 1000)
 
-        # jambonz может добавлять метаданные через ';' (например Ost_8000;callSid=...)
-        voice = tts_request.voice.split(";")[0]
+    async def body():
+        audio_chunks: list[bytes] | None = [] if tts_cache is not None else None
+        total_bytes = 0
+        try:
+            if is_wav:
+                yield wav_header(sample_rate)
+            chunk = first_chunk
+            while True:
+                yield chunk
+                metrics.TTS_BYTES_OUT.inc(len(chunk))
+                total_bytes += len(chunk)
+                if audio_chunks is not None:
+                    audio_chunks.append(chunk)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    break
+        finally:
+            await chunks.aclose()
 
-        audio_data = await synthesize_speech(
+        total_ms = (time.monotonic() - started) * 1000
+        metrics.TTS_SYNTHESIS_HTTP.observe(total_ms / 1000)
+        span.set(bytes=total_bytes)
+        logger.info(f"TTS stream успешно: {total_bytes} bytes, ttfb={ttfb_ms:.0f}ms, total={total_ms:.0f}ms")
+
+        if audio_chunks is not None:
+            audio = b"".join(audio_chunks)
+            if is_wav:
+                audio = wav_header(sample_rate, data_size=total_bytes) + audio
+            await tts_cache.put(cache_key, audio)
+            tts_cache.end(cache_key, flight, audio)
+
+    async def cleanup() -> None:
+        # Тело могло не начаться или оборваться: закрываем вызов, ожидающие синтез повторят поиск
+        await chunks.aclose()
+        if flight is not None:
+            tts_cache.end(cache_key, flight, error=asyncio.CancelledError())
+        span.end()
+
+    return ClosingStreamingResponse(body(), media_type=media_type, cleanup=cleanup)
+
+
+@router.post("/tts")
+async def tts_endpoint(tts_request: TTSRequest, accept: str | None = Header(None)) -> Response:
+    """HTTP POST endpoint для TTS; формат ответа — поле format или заголовок Accept."""
+    started = time.monotonic()
+    # jambonz может добавлять метаданные через ';' (например Ost_8000;callSid=...):
+    # Sber принимает чистое имя голоса, метаданные уходят в trace
+    voice, call_metadata = tracing.split_voice(tts_request.voice)
+    if tts_request.sample_rate is not None and tts_request.sample_rate not in OUTPUT_SAMPLE_RATES:
+        raise HTTPException(
+            status_code=422,
+            detail={"error": f"sample_rate must be one of {OUTPUT_SAMPLE_RATES}"},
+        )
+    try:
+        audio_format = negotiate_format(voice, tts_request.format, tts_request.sample_rate, accept)
+    except ValueError as e:
+        # Accept с неподдерживаемой частотой (audio/l16;rate=11025)
+        raise HTTPException(status_code=406, detail={"error": str(e)})
+    streaming = http_streaming if tts_request.stream is None else tts_request.stream
+    span = tracing.start(
+        "tts",
+        voice=voice,
+        chars=len(tts_request.text),
+        stream=streaming,
+        format=audio_format.cache_encoding,
+        **call_metadata,
+    )
+    # Chunked ответ закрывает span сам, после отправки тела
+    span_owned_by_response = False
+    try:
+        if streaming:
+            response = await stream_audio_response(
+                text=tts_request.text,
+                voice=voice,
+                language=tts_request.language,
+                content_type=tts_request.type,
+                split=tts_request.split,
+                audio_format=audio_format,
+            )
+            span_owned_by_response = isinstance(response, ClosingStreamingResponse)
+            return response
+
+        audio_data = await get_or_synthesize(
             text=tts_request.text,
             voice=voice,
             language=tts_request.language,
             content_type=tts_request.type,
-            token=token,
+            split=tts_request.split,
+            audio_format=audio_format,
         )
 
-        logger.info(f"TTS успешно: {len(audio_data)} bytes")
+        # В буферизованном режиме первый байт уходит только после полного синтеза
+        ttfb_ms = (time.monotonic() - started) * 1000
+        metrics.TTS_FIRST_AUDIO_HTTP.observe(ttfb_ms / 1000)
+        metrics.TTS_SYNTHESIS_HTTP.observe(ttfb_ms / 1000)
+        metrics.TTS_BYTES_OUT.inc(len(audio_data))
+        logger.info(f"TTS успешно: {len(audio_data)} bytes, ttfb={ttfb_ms:.0f}ms")
+        span.set(bytes=len(audio_data))
 
         return Response(
             content=audio_data,
-            media_type="audio/wav",
+            media_type=audio_format.media_type,
         )
 
+    except admission.AdmissionRejected as e:
+        logger.warning(f"TTS отклонён: {e}")
+        span.set(error="admission_rejected")
+        raise HTTPException(status_code=503, detail={"error": str(e)}, headers={"Retry-After": "1"})
+
     except Exception as e:
         logger.error(f"TTS ошибка: {e}")
+        span.set(error=str(e))
         raise HTTPException(status_code=502, detail={"error": str(e)})
+
+    finally:
+        if not span_owned_by_response:
+            span.end()
@@ -0,0 +1,360 @@
+"""Двухуровневый кэш синтезированного аудио TTS.
+
+Ключ — sha256 нормализованного запроса (текст, голос, язык, тип) и
+кодировки аудио. Первый уровень — LRU в памяти с лимитом по байтам,
+второй — файлы в каталоге на диске (читаются через mmap), переживают
+рестарт. Каталог можно делить с другими процессами (app.presynth,
+воркеры app.server): записи, которых нет в индексе процесса, ищутся на
+диске, а индекс раз в disk_rescan_seconds сверяется с каталогом, чтобы
+лимит размера считался по всем файлам, а не по записям процесса. Одинаковые одновременные промахи выполняют один upstream вызов.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_SUFFIX = ".audio"
+
+
+def make_cache_key(
+    text: str,
+    voice: str,
+    language: str,
+    content_type: str,
+    audio_encoding: str,
+) -> str:
+    """Строит ключ кэша по нормализованному запросу и кодировке аудио."""
+    normalized = [
+        " ".join(text.split()),
+        voice.split(";")[0],
+        language.replace("_", "-"),
+        content_type.lower(),
+        audio_encoding.lower(),
+    ]
+    payload = json.dumps(normalized, ensure_ascii=False).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+class TTSCache:
+    """Кэш аудио: LRU в памяти + каталог на диске, TTL и вытеснение по размеру."""
+
+    def __init__(
+        self,
+        memory_max_bytes: int = 64 * 1024 * 1024,
+        disk_dir: str | None = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+        ttl_seconds: float = 86400.0,
+        disk_rescan_seconds: float = 60.0,
+    ):
+        self._memory_max_bytes = memory_max_bytes
+        self._disk_dir = disk_dir
+        self._disk_max_bytes = disk_max_bytes
+        self._ttl = ttl_seconds
+        self._disk_rescan_seconds = disk_rescan_seconds
+
+        # key -> (audio, created_at)
+        self._memory: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._memory_bytes = 0
+
+        # key -> (size, last_access); порядок вставки = порядок LRU
+        self._disk_index: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_scanned_at = 0.0
+
+        self._inflight: dict[str, asyncio.Future] = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        if self._disk_dir:
+            os.makedirs(self._disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def stats(self) -> dict[str, int]:
+        """Счётчики попаданий/промахов и занятый объём."""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "memory_bytes": self._memory_bytes,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            "disk_entries": len(self._disk_index),
+        }
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self._ttl > 0 and now - created_at > self._ttl
+
+    # --- Память ---
+
+    def _memory_get(self, key: str, now: float) -> bytes | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        audio, created_at = entry
+        if self._is_expired(created_at, now):
+            self._memory_drop(key)
+            return None
+        self._memory.move_to_end(key)
+        return audio
+
+    def _memory_put(self, key: str, audio: bytes, created_at: float) -> None:
+        if len(audio) > self._memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_drop(key)
+        self._memory[key] = (audio, created_at)
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self._memory_max_bytes:
+            old_key, _ = next(iter(self._memory.items()))
+            self._memory_drop(old_key)
+            self.evictions += 1
+
+    def _memory_drop(self, key: str) -> None:
+        audio, _ = self._memory.pop(key)
+        self._memory_bytes -= len(audio)
+
+    # --- Диск ---
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self._disk_dir, key[:2], key + CACHE_FILE_SUFFIX)
+
+    def _scan_disk(self) -> list[tuple[float, str, int]]:
+        """Файлы кэша в каталоге: (mtime, key, size). Вызывается из потока."""
+        entries = []
+        for root, _, files in os.walk(self._disk_dir):
+            for name in files:
+                if not name.endswith(CACHE_FILE_SUFFIX):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, name[: -len(CACHE_FILE_SUFFIX)], st.st_size))
+        return entries
+
+    def _sync_disk_index(self, entries: list[tuple[float, str, int]], scanned_at: float) -> None:
+        """Заменяет индекс файлами каталога и вытесняет сверх лимита.
+
+        Порядок LRU — время последнего обращения в этом процессе, для чужих
+        файлов — mtime. Записи, добавленные во время сканирования, сохраняются.
+        """
+        now = time.time()
+        live = []
+        for mtime, key, size in entries:
+            if self._is_expired(mtime, now):
+                self._disk_remove_file(key)
+                continue
+            live.append((self._disk_index.get(key, (size, mtime))[1], key, size))
+        index: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        for last_access, key, size in sorted(live):
+            index[key] = (size, last_access)
+        for key, entry in self._disk_index.items():
+            if key not in index and entry[1] >= scanned_at:
+                index[key] = entry
+        self._disk_index = index
+        self._disk_bytes = sum(size for size, _ in index.values())
+        self._disk_scanned_at = scanned_at
+        self._disk_evict()
+
+    def _load_disk_index(self) -> None:
+        """Восстанавливает индекс диска после рестарта (старые файлы — первыми на вытеснение)."""
+        self._sync_disk_index(self._scan_disk(), time.time())
+        logger.info(f"TTS кэш: на диске {len(self._disk_index)} записей, {self._disk_bytes} bytes")
+
+    async def _rescan_disk(self, now: float) -> None:
+        """Сверяет индекс с каталогом, если с прошлой сверки прошло disk_rescan_seconds."""
+        if now - self._disk_scanned_at < self._disk_rescan_seconds:
+            return
+        self._disk_scanned_at = now
+        try:
+            entries = await asyncio.to_thread(self._scan_disk)
+        except OSError as e:
+            logger.warning(f"TTS кэш: ошибка сканирования диска: {e}")
+            return
+        self._sync_disk_index(entries, now)
+
+    def _disk_read(self, path: str, now: float) -> tuple[bytes | None, float]:
+        """Читает файл кэша через mmap, просроченный не читает. Вызывается из потока."""
+        created_at = os.path.getmtime(path)
+        if self._is_expired(created_at, now):
+            return None, created_at
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:], created_at
+
+    async def _disk_get(self, key: str, now: float) -> tuple[bytes, float] | None:
+        indexed = key in self._disk_index
+        try:
+            audio, created_at = await asyncio.to_thread(self._disk_read, self._disk_path(key), now)
+        except FileNotFoundError:
+            # Нет и у других процессов; файл из индекса мог удалить чужой процесс
+            if indexed:
+                self._disk_drop(key)
+            return None
+        except (OSError, ValueError):
+            self._disk_drop(key)
+            return None
+        if audio is None:
+            self._disk_drop(key)
+            return None
+        if key in self._disk_index:
+            self._disk_index[key] = (self._disk_index[key][0], now)
+            self._disk_index.move_to_end(key)
+        elif not indexed:
+            # Запись другого процесса (presynth, соседний worker): берём в индекс
+            self._disk_register(key, len(audio), now)
+        return audio, created_at
+
+    def _disk_write(self, key: str, audio: bytes) -> None:
+        """Атомарно пишет файл кэша (tmp + rename). Вызывается из потока."""
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+    def _disk_register(self, key: str, size: int, now: float) -> None:
+        if key in self._disk_index:
+            self._disk_bytes -= self._disk_index.pop(key)[0]
+        self._disk_index[key] = (size, now)
+        self._disk_bytes += size
+        self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        while self._disk_bytes > self._disk_max_bytes and self._disk_index:
+            old_key = next(iter(self._disk_index))
+            self._disk_drop(old_key)
+            self.evictions += 1
+
+    def _disk_drop(self, key: str) -> None:
+        entry = self._disk_index.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[0]
+        self._disk_remove_file(key)
+
+    def _disk_remove_file(self, key: str) -> None:
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    # --- Публичный API ---
+
+    async def get(self, key: str) -> bytes | None:
+        """Ищет аудио в памяти, затем на диске (попадание на диске поднимается в память).
+
+        Файл читается в потоке, чтобы большой WAV не блокировал event loop.
+        """
+        now = time.time()
+        audio = self._memory_get(key, now)
+        if audio is not None:
+            self.memory_hits += 1
+            return audio
+        if self._disk_dir:
+            entry = await self._disk_get(key, now)
+            if entry is not None:
+                audio, created_at = entry
+                self.disk_hits += 1
+                self._memory_put(key, audio, created_at)
+                return audio
+        return None
+
+    async def put(self, key: str, audio: bytes) -> None:
+        """Сохраняет аудио в оба уровня."""
+        if not audio:
+            return
+        now = time.time()
+        self._memory_put(key, audio, now)
+        if self._disk_dir and len(audio) <= self._disk_max_bytes:
+            try:
+                await asyncio.to_thread(self._disk_write, key, audio)
+            except OSError as e:
+                logger.warning(f"TTS кэш: ошибка записи на диск: {e}")
+                return
+            self._disk_register(key, len(audio), now)
+            await self._rescan_disk(now)
+
+    async def lookup(self, key: str) -> bytes | None:
+        """Аудио из кэша или из уже идущего синтеза этого ключа.
+
+        None — синтеза нет и выполнить его должен вызывающий: сразу, без
+        await между lookup и begin, иначе одновременный промах его продублирует.
+        """
+        while True:
+            audio = await self.get(key)
+            if audio is not None:
+                return audio
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                return None
+
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Отменили лидера (клиент отключился), а не нас — пробуем снова
+                if inflight.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+
+    def begin(self, key: str) -> asyncio.Future:
+        """Регистрирует синтез ключа после промаха lookup; завершается через end()."""
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def end(
+        self,
+        key: str,
+        future: asyncio.Future,
+        audio: bytes | None = None,
+        error: BaseException | None = None,
+    ) -> None:
+        """Отдаёт результат синтеза ожидающим lookup. Отмена лидера — ожидающие повторяют поиск."""
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.done():
+            return
+        if error is None:
+            future.set_result(audio)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+            # Помечаем исключение прочитанным: ожидающих может и не быть
+            future.exception()
+        else:
+            future.cancel()
+
+    async def get_or_create(self, key: str, factory: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Возвращает аудио из кэша или синтезирует его.
+
+        Одновременные промахи по одному ключу ждут один вызов factory.
+        """
+        audio = await self.lookup(key)
+        if audio is not None:
+            return audio
+
+        future = self.begin(key)
+        try:
+            audio = await factory()
+            await self.put(key, audio)
+        except BaseException as e:
+            self.end(key, future, error=e)
+            raise
+        self.end(key, future, audio)
+        return audio
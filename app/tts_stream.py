@@ -3,37 +3,534 @@
 Инкрементальный стриминг: каждое stream-сообщение от jambonz сразу
 синтезируется отдельным gRPC вызовом. Аудио стримится в jambonz
 по мере генерации, не дожидаясь flush.
+
+Синтез конвейерный: пока играет сегмент N, уже синтезируются
+следующие (до lookahead сегментов одновременно). Их аудио копится
+в ограниченном буфере и отправляется строго по порядку.
+
+В режиме session (mode=session) вместо вызова на сегмент сессия
+держит один двунаправленный Synthesize и дописывает в него Text.
 """
 import asyncio
 import logging
 import json
-import os
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable
 
 import grpc
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 from app.generated import synthesisv2_pb2, synthesisv2_pb2_grpc
+from app import admission, hedging, metrics, tracing
+from app.audio import OUTPUT_SAMPLE_RATES, Resampler, voice_sample_rate
+from app.audio_pacer import FramePacer
 from app.auth import SberAuth
+from app.channels import ChannelPool
+from app.segmenter import TextAggregator
+from app.tts_cache import TTSCache, make_cache_key
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-SALUTE_SPEECH_HOST = "smartspeech.sber.ru:443"
+sber_auth: SberAuth | None = None
+channel_pool: ChannelPool | None = None
+tts_cache: TTSCache | None = None
+
+# Сколько сегментов синтезируется одновременно (TTS_STREAM_LOOKAHEAD, query param lookahead)
+default_lookahead: int = 2
+# Лимит аудио, буферизованного впереди воспроизведения (TTS_STREAM_BUFFER_KB)
+reorder_buffer_bytes: int = 2 * 1024 * 1024
+# Хеджирование вызовов Synthesize в режиме pipeline (TTS_HEDGE), None — выключено
+hedge_policy: hedging.HedgePolicy | None = None
+# Лимит одновременных Synthesize (TTS_MAX_CONCURRENT), общий с /tts; None — без лимита
+governor: admission.Governor | None = None
+
+# Режим по умолчанию: pipeline (вызов на сегмент) или session (TTS_STREAM_MODE, query param mode)
+default_mode: str = "pipeline"
+
+# Агрегация токенов LLM в фразы (TTS_STREAM_AGGREGATE, query param aggregate=0/1)
+default_aggregate: bool = False
+# Пороги агрегатора; переопределяются query params с теми же именами
+aggregator_defaults: dict[str, int] = {
+    "min_chars": 20,
+    "clause_chars": 80,
+    "max_chars": 250,
+    "idle_ms": 500,
+}
+
+# Частота PCM, отдаваемого в jambonz (TTS_STREAM_SAMPLE_RATE, query param sample_rate);
+# аудио голоса ресемплируется к ней
+output_sample_rate: int = 8000
+# Аудио в jambonz: кадры по столько мс в темпе воспроизведения (TTS_STREAM_FRAME_MS),
+# 0 — chunks отправляются как пришли
+output_frame_ms: int = 20
+# Опережение темпа воспроизведения, мс (TTS_STREAM_LEAD_MS): столько аудио в пути к jambonz
+output_lead_ms: int = 200
+
+MAX_LOOKAHEAD = 8
+STREAM_MODES = ("pipeline", "session")
+
+# Оценка темпа синтеза (символов в секунду): по ней аудио сессии размечается по сегментам
+SESSION_CHARS_PER_SEC = 14.0
+# После стольких неудачных открытий Synthesize подряд сессия остаётся на fallback
+SESSION_OPEN_ATTEMPTS = 3
+
+# Размер кусков при отправке аудио из кэша
+CACHED_CHUNK_BYTES = 8192
+
+
+class _Segment:
+    """Сегмент текста в конвейере и его ещё не отправленное аудио."""
+
+    def __init__(self, index: int, text: str):
+        self.index = index
+        self.text = text
+        self.chunks: deque[bytes] = deque()
+        self.ready = asyncio.Event()
+        self.done = False
+        self.cancelled = False
+        self.task: asyncio.Task | None = None
+        self.chunks_sent = 0
+        self.bytes_sent = 0
+        # Режим session: оценка начала и длительности аудио сегмента в вызове, сек
+        self.offset = 0.0
+        self.duration = 0.0
+        self.submitted_at = 0.0
+        self.first_audio = False
+        self.span = tracing.NOOP
+
+
+class SegmentPipeline:
+    """Конвейер синтеза сегментов с упреждением и строгим порядком воспроизведения.
+
+    submit() запускает синтез сегмента, как только в конвейере есть
+    свободный слот (не более lookahead сегментов, включая играющий).
+    Аудио играющего сегмента отправляется сразу, аудио следующих копится
+    в буфере; при переполнении буфера их синтез приостанавливается.
+    """
 
-CERTS_DIR = os.path.join(os.path.dirname(__file__), "..", "certs")
-CA_CERT_PATH = os.path.join(CERTS_DIR, "russian-trusted-chain.pem")
+    def __init__(
+        self,
+        synthesize: Callable[[str], AsyncIterator[bytes]],
+        send: Callable[[bytes], Awaitable[None]],
+        on_error: Callable[[Exception], Awaitable[None]] | None = None,
+        lookahead: int = 2,
+        max_buffer_bytes: int = 2 * 1024 * 1024,
+    ):
+        self._synthesize = synthesize
+        self._send = send
+        self._on_error = on_error
+        self._max_buffer_bytes = max_buffer_bytes
+        self._slots = asyncio.Semaphore(max(1, lookahead))
+        self._segments: deque[_Segment] = deque()
+        self._added = asyncio.Event()
+        self._space = asyncio.Event()
+        self._buffered = 0
+        self._generation = 0
+        self._next_index = 0
+        self._player_task: asyncio.Task | None = None
+        self._send_lock = asyncio.Lock()
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._buffered
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._segments)
+
+    def start(self) -> None:
+        self._player_task = asyncio.create_task(self._play())
+
+    async def submit(self, text: str) -> None:
+        """Ставит сегмент в конвейер; ждёт свободного слота упреждения."""
+        generation = self._generation
+        await self._slots.acquire()
+        if generation != self._generation:
+            # Пока ждали слот, пришёл clear — сегмент устарел
+            self._slots.release()
+            return
+
+        segment = _Segment(self._next_index, text)
+        self._next_index += 1
+        self._segments.append(segment)
+        segment.task = asyncio.create_task(self._produce(segment))
+        self._added.set()
+
+    async def clear(self) -> int:
+        """Barge-in: отменяет синтез всех сегментов, включая играющий, и сбрасывает
+        неотправленное аудио. После возврата аудио больше не отправляется.
+        Возвращает число отменённых сегментов."""
+        self._generation += 1
+        segments = list(self._segments)
+        for segment in segments:
+            self._cancel(segment)
+        # Дожидаемся отмены gRPC вызовов и отправки, начатой до clear
+        await asyncio.gather(*(s.task for s in segments if s.task), return_exceptions=True)
+        async with self._send_lock:
+            pass
+        return len(segments)
+
+    async def close(self) -> None:
+        """Отменяет весь синтез и воспроизведение."""
+        self._generation += 1
+        segments = list(self._segments)
+        for segment in segments:
+            self._cancel(segment)
+        tasks = [s.task for s in segments if s.task]
+        if self._player_task:
+            self._player_task.cancel()
+            tasks.append(self._player_task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _cancel(self, segment: _Segment) -> None:
+        segment.cancelled = True
+        if segment.task and not segment.task.done():
+            segment.task.cancel()
+        self._buffered -= sum(len(chunk) for chunk in segment.chunks)
+        segment.chunks.clear()
+        segment.ready.set()
+        self._remove(segment)
+
+    def _remove(self, segment: _Segment) -> None:
+        if segment in self._segments:
+            self._segments.remove(segment)
+            self._slots.release()
+            self._space.set()
+
+    def _is_head(self, segment: _Segment) -> bool:
+        return bool(self._segments) and self._segments[0] is segment
+
+    async def _produce(self, segment: _Segment) -> None:
+        span = tracing.child("tts_segment", index=segment.index, chars=len(segment.text))
+        try:
+            async with aclosing(self._synthesize(segment.text)) as chunks:
+                async for chunk in chunks:
+                    # Буфер упреждения полон — ждём, пока играющий сегмент его освободит
+                    while (
+                        not segment.cancelled
+                        and not self._is_head(segment)
+                        and self._buffered >= self._max_buffer_bytes
+                    ):
+                        self._space.clear()
+                        await self._space.wait()
+                    if segment.cancelled:
+                        return
+                    segment.chunks.append(chunk)
+                    self._buffered += len(chunk)
+                    segment.ready.set()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"TTS Stream: ошибка синтеза сегмента #{segment.index}: {e}")
+            span.set(error=str(e))
+            if self._on_error and not segment.cancelled:
+                await self._on_error(e)
+        finally:
+            segment.done = True
+            segment.ready.set()
+            if segment.cancelled:
+                span.set(cancelled=True)
+            span.end()
+
+    async def _play(self) -> None:
+        while True:
+            while not self._segments:
+                self._added.clear()
+                await self._added.wait()
+
+            segment = self._segments[0]
+            # Новый играющий сегмент может продолжить синтез без учёта лимита буфера
+            self._space.set()
+
+            while True:
+                if segment.chunks:
+                    chunk = segment.chunks.popleft()
+                    self._buffered -= len(chunk)
+                    self._space.set()
+                    async with self._send_lock:
+                        await self._send(chunk)
+                    segment.chunks_sent += 1
+                    segment.bytes_sent += len(chunk)
+                    continue
+                if segment.done or segment.cancelled:
+                    break
+                segment.ready.clear()
+                await segment.ready.wait()
+
+            if not segment.cancelled:
+                logger.info(
+                    f"TTS Stream: сегмент #{segment.index} отправлен: "
+                    f"{segment.chunks_sent} chunks, {segment.bytes_sent} bytes"
+                )
+            self._remove(segment)
 
-sber_auth: SberAuth | None = None
 
+async def open_synthesis_call(requests: AsyncIterator[Any]) -> tuple[Any, Callable[..., None]]:
+    """Открывает Synthesize на канале пула.
 
-def get_ssl_credentials():
-    """Создаёт SSL credentials с сертификатами Минцифры РФ."""
-    root_certs = None
-    if os.path.exists(CA_CERT_PATH):
-        with open(CA_CERT_PATH, "rb") as f:
-            root_certs = f.read()
-    return grpc.ssl_channel_credentials(root_certificates=root_certs)
+    Возвращает вызов и функцию освобождения канала; release(failed=True)
+    дополнительно выводит канал из ротации (вызов получил UNAVAILABLE).
+    Вызов держит слот governor до release.
+    """
+    if governor is not None:
+        await governor.acquire(admission.LIVE)
+    try:
+        token = await sber_auth.get_token()
+        tracing.mark("token")
+        lease = channel_pool.acquire()
+    except BaseException:
+        if governor is not None:
+            governor.release()
+        raise
+    stub = synthesisv2_pb2_grpc.SmartSpeechStub(lease.channel)
+    call = stub.Synthesize(requests, metadata=[("authorization", f"Bearer {token}")])
+
+    def release(failed: bool = False) -> None:
+        if failed:
+            channel_pool.report_failure(lease.channel)
+        channel_pool.release(lease)
+        if governor is not None:
+            governor.release()
+
+    return call, release
+
+
+class SynthesisSession:
+    """Один долгоживущий Synthesize вызов на WebSocket сессию.
+
+    После Options в поток запросов дописываются Text сообщения по мере
+    прихода сегментов, аудио из ответа отправляется по порядку. Протокол
+    не размечает границы сегментов в ответе, поэтому они оцениваются по
+    длительности: полученное PCM аудио сравнивается с ожидаемой длительностью
+    текстов (SESSION_CHARS_PER_SEC), паузы и джиттер потока не учитываются.
+    Если сервер завершает поток, сегмент считается неозвученным, если он
+    отправлен после последнего аудио или аудио не дошло до его середины;
+    такие сегменты и все следующие уходят в fallback — отдельный вызов
+    на сегмент. Ошибка открытия вызова сообщается через on_error, сегмент
+    синтезируется через fallback, а следующий снова пробует открыть вызов,
+    когда fallback доиграет; после SESSION_OPEN_ATTEMPTS ошибок подряд
+    сессия остаётся на fallback.
+    """
+
+    def __init__(
+        self,
+        voice: str,
+        language: str,
+        send: Callable[[bytes], Awaitable[None]],
+        fallback: SegmentPipeline,
+        on_error: Callable[[Exception], Awaitable[None]] | None = None,
+        open_call: Callable[[AsyncIterator[Any]], Awaitable[tuple[Any, Callable[..., None]]]] | None = None,
+        chars_per_sec: float = SESSION_CHARS_PER_SEC,
+    ):
+        self._voice = voice
+        self._language = language
+        self._send = send
+        self._fallback = fallback
+        self._on_error = on_error
+        self._open_call = open_call or open_synthesis_call
+        self._chars_per_sec = chars_per_sec
+        self._bytes_per_sec = voice_sample_rate(voice) * 2
+        self._requests: asyncio.Queue | None = None
+        self._call = None
+        self._release: Callable[..., None] | None = None
+        self._reader: asyncio.Task | None = None
+        self._pending: deque[_Segment] = deque()
+        self._next_index = 0
+        # Аудио текущего вызова: получено и ожидается по отправленным текстам, сек
+        self._call_audio = 0.0
+        self._call_text = 0.0
+        # Последний сегмент, отправленный до последнего полученного аудио
+        self._heard_index = -1
+        self._generation = 0
+        self._open_failures = 0
+        self.use_fallback = False
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._fallback.buffered_bytes
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending) + self._fallback.in_flight
+
+    def start(self) -> None:
+        self._fallback.start()
+
+    async def submit(self, text: str) -> None:
+        """Дописывает Text в поток сессии (открывает его при необходимости)."""
+        # Пока fallback играет прежние сегменты, аудио нового вызова обогнало бы их
+        if self.use_fallback or (self._call is None and self._fallback.in_flight):
+            await self._fallback.submit(text)
+            return
+        if self._call is None:
+            generation = self._generation
+            try:
+                await self._open()
+            except Exception as e:
+                # Токен, канал или слот governor недоступны: этот сегмент — отдельным вызовом
+                self._open_failures += 1
+                logger.error(
+                    f"TTS Stream: не удалось открыть Synthesize сессии "
+                    f"({self._open_failures}/{SESSION_OPEN_ATTEMPTS}): {e}"
+                )
+                if self._open_failures >= SESSION_OPEN_ATTEMPTS:
+                    self.use_fallback = True
+                if self._on_error:
+                    await self._on_error(e)
+                await self._fallback.submit(text)
+                return
+            self._open_failures = 0
+            if generation != self._generation:
+                # Пока открывали вызов, пришёл clear — текст устарел
+                return
+
+        segment = _Segment(self._next_index, text)
+        self._next_index += 1
+        segment.offset = self._call_text
+        segment.duration = len(text) / self._chars_per_sec
+        segment.submitted_at = time.perf_counter()
+        segment.span = tracing.current().span("tts_segment", index=segment.index, chars=len(text), mode="session")
+        self._call_text += segment.duration
+        self._pending.append(segment)
+        text_msg = synthesisv2_pb2.Text(
+            text=text,
+            content_type=synthesisv2_pb2.Text.ContentType.TEXT,
+        )
+        self._requests.put_nowait(synthesisv2_pb2.SynthesisRequest(text=text_msg))
+
+    async def clear(self) -> int:
+        """Barge-in: отменяет весь вызов сессии и сегменты fallback.
+        После возврата аудио больше не отправляется."""
+        self._generation += 1
+        reader = self._reader
+        dropped = len(self._pending)
+        self._drop_pending()
+        self._finish_call(cancel=True)
+        if reader:
+            await asyncio.gather(reader, return_exceptions=True)
+        return dropped + await self._fallback.clear()
+
+    async def close(self) -> None:
+        reader = self._reader
+        self._drop_pending()
+        self._finish_call(cancel=True)
+        if reader:
+            await asyncio.gather(reader, return_exceptions=True)
+        await self._fallback.close()
+
+    async def _open(self) -> None:
+        requests: asyncio.Queue = asyncio.Queue()
+        options = synthesisv2_pb2.Options(
+            audio_encoding=synthesisv2_pb2.Options.AudioEncoding.PCM_S16LE,
+            language=self._language,
+            voice=self._voice,
+        )
+
+        span = tracing.current()
+
+        async def request_generator():
+            yield synthesisv2_pb2.SynthesisRequest(options=options)
+            # Options записан в поток: канал подключён и вызов начат
+            span.mark("channel_ready")
+            while True:
+                request = await requests.get()
+                if request is None:
+                    return
+                yield request
+
+        call, release = await self._open_call(request_generator())
+        self._requests = requests
+        self._call = call
+        self._release = release
+        self._call_audio = 0.0
+        self._call_text = 0.0
+        self._heard_index = self._next_index - 1
+        self._reader = asyncio.create_task(self._read(call))
+        logger.info("TTS Stream: открыт Synthesize сессии")
+
+    def _finish_call(self, cancel: bool, failed: bool = False) -> None:
+        if self._reader and cancel:
+            self._reader.cancel()
+        self._reader = None
+        if self._requests is not None:
+            self._requests.put_nowait(None)
+            self._requests = None
+        if self._call is not None:
+            if cancel:
+                self._call.cancel()
+            self._call = None
+        if self._release is not None:
+            self._release(failed)
+            self._release = None
+
+    def _drop_pending(self) -> None:
+        for segment in self._pending:
+            segment.span.set(cancelled=True)
+            segment.span.end()
+        self._pending.clear()
+
+    def _attribute(self, size: int) -> None:
+        """Учитывает chunk аудио: сегменты, чья оценочная длительность уже
+        получена целиком, считаются озвученными и снимаются с учёта."""
+        self._call_audio += size / self._bytes_per_sec
+        self._heard_index = self._next_index - 1
+        if self._pending and not self._pending[0].first_audio:
+            self._pending[0].first_audio = True
+            self._pending[0].span.mark("first_chunk")
+            metrics.TTS_FIRST_AUDIO_STREAM.observe(time.perf_counter() - self._pending[0].submitted_at)
+        while self._pending and self._call_audio >= self._pending[0].offset + self._pending[0].duration:
+            head = self._pending.popleft()
+            metrics.TTS_SYNTHESIS_STREAM.observe(time.perf_counter() - head.submitted_at)
+            head.span.mark("last_chunk")
+            head.span.end()
+            logger.debug(f"TTS Stream: сегмент сессии #{head.index} озвучен ({head.duration:.1f}s по оценке)")
+
+    def _is_unserved(self, segment: _Segment) -> bool:
+        return (
+            segment.index > self._heard_index
+            or self._call_audio < segment.offset + segment.duration / 2
+        )
+
+    async def _read(self, call) -> None:
+        failed = False
+        error: Exception | None = None
+        try:
+            async for response in call:
+                if response.HasField("audio"):
+                    audio_chunk = response.audio.audio_chunk
+                    if audio_chunk:
+                        metrics.TTS_STREAM_BYTES_IN.inc(len(audio_chunk))
+                        self._attribute(len(audio_chunk))
+                        await self._send(audio_chunk)
+        except grpc.aio.AioRpcError as e:
+            logger.warning(f"TTS Stream: Synthesize сессии завершён с ошибкой: {e.code()} {e.details()}")
+            metrics.count_grpc_error("tts_stream", e)
+            failed = e.code() == grpc.StatusCode.UNAVAILABLE
+            error = e
+        except Exception as e:
+            logger.error(f"TTS Stream: ошибка чтения Synthesize сессии: {e}")
+            error = e
+        if governor is not None:
+            governor.report(error)
+
+        if call is not self._call:
+            return
+        # Сервер завершил поток сам
+        unserved = [segment for segment in self._pending if self._is_unserved(segment)]
+        self._drop_pending()
+        self._finish_call(cancel=False, failed=failed)
+        if unserved:
+            logger.warning(
+                f"TTS Stream: сервер завершил Synthesize сессии, "
+                f"{len(unserved)} сегментов → отдельные вызовы"
+            )
+            self.use_fallback = True
+            for segment in unserved:
+                await self._fallback.submit(segment.text)
 
 
 @router.websocket("/tts-stream")
@@ -42,63 +539,147 @@ async def tts_stream_endpoint(websocket: WebSocket):
     WebSocket endpoint для TTS streaming.
 
     Протокол (jambonz → адаптер):
-    - stream: текст → сразу синтезируется отдельным gRPC вызовом
-    - flush: финализация turn (ожидание завершения текущего синтеза)
+    - stream: текст → копится до границы фразы, затем синтезируется
+      (aggregate=0 — каждое сообщение синтезируется сразу)
+    - flush: финализация turn, накопленный текст уходит в синтез
+    - clear: barge-in, отмена всего синтеза (включая играющий сегмент и его
+      gRPC вызов) и неотправленного аудио; подтверждается {"type": "cleared"}
     - stop: завершить сессию
     """
     await websocket.accept()
+    span = tracing.start("tts_stream")
     logger.info("TTS Stream WebSocket подключен")
 
     voice = "Nec_24000"
     language = "ru-RU"
+    lookahead = default_lookahead
+    mode = default_mode
+    sample_rate = output_sample_rate
+    aggregate = default_aggregate
+    thresholds = dict(aggregator_defaults)
 
     # Парсим query params из URL
     query_params = dict(websocket.query_params)
     if "voice" in query_params:
         # jambonz добавляет метаданные через ';' (например Ost_8000;callSid=...,env=dev)
-        # Sber API принимает только чистое имя голоса
-        voice = query_params["voice"].split(";")[0]
+        # Sber API принимает только чистое имя голоса, метаданные уходят в trace
+        voice, call_metadata = tracing.split_voice(query_params["voice"])
+        span.set(**call_metadata)
     if "language" in query_params:
         language = query_params["language"]
+    if query_params.get("lookahead", "").isdigit():
+        lookahead = max(1, min(int(query_params["lookahead"]), MAX_LOOKAHEAD))
+    if query_params.get("mode") in STREAM_MODES:
+        mode = query_params["mode"]
+    if query_params.get("sample_rate", "").isdigit() and int(query_params["sample_rate"]) in OUTPUT_SAMPLE_RATES:
+        sample_rate = int(query_params["sample_rate"])
+    if query_params.get("aggregate") in ("0", "1"):
+        aggregate = query_params["aggregate"] == "1"
+    for name in thresholds:
+        if query_params.get(name, "").isdigit():
+            thresholds[name] = int(query_params[name])
 
     # Конвертируем формат языка: ru_RU -> ru-RU (jambonz использует _, Sber использует -)
     language = language.replace("_", "-")
 
-    logger.info(f"TTS Stream: voice={voice}, language={language}")
+    # Ресемплер один на сессию: состояние фильтра переходит через границы chunks и сегментов
+    resampler = Resampler(voice_sample_rate(voice), sample_rate)
+
+    logger.info(
+        f"TTS Stream: voice={voice}, language={language}, mode={mode}, lookahead={lookahead}, "
+        f"sample_rate={resampler.in_rate}→{sample_rate}, aggregate={aggregate} {thresholds if aggregate else ''}"
+    )
 
     # Отправляем connect message чтобы jambonz начал слать текст
     connect_msg = {
         "type": "connect",
         "data": {
-            "sample_rate": 8000,
+            "sample_rate": sample_rate,
             "base64_encoding": False,
         },
     }
     await websocket.send_text(json.dumps(connect_msg))
+    span.set(voice=voice, mode=mode, sample_rate=sample_rate)
+    span.mark("connect")
+
+    async def _send_error(error: Exception) -> None:
+        if isinstance(error, grpc.aio.AioRpcError):
+            detail = str(error.details())
+        else:
+            detail = str(error)
+        try:
+            await websocket.send_text(json.dumps({"type": "error", "error": detail}))
+        except Exception:
+            pass
 
-    # Очередь задач синтеза — выполняются последовательно
+    async def _send_frame(frame: bytes | memoryview) -> None:
+        metrics.TTS_STREAM_BYTES_OUT.inc(len(frame))
+        # ASGI принимает только bytes: единственная копия кадра — на границе с сервером
+        await websocket.send_bytes(bytes(frame))
+
+    # Кадры в темпе воспроизведения: в пути не больше output_lead_ms, clear действует сразу
+    pacer = None
+    if output_frame_ms > 0:
+        pacer = FramePacer(_send_frame, sample_rate, frame_ms=output_frame_ms, lead_ms=output_lead_ms)
+        pacer.start()
+
+    async def _send_audio(chunk: bytes) -> None:
+        audio = resampler.process(chunk)
+        if not audio:
+            return
+        if pacer is not None:
+            await pacer.write(audio)
+        else:
+            await _send_frame(audio)
+
+    pipeline = SegmentPipeline(
+        synthesize=lambda text: synthesize_segment(text=text, voice=voice, language=language),
+        send=_send_audio,
+        on_error=_send_error,
+        lookahead=lookahead,
+        max_buffer_bytes=reorder_buffer_bytes,
+    )
+    synthesizer: SegmentPipeline | SynthesisSession = pipeline
+    if mode == "session":
+        synthesizer = SynthesisSession(
+            voice=voice,
+            language=language,
+            send=_send_audio,
+            fallback=pipeline,
+            on_error=_send_error,
+        )
+
+    # Очередь текстов; воркер передаёт их в синтез по мере освобождения слотов
     synth_queue: asyncio.Queue[str | None] = asyncio.Queue()
     worker_task = None
 
+    def _enqueue(segment: str) -> None:
+        logger.info(f"TTS Stream: сегмент → синтез ({len(segment)} символов)")
+        synth_queue.put_nowait(segment)
+        metrics.TTS_STREAM_QUEUE_DEPTH.inc()
+
+    # Агрегатор копит мелкие stream-сообщения до границы фразы
+    aggregator = None
+    if aggregate:
+        aggregator = TextAggregator(
+            on_segment=_enqueue,
+            min_chars=thresholds["min_chars"],
+            clause_chars=thresholds["clause_chars"],
+            max_chars=thresholds["max_chars"],
+            idle_timeout=thresholds["idle_ms"] / 1000,
+        )
+
     async def _synth_worker():
-        """Последовательно синтезирует тексты из очереди."""
+        """Передаёт тексты из очереди в конвейер синтеза по порядку."""
         while True:
             text = await synth_queue.get()
+            metrics.TTS_STREAM_QUEUE_DEPTH.dec()
             if text is None:
                 break
-            try:
-                await synthesize_and_stream(
-                    websocket=websocket,
-                    text=text,
-                    voice=voice,
-                    language=language,
-                )
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"TTS Stream: ошибка синтеза: {e}")
+            await synthesizer.submit(text)
 
     try:
+        synthesizer.start()
         worker_task = asyncio.create_task(_synth_worker())
 
         while True:
@@ -111,21 +692,41 @@ async def tts_stream_endpoint(websocket: WebSocket):
 
                     if msg_type == "stream":
                         text = data.get("text", "")
-                        if text.strip():
-                            logger.info(f"TTS Stream: stream → синтез ({len(text)} символов)")
-                            await synth_queue.put(text)
+                        if aggregator is not None:
+                            aggregator.feed(text)
+                        elif text.strip():
+                            _enqueue(text)
 
                     elif msg_type == "flush":
                         logger.info("TTS Stream: flush")
+                        if aggregator is not None:
+                            aggregator.flush()
 
                     elif msg_type == "clear":
-                        logger.info("TTS Stream: clear (barge-in)")
+                        clear_started = time.monotonic()
+                        if aggregator is not None:
+                            aggregator.clear()
                         # Очищаем очередь
                         while not synth_queue.empty():
                             try:
                                 synth_queue.get_nowait()
+                                metrics.TTS_STREAM_QUEUE_DEPTH.dec()
                             except asyncio.QueueEmpty:
                                 break
+                        # Неотправленные кадры сбрасываем до отмены синтеза: это прерывает
+                        # и отправку, которая ждёт места в буфере кадров
+                        if pacer is not None:
+                            pacer.clear()
+                        # Отменяем весь синтез, включая играющий сегмент, и неотправленное аудио
+                        cancelled = await synthesizer.clear()
+                        resampler.reset()
+                        silence_ms = (time.monotonic() - clear_started) * 1000
+                        logger.info(
+                            f"TTS Stream: clear (barge-in): отменено {cancelled} сегментов, "
+                            f"тишина через {silence_ms:.1f}ms"
+                        )
+                        span.mark("clear", cancelled=cancelled)
+                        await websocket.send_text(json.dumps({"type": "cleared"}))
 
                     elif msg_type == "stop":
                         logger.info("TTS Stream: stop")
@@ -140,13 +741,21 @@ async def tts_stream_endpoint(websocket: WebSocket):
     except Exception as e:
         logger.error(f"TTS Stream ошибка: {e}")
     finally:
+        if aggregator is not None:
+            aggregator.clear()
         if worker_task and not worker_task.done():
-            await synth_queue.put(None)
             worker_task.cancel()
             try:
                 await worker_task
             except (asyncio.CancelledError, Exception):
                 pass
+        await synthesizer.close()
+        if pacer is not None:
+            await pacer.close()
+            span.set(**pacer.stats())
+        metrics.TTS_STREAM_QUEUE_DEPTH.dec(synth_queue.qsize())
+
+        span.end()
 
         try:
             await websocket.close()
@@ -155,75 +764,101 @@ async def tts_stream_endpoint(websocket: WebSocket):
         logger.info("TTS Stream: соединение закрыто")
 
 
-async def synthesize_and_stream(
-    websocket: WebSocket,
+async def synthesize_segment(
     text: str,
     voice: str,
     language: str,
-) -> None:
-    """Синтезирует речь и стримит аудио chunks в WebSocket."""
-    channel = None
-    try:
-        token = await sber_auth.get_token()
-
-        credentials = get_ssl_credentials()
-        channel_options = [
-            ("grpc.ssl_target_name_override", "smartspeech.sber.ru"),
-            ("grpc.default_authority", "smartspeech.sber.ru"),
-            ("grpc.dns_resolver", "native"),
-        ]
-        channel = grpc.aio.secure_channel(SALUTE_SPEECH_HOST, credentials, options=channel_options)
+) -> AsyncIterator[bytes]:
+    """Синтезирует сегмент и отдаёт PCM chunks по мере генерации (или из кэша)."""
+    cache_key = None
+    if tts_cache is not None:
+        cache_key = make_cache_key(text, voice, language, "text", "pcm16")
+        cached = await tts_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"TTS Stream: из кэша {len(cached)} bytes")
+            tracing.mark("cache_hit")
+            for offset in range(0, len(cached), CACHED_CHUNK_BYTES):
+                yield cached[offset:offset + CACHED_CHUNK_BYTES]
+            return
+
+    started = time.perf_counter()
+    token = await sber_auth.get_token()
+    tracing.mark("token")
+
+    def attempt(exclude, on_channel):
+        return _segment_call(text, voice, language, token, exclude, on_channel)
+
+    audio_chunks: list[bytes] = []
+    first_audio = False
+    async with admission.admitted(governor):
+        if hedge_policy is None:
+            chunks = attempt(None, None)
+        else:
+            chunks = hedging.hedged_stream(attempt, hedge_policy, "tts_stream", governor)
+        async with aclosing(chunks):
+            async for audio_chunk in chunks:
+                if not first_audio:
+                    first_audio = True
+                    tracing.mark("first_chunk")
+                    metrics.TTS_FIRST_AUDIO_STREAM.observe(time.perf_counter() - started)
+                if cache_key is not None:
+                    audio_chunks.append(audio_chunk)
+                yield audio_chunk
+
+    metrics.TTS_SYNTHESIS_STREAM.observe(time.perf_counter() - started)
+    tracing.mark("last_chunk")
+    # Кэшируем только полностью синтезированный сегмент
+    if cache_key is not None:
+        await tts_cache.put(cache_key, b"".join(audio_chunks))
+
+
+async def _segment_call(
+    text: str,
+    voice: str,
+    language: str,
+    token: str,
+    exclude: grpc.aio.Channel | None = None,
+    on_channel: Callable[[grpc.aio.Channel], None] | None = None,
+) -> AsyncIterator[bytes]:
+    """Один вызов Synthesize сегмента на канале пула (exclude — канал, который не брать)."""
+    metadata = [("authorization", f"Bearer {token}")]
+    span = tracing.current()
+
+    async def request_generator():
+        options = synthesisv2_pb2.Options(
+            audio_encoding=synthesisv2_pb2.Options.AudioEncoding.PCM_S16LE,
+            language=language,
+            voice=voice,
+        )
+        yield synthesisv2_pb2.SynthesisRequest(options=options)
+        # Options записан в поток: канал подключён и вызов начат
+        span.mark("channel_ready")
+
+        text_msg = synthesisv2_pb2.Text(
+            text=text,
+            content_type=synthesisv2_pb2.Text.ContentType.TEXT,
+        )
+        yield synthesisv2_pb2.SynthesisRequest(text=text_msg)
+
+    async with channel_pool.stream(exclude) as channel:
+        if on_channel is not None:
+            on_channel(channel)
         stub = synthesisv2_pb2_grpc.SmartSpeechStub(channel)
-
-        metadata = [("authorization", f"Bearer {token}")]
-
-        async def request_generator():
-            options = synthesisv2_pb2.Options(
-                audio_encoding=synthesisv2_pb2.Options.AudioEncoding.PCM_S16LE,
-                language=language,
-                voice=voice,
-            )
-            yield synthesisv2_pb2.SynthesisRequest(options=options)
-
-            text_msg = synthesisv2_pb2.Text(
-                text=text,
-                content_type=synthesisv2_pb2.Text.ContentType.TEXT,
-            )
-            yield synthesisv2_pb2.SynthesisRequest(text=text_msg)
-
         response_stream = stub.Synthesize(request_generator(), metadata=metadata)
 
-        chunks_sent = 0
-        total_bytes = 0
-
-        async for response in response_stream:
-            if response.HasField("audio"):
-                audio_chunk = response.audio.audio_chunk
-                if audio_chunk:
-                    await websocket.send_bytes(audio_chunk)
-                    chunks_sent += 1
-                    total_bytes += len(audio_chunk)
-
-        await channel.close()
-        channel = None
-        logger.info(f"TTS Stream: отправлено {chunks_sent} chunks, {total_bytes} bytes")
-
-    except asyncio.CancelledError:
-        logger.warning("TTS Stream: синтез отменён")
-    except grpc.aio.AioRpcError as e:
-        logger.error(f"TTS Stream gRPC ошибка: {e.code()} {e.details()}")
         try:
-            error_msg = json.dumps({"type": "error", "error": str(e.details())})
-            await websocket.send_text(error_msg)
-        except Exception:
-            pass
-    except Exception as e:
-        logger.error(f"TTS Stream ошибка синтеза: {e}")
-        try:
-            error_msg = json.dumps({"type": "error", "error": str(e)})
-            await websocket.send_text(error_msg)
-        except Exception:
-            pass
-    finally:
-        if channel:
-            await channel.close()
+            async for response in response_stream:
+                if response.HasField("audio"):
+                    audio_chunk = response.audio.audio_chunk
+                    if audio_chunk:
+                        metrics.TTS_STREAM_BYTES_IN.inc(len(audio_chunk))
+                        yield audio_chunk
+        except grpc.aio.AioRpcError as e:
+            logger.error(f"TTS Stream gRPC ошибка: {e.code()} {e.details()}")
+            metrics.count_grpc_error("tts_stream", e)
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                channel_pool.report_failure(channel)
+            raise
+        finally:
+            # Канал общий: незавершённый вызов отменяем явно
+            response_stream.cancel()
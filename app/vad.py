@@ -0,0 +1,139 @@
+"""Энергетический VAD для STT: не отправлять тишину в SaluteSpeech.
+
+Удержание вызова и паузы абонента — это аудио, за которое платим трафиком
+и квотой распознавания. VadGate классифицирует кадры по уровню (RMS, dBFS),
+векторно через NumPy, и пропускает только речь. Hangover держит гейт
+открытым после речи, чтобы не обрезать окончания слов, а pre-roll буфер
+отдаёт несколько кадров перед началом речи, чтобы не обрезать её начало.
+"""
+from collections import deque
+
+import numpy as np
+
+# Уровень цифровой тишины, чтобы log10 не получал ноль
+_SILENCE_DB = -120.0
+
+
+def frame_levels_db(pcm: bytes, frame_samples: int, channels: int = 1) -> np.ndarray:
+    """Уровень каждого полного кадра PCM S16LE в dBFS (неполный хвост не учитывается).
+
+    Для чередующихся каналов уровень кадра — громкость самого громкого
+    канала: тихий второй участник не маскирует речь первого.
+    """
+    count = len(pcm) // (frame_samples * channels * 2)
+    if not count:
+        return np.empty(0, dtype=np.float32)
+    samples = np.frombuffer(pcm, dtype="<i2", count=count * frame_samples * channels)
+    samples = samples.reshape(count, frame_samples, channels)
+    power = np.max(np.mean(np.square(samples, dtype=np.float32), axis=1), axis=1)
+    with np.errstate(divide="ignore"):
+        levels = 10 * np.log10(power / (32768.0 * 32768.0))
+    return np.maximum(levels, _SILENCE_DB)
+
+
+class VadGate:
+    """Пропускает речь и отбрасывает тишину в потоке PCM S16LE.
+
+    Гейт начинает открытым: первые hangover_ms сессии уходят как есть.
+    Кадр громче threshold_db открывает гейт, вместе с ним уходит pre-roll.
+    Открытый гейт закрывается после hangover_ms тихих кадров. Закрытый гейт
+    ничего не отправляет либо, при keepalive_ms > 0, шлёт кадр цифровой
+    тишины на каждые keepalive_ms отброшенного аудио. При channels > 1
+    кадр — channels чередующихся отсчётов, и речь в любом канале держит
+    гейт открытым.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        frame_ms: int = 20,
+        threshold_db: float = -45.0,
+        hangover_ms: int = 300,
+        preroll_ms: int = 200,
+        keepalive_ms: int = 0,
+        channels: int = 1,
+    ):
+        self._frame_samples = sample_rate * frame_ms // 1000
+        self._channels = channels
+        self._frame_bytes = self._frame_samples * channels * 2
+        self._threshold_db = threshold_db
+        self._hangover_frames = max(1, hangover_ms // frame_ms)
+        self._keepalive_frames = keepalive_ms // frame_ms
+        self._preroll: deque[bytes] = deque(maxlen=max(0, preroll_ms // frame_ms))
+        self._pending = bytearray()
+
+        self._open = True
+        self._quiet_frames = 0
+        self._closed_frames = 0
+
+        self.total_bytes = 0
+        self.suppressed_bytes = 0
+        self.keepalive_bytes = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    @property
+    def suppressed_fraction(self) -> float:
+        """Доля входящего аудио, не отправленного в SaluteSpeech."""
+        return self.suppressed_bytes / self.total_bytes if self.total_bytes else 0.0
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "total_bytes": self.total_bytes,
+            "suppressed_bytes": self.suppressed_bytes,
+            "keepalive_bytes": self.keepalive_bytes,
+            "suppressed_fraction": self.suppressed_fraction,
+        }
+
+    def process(self, pcm: bytes) -> bytes:
+        """Принимает PCM, возвращает аудио для отправки (может быть пустым).
+
+        Неполный кадр ждёт следующего вызова: задержка не больше frame_ms.
+        """
+        self.total_bytes += len(pcm)
+        self._pending += pcm
+        usable = len(self._pending) - len(self._pending) % self._frame_bytes
+        if not usable:
+            return b""
+        data = bytes(self._pending[:usable])
+        del self._pending[:usable]
+
+        out = bytearray()
+        levels = frame_levels_db(data, self._frame_samples, self._channels)
+        for index, is_speech in enumerate(levels > self._threshold_db):
+            frame = data[index * self._frame_bytes:(index + 1) * self._frame_bytes]
+            if is_speech:
+                if not self._open:
+                    self._open = True
+                    # Pre-roll уже учтён как отброшенный — возвращаем его в отправленные
+                    for buffered in self._preroll:
+                        out += buffered
+                        self.suppressed_bytes -= len(buffered)
+                    self._preroll.clear()
+                self._quiet_frames = 0
+                out += frame
+            elif self._open:
+                out += frame
+                self._quiet_frames += 1
+                if self._quiet_frames >= self._hangover_frames:
+                    self._open = False
+                    self._closed_frames = 0
+            else:
+                self.suppressed_bytes += len(frame)
+                self._preroll.append(frame)
+                self._closed_frames += 1
+                if self._keepalive_frames and self._closed_frames % self._keepalive_frames == 0:
+                    out += bytes(self._frame_bytes)
+                    self.keepalive_bytes += self._frame_bytes
+        return bytes(out)
+
+    def flush(self) -> bytes:
+        """Остаток неполного кадра в конце сессии: уходит, только если гейт открыт."""
+        tail = bytes(self._pending)
+        self._pending.clear()
+        if self._open:
+            return tail
+        self.suppressed_bytes += len(tail)
+        return b""
@@ -0,0 +1,70 @@
+"""Бенчмарк: пропускная способность ресемплинга и G.711 кодирования на одно ядро.
+
+Вход — синтетическая речь-подобная смесь тонов с шумом, обрабатывается
+chunks по --chunk-ms, как аудио из SaluteSpeech. Считается процессорное
+время (одно ядро): сколько секунд аудио обрабатывается за секунду CPU
+и сколько таких потоков выдержит ядро в реальном времени.
+
+    python -m benchmarks.audio_dsp --seconds 60
+"""
+import argparse
+import time
+from typing import Callable
+
+import numpy as np
+
+from app.audio import Resampler, alaw_encode, ulaw_encode
+
+
+def make_signal(sample_rate: int, seconds: float) -> bytes:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    signal = sum(np.sin(2 * np.pi * f * t) for f in (180, 720, 2400)) * 6000
+    signal += rng.normal(0, 800, len(t))
+    return np.clip(signal, -32768, 32767).astype("<i2").tobytes()
+
+
+def resample_ulaw(in_rate: int, out_rate: int) -> Callable[[bytes], bytes]:
+    resampler = Resampler(in_rate, out_rate)
+    return lambda chunk: ulaw_encode(resampler.process(chunk))
+
+
+def measure(process: Callable[[bytes], bytes], pcm: bytes, chunk_bytes: int) -> float:
+    """Процессорное время обработки всего сигнала chunks по chunk_bytes."""
+    started = time.process_time()
+    for offset in range(0, len(pcm), chunk_bytes):
+        process(pcm[offset:offset + chunk_bytes])
+    return time.process_time() - started
+
+
+def run(args) -> None:
+    print(f"{args.seconds:.0f}s аудио, chunk {args.chunk_ms}ms")
+    stages = [
+        (f"resample {a // 1000}k→{b // 1000}k", a, lambda a=a, b=b: Resampler(a, b).process)
+        for a, b in ((24000, 8000), (24000, 16000), (48000, 16000), (48000, 8000))
+    ]
+    stages += [
+        ("µ-law encode 8k", 8000, lambda: ulaw_encode),
+        ("A-law encode 8k", 8000, lambda: alaw_encode),
+        ("24k→8k + µ-law", 24000, lambda: resample_ulaw(24000, 8000)),
+    ]
+    for name, rate, factory in stages:
+        pcm = make_signal(rate, args.seconds)
+        chunk_bytes = rate * args.chunk_ms // 1000 * 2
+        cpu = measure(factory(), pcm, chunk_bytes)
+        realtime = args.seconds / cpu if cpu else float("inf")
+        print(
+            f"{name:>20}: {len(pcm) / cpu / 1e6:8.1f} MB/s | "
+            f"{realtime:9.0f}x realtime (≈ потоков на ядро)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
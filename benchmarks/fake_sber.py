@@ -0,0 +1,246 @@
+"""Локальная заглушка SaluteSpeech: gRPC Recognize/Synthesize по proto/ и OAuth.
+
+Квота Sber не тратится, поведение настраивается: задержки ответа, размер
+chunks синтеза и скорость относительно реального времени, ритм partial и
+final результатов распознавания, доля вызовов с ошибкой.
+
+    python -m benchmarks.fake_sber --grpc-port 50051 --oauth-port 9080
+
+Адаптер подключается к ней так:
+
+    SBER_GRPC_TARGET=127.0.0.1:50051 SBER_GRPC_INSECURE=true \\
+    SBER_OAUTH_URL=http://127.0.0.1:9080/api/v2/oauth python -m app.server
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+import grpc
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.audio import voice_sample_rate, wav_header
+from app.generated import recognitionv2_pb2, recognitionv2_pb2_grpc, synthesisv2_pb2, synthesisv2_pb2_grpc
+
+logger = logging.getLogger(__name__)
+
+_STT_BYTES_PER_SAMPLE = {"PCM_S16LE": 2, "MULAW": 1, "ALAW": 1}
+
+
+@dataclass
+class FakeConfig:
+    # Recognize: задержка ответа после аудио и ритм результатов по времени аудио
+    stt_latency_ms: float = 50
+    partial_every_ms: float = 500
+    final_every_ms: float = 3000
+    # Synthesize: задержка первого chunk, длительность chunk и скорость относительно реального времени
+    tts_latency_ms: float = 150
+    tts_chunk_ms: float = 100
+    tts_speed: float = 5.0
+    tts_chars_per_sec: float = 14.0
+    # Доля вызовов, завершаемых ошибкой error_code через error_after_ms
+    error_rate: float = 0.0
+    error_code: str = "UNAVAILABLE"
+    error_after_ms: float = 0
+    # OAuth
+    oauth_latency_ms: float = 50
+    token_ttl_sec: int = 1800
+
+
+class FakeRecognition(recognitionv2_pb2_grpc.SmartSpeechServicer):
+    def __init__(self, config: FakeConfig):
+        self._config = config
+
+    async def Recognize(self, request_iterator, context):
+        config = self._config
+        fail_at = _fail_at(config)
+        responses: asyncio.Queue = asyncio.Queue()
+
+        async def read():
+            bytes_per_ms = 16.0
+            audio_ms = emitted_ms = utterance_start_ms = 0.0
+            words = 0
+            async for request in request_iterator:
+                if request.HasField("options"):
+                    encoding = recognitionv2_pb2.RecognitionOptions.AudioEncoding.Name(request.options.audio_encoding)
+                    bytes_per_sample = _STT_BYTES_PER_SAMPLE.get(encoding, 2)
+                    channels = request.options.channels_count or 1
+                    bytes_per_ms = (request.options.sample_rate or 8000) * bytes_per_sample * channels / 1000
+                    continue
+                audio_ms += len(request.audio_chunk) / bytes_per_ms
+                due = time.monotonic() + config.stt_latency_ms / 1000
+                # Результат на каждые partial_every_ms аудио; final, когда фраза набрала final_every_ms
+                while audio_ms - emitted_ms >= config.partial_every_ms:
+                    emitted_ms += config.partial_every_ms
+                    words += 1
+                    is_final = emitted_ms - utterance_start_ms >= config.final_every_ms
+                    text = " ".join(f"слово{i}" for i in range(words))
+                    await responses.put((due, _transcription(text, is_final)))
+                    if is_final:
+                        utterance_start_ms = emitted_ms
+                        words = 0
+            await responses.put((time.monotonic(), None))
+
+        reader = asyncio.create_task(read())
+        try:
+            while True:
+                due, response = await _next_due(responses, fail_at)
+                if due is None:
+                    reader.cancel()
+                    await _abort(context, config)
+                if response is None:
+                    return
+                yield response
+        finally:
+            reader.cancel()
+
+
+class FakeSynthesis(synthesisv2_pb2_grpc.SmartSpeechServicer):
+    def __init__(self, config: FakeConfig):
+        self._config = config
+
+    async def Synthesize(self, request_iterator, context):
+        config = self._config
+        fail_at = _fail_at(config)
+        texts: asyncio.Queue = asyncio.Queue()
+        options = {"rate": 24000, "wav": False, "sample_bytes": 2}
+
+        async def read():
+            async for request in request_iterator:
+                if request.HasField("options"):
+                    options["rate"] = voice_sample_rate(request.options.voice or "Nec_24000")
+                    options["wav"] = request.options.audio_encoding == synthesisv2_pb2.Options.AudioEncoding.WAV
+                    alaw = request.options.audio_encoding == synthesisv2_pb2.Options.AudioEncoding.PCM_ALAW
+                    options["sample_bytes"] = 1 if alaw else 2
+                elif request.HasField("text"):
+                    await texts.put(request.text.text)
+            await texts.put(None)
+
+        reader = asyncio.create_task(read())
+        try:
+            while True:
+                text = await texts.get()
+                if text is None:
+                    return
+                # Аудио текста: тон по длительности текста, chunks с темпом tts_speed
+                duration = len(text) / config.tts_chars_per_sec
+                chunk_bytes = int(options["rate"] * config.tts_chunk_ms / 1000) * options["sample_bytes"]
+                total_bytes = int(options["rate"] * duration) * options["sample_bytes"]
+                await _sleep_or_fail(config.tts_latency_ms / 1000, fail_at, context, config)
+                if options["wav"]:
+                    yield _audio(wav_header(options["rate"], data_size=total_bytes))
+                sent = 0
+                while sent < total_bytes:
+                    size = min(chunk_bytes, total_bytes - sent)
+                    yield _audio(b"\x10\x00"[:options["sample_bytes"]] * (size // options["sample_bytes"]))
+                    sent += size
+                    await _sleep_or_fail(config.tts_chunk_ms / 1000 / config.tts_speed, fail_at, context, config)
+        finally:
+            reader.cancel()
+
+
+def _transcription(text: str, is_final: bool) -> recognitionv2_pb2.RecognitionResponse:
+    return recognitionv2_pb2.RecognitionResponse(
+        transcription=recognitionv2_pb2.Transcription(
+            results=[recognitionv2_pb2.Hypothesis(text=text, normalized_text=text)],
+            eou=is_final,
+        )
+    )
+
+
+def _audio(chunk: bytes) -> synthesisv2_pb2.SynthesisResponse:
+    return synthesisv2_pb2.SynthesisResponse(audio=synthesisv2_pb2.Audio(audio_chunk=chunk))
+
+
+def _fail_at(config: FakeConfig) -> float | None:
+    """Момент ошибки вызова (monotonic) или None — вызов без ошибки."""
+    if config.error_rate and random.random() < config.error_rate:
+        return time.monotonic() + config.error_after_ms / 1000
+    return None
+
+
+async def _abort(context, config: FakeConfig) -> None:
+    await context.abort(getattr(grpc.StatusCode, config.error_code), "fake_sber: injected error")
+
+
+async def _sleep_or_fail(delay: float, fail_at: float | None, context, config: FakeConfig) -> None:
+    if fail_at is not None and time.monotonic() + delay >= fail_at:
+        await asyncio.sleep(max(0.0, fail_at - time.monotonic()))
+        await _abort(context, config)
+    await asyncio.sleep(delay)
+
+
+async def _next_due(responses: asyncio.Queue, fail_at: float | None):
+    """Следующий ответ в его срок; (None, None) — пора завершить вызов ошибкой."""
+    timeout = None if fail_at is None else max(0.0, fail_at - time.monotonic())
+    try:
+        due, response = await asyncio.wait_for(responses.get(), timeout)
+    except asyncio.TimeoutError:
+        return None, None
+    delay = due - time.monotonic()
+    if fail_at is not None and due >= fail_at:
+        await asyncio.sleep(max(0.0, fail_at - time.monotonic()))
+        return None, None
+    if delay > 0:
+        await asyncio.sleep(delay)
+    return due, response
+
+
+def create_oauth_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/v2/oauth")
+    async def oauth(request: Request):
+        await asyncio.sleep(config.oauth_latency_ms / 1000)
+        if not request.headers.get("authorization", "").startswith("Basic "):
+            return JSONResponse({"message": "unauthorized"}, status_code=401)
+        return {
+            "access_token": f"fake-{uuid.uuid4().hex}",
+            "expires_at": int((time.time() + config.token_ttl_sec) * 1000),
+        }
+
+    return app
+
+
+async def serve(config: FakeConfig, grpc_port: int, oauth_port: int, host: str = "127.0.0.1") -> None:
+    server = grpc.aio.server()
+    recognitionv2_pb2_grpc.add_SmartSpeechServicer_to_server(FakeRecognition(config), server)
+    synthesisv2_pb2_grpc.add_SmartSpeechServicer_to_server(FakeSynthesis(config), server)
+    server.add_insecure_port(f"{host}:{grpc_port}")
+    await server.start()
+
+    oauth = uvicorn.Server(uvicorn.Config(create_oauth_app(config), host=host, port=oauth_port, log_level="warning"))
+    logger.info(f"fake_sber: gRPC {host}:{grpc_port}, OAuth http://{host}:{oauth_port}/api/v2/oauth")
+    try:
+        await oauth.serve()
+    finally:
+        await server.stop(grace=1)
+
+
+def parse_config(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(**{name: getattr(args, name) for name in FakeConfig.__dataclass_fields__})
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    for name, field in FakeConfig.__dataclass_fields__.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(field.default), default=field.default)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--grpc-port", type=int, default=50051)
+    parser.add_argument("--oauth-port", type=int, default=9080)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(parse_config(args), args.grpc_port, args.oauth_port, args.host))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Нагрузочный генератор: N конкурентных звонков jambonz на /stt, /tts и /tts-stream.
+
+Каждый виртуальный звонок повторяет сессии до конца --duration:
+- stt: start, кадры 8 кГц по 20 мс в реальном времени --call-seconds, stop;
+  time-to-first-result — от start до первой transcription;
+- tts: POST /tts (stream), уникальный текст мимо кэша; до первого байта;
+- tts-stream: stream + flush, до первого аудио; сессия ждёт весь текст.
+
+Отчёт: сессии в секунду, ошибки, p50/p95/p99 time-to-first-result,
+CPU и RSS процессов адаптера (Linux, /proc).
+
+С --spawn поднимаются benchmarks.fake_sber и адаптер (app.server) на
+локальных портах — квота Sber не тратится:
+
+    python -m benchmarks.loadgen --spawn --workers 2 --stt 50 --tts 10 --tts-stream 10 --duration 30
+
+Без --spawn нагружается уже запущенный адаптер (--url, --adapter-pid).
+Остальные параметры передаются заглушке, например --tts-latency-ms 300.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+from benchmarks.fake_sber import FakeConfig, add_config_arguments
+
+FRAME_MS = 20
+FRAME_BYTES = 8000 * FRAME_MS // 1000 * 2
+TTS_TEXT = "Здравствуйте! Ваш звонок очень важен для нас, оставайтесь на линии."
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+_request_ids = itertools.count()
+
+
+class Scenario:
+    """Результаты одного вида сессий."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.sessions = 0
+        self.errors: list[str] = []
+        self.first_result_ms: list[float] = []
+
+    def report(self, elapsed: float) -> str:
+        if len(self.first_result_ms) > 1:
+            q = statistics.quantiles(self.first_result_ms, n=100)
+            latency = f"p50 {q[49]:7.1f}ms | p95 {q[94]:7.1f}ms | p99 {q[98]:7.1f}ms"
+        else:
+            latency = "нет результатов"
+        return (
+            f"{self.name:>10}: {self.sessions / elapsed:7.2f} сессий/с | ошибок {len(self.errors):4d} | "
+            f"first result {latency}"
+        )
+
+
+async def stt_session(base_ws: str, call_seconds: float, scenario: Scenario) -> None:
+    silence = bytes(FRAME_BYTES)
+    async with websockets.connect(f"{base_ws}/stt", max_queue=None) as ws:
+        started = time.perf_counter()
+        await ws.send(json.dumps({"type": "start", "language": "ru-RU", "sampleRateHz": 8000, "interimResults": True}))
+        first_result: list[float] = []
+
+        async def read():
+            async for message in ws:
+                data = json.loads(message)
+                if data.get("type") == "error":
+                    raise RuntimeError(data.get("error"))
+                if not first_result:
+                    first_result.append((time.perf_counter() - started) * 1000)
+
+        reader = asyncio.create_task(read())
+        try:
+            for seq in range(int(call_seconds * 1000 / FRAME_MS)):
+                if reader.done():
+                    break
+                await ws.send(silence)
+                delay = started + (seq + 1) * FRAME_MS / 1000 - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if not reader.done():
+                await ws.send(json.dumps({"type": "stop"}))
+            await asyncio.wait_for(reader, timeout=10)
+        finally:
+            reader.cancel()
+        if not first_result:
+            raise RuntimeError("no transcription")
+        scenario.first_result_ms.append(first_result[0])
+
+
+async def tts_session(client: httpx.AsyncClient, base_url: str, scenario: Scenario) -> None:
+    text = f"{TTS_TEXT} Запрос {next(_request_ids)} процесса {os.getpid()}."
+    started = time.perf_counter()
+    async with client.stream("POST", f"{base_url}/tts", json={"text": text, "voice": "Nec_24000", "stream": True}) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        first = None
+        async for chunk in response.aiter_bytes():
+            if first is None and chunk:
+                first = (time.perf_counter() - started) * 1000
+    scenario.first_result_ms.append(first)
+
+
+async def tts_stream_session(base_ws: str, scenario: Scenario) -> None:
+    text = f"{TTS_TEXT} Сессия {next(_request_ids)} процесса {os.getpid()}."
+    # Заглушка синтезирует len/14 секунд, адаптер отдаёт PCM 8 кГц
+    expected = int(len(text) / 14 * 8000) * 2 * 0.95
+    async with websockets.connect(f"{base_ws}/tts-stream?voice=Nec_24000&sample_rate=8000", max_queue=None) as ws:
+        await ws.recv()  # connect
+        started = time.perf_counter()
+        await ws.send(json.dumps({"type": "stream", "text": text}))
+        await ws.send(json.dumps({"type": "flush"}))
+        received = 0
+        first = None
+        while received < expected:
+            message = await asyncio.wait_for(ws.recv(), timeout=30)
+            if isinstance(message, str):
+                data = json.loads(message)
+                if data.get("type") == "error":
+                    raise RuntimeError(data.get("error"))
+                continue
+            if first is None:
+                first = (time.perf_counter() - started) * 1000
+            received += len(message)
+        await ws.send(json.dumps({"type": "stop"}))
+    scenario.first_result_ms.append(first)
+
+
+async def virtual_call(run_session, scenario: Scenario, deadline: float, stagger: float) -> None:
+    await asyncio.sleep(stagger)
+    while time.monotonic() < deadline:
+        try:
+            await run_session()
+            scenario.sessions += 1
+        except Exception as e:
+            scenario.errors.append(f"{type(e).__name__}: {e}")
+            await asyncio.sleep(0.1)
+
+
+def process_tree(root: int) -> list[int]:
+    """root и все его потомки по /proc."""
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def sample_usage(root: int) -> tuple[float, int]:
+    """(CPU секунд, RSS байт) процесса и потомков."""
+    cpu, rss = 0.0, 0
+    for pid in process_tree(root):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / CLK_TCK
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) * 1024
+        except (OSError, IndexError, ValueError):
+            continue
+    return cpu, rss
+
+
+async def monitor(pid: int, stop: asyncio.Event, result: dict) -> None:
+    started_cpu, _ = sample_usage(pid)
+    started = time.monotonic()
+    peak_rss = 0
+    while not stop.is_set():
+        _, rss = sample_usage(pid)
+        peak_rss = max(peak_rss, rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+    cpu, _ = sample_usage(pid)
+    result["cpu_percent"] = (cpu - started_cpu) / (time.monotonic() - started) * 100
+    result["peak_rss_mb"] = peak_rss / 1024 / 1024
+
+
+def spawn_stack(args) -> list[subprocess.Popen]:
+    fake_args = [
+        sys.executable, "-m", "benchmarks.fake_sber",
+        "--grpc-port", str(args.grpc_port), "--oauth-port", str(args.oauth_port),
+    ]
+    for name, value in vars(args).items():
+        if name in FakeConfig.__dataclass_fields__:
+            fake_args += [f"--{name.replace('_', '-')}", str(value)]
+    env = {
+        **os.environ,
+        "SBER_CLIENT_ID": "loadgen",
+        "SBER_CLIENT_SECRET": "loadgen",
+        "SBER_GRPC_TARGET": f"127.0.0.1:{args.grpc_port}",
+        "SBER_GRPC_INSECURE": "true",
+        "SBER_OAUTH_URL": f"http://127.0.0.1:{args.oauth_port}/api/v2/oauth",
+        "PORT": str(args.port),
+        "WORKERS": str(args.workers),
+        "LOG_LEVEL": "warning",
+        "TTS_CACHE_MEMORY_MB": "0",
+    }
+    fake = subprocess.Popen(fake_args, env=env)
+    adapter = subprocess.Popen([sys.executable, "-m", "app.server"], env=env)
+    return [fake, adapter]
+
+
+async def wait_healthy(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("adapter did not start")
+            await asyncio.sleep(0.2)
+
+
+async def run(args) -> None:
+    processes = spawn_stack(args) if args.spawn else []
+    base_url = args.url if not args.spawn else f"http://127.0.0.1:{args.port}"
+    base_ws = base_url.replace("http", "ws", 1)
+    adapter_pid = processes[1].pid if processes else args.adapter_pid
+    try:
+        await wait_healthy(base_url)
+        scenarios = {name: Scenario(name) for name in ("stt", "tts", "tts-stream")}
+        deadline = time.monotonic() + args.duration
+        usage: dict = {}
+        stop = asyncio.Event()
+        monitor_task = asyncio.create_task(monitor(adapter_pid, stop, usage)) if adapter_pid else None
+
+        limits = httpx.Limits(max_connections=max(10, args.tts))
+        async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+            calls = []
+            for count, name, factory in (
+                (args.stt, "stt", lambda: stt_session(base_ws, args.call_seconds, scenarios["stt"])),
+                (args.tts, "tts", lambda: tts_session(client, base_url, scenarios["tts"])),
+                (args.tts_stream, "tts-stream", lambda: tts_stream_session(base_ws, scenarios["tts-stream"])),
+            ):
+                calls += [
+                    virtual_call(factory, scenarios[name], deadline, stagger=i / max(count, 1))
+                    for i in range(count)
+                ]
+            started = time.monotonic()
+            await asyncio.gather(*calls)
+            elapsed = time.monotonic() - started
+
+        stop.set()
+        if monitor_task:
+            await monitor_task
+
+        print(f"{args.duration:.0f}s нагрузки: stt={args.stt}, tts={args.tts}, tts-stream={args.tts_stream}")
+        for name, count in (("stt", args.stt), ("tts", args.tts), ("tts-stream", args.tts_stream)):
+            if count:
+                print(scenarios[name].report(elapsed))
+                for error in sorted(set(scenarios[name].errors))[:3]:
+                    print(f"            {error}")
+        if usage:
+            print(f"адаптер: CPU {usage['cpu_percent']:.0f}% ядра, пик RSS {usage['peak_rss_mb']:.0f} MB")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stt", type=int, default=20)
+    parser.add_argument("--tts", type=int, default=5)
+    parser.add_argument("--tts-stream", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--call-seconds", type=float, default=10)
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument("--adapter-pid", type=int, default=None)
+    parser.add_argument("--spawn", action="store_true", help="поднять fake_sber и адаптер")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=3900)
+    parser.add_argument("--grpc-port", type=int, default=50061)
+    parser.add_argument("--oauth-port", type=int, default=9061)
+    add_config_arguments(parser)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
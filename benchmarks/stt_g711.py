@@ -0,0 +1,58 @@
+"""Бенчмарк: STT upstream в G.711 — CPU на поток против сэкономленного трафика.
+
+Имитируется поток jambonz: кадры PCM 8 кГц по --frame-ms. Для каждого
+режима считается процессорное время кодирования кадров (одно ядро),
+доля ядра на один поток и объём аудио к SaluteSpeech.
+
+    python -m benchmarks.stt_g711 --seconds 60
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.audio import alaw_encode, ulaw_encode
+
+SAMPLE_RATE = 8000
+
+
+def make_frames(seconds: float, frame_ms: int) -> list[bytes]:
+    rng = np.random.default_rng(0)
+    samples = int(SAMPLE_RATE * seconds)
+    t = np.arange(samples) / SAMPLE_RATE
+    signal = (np.sin(2 * np.pi * 300 * t) * 8000 + rng.normal(0, 1000, samples)).astype("<i2").tobytes()
+    frame_bytes = SAMPLE_RATE * frame_ms // 1000 * 2
+    return [signal[i:i + frame_bytes] for i in range(0, len(signal), frame_bytes)]
+
+
+def run(args) -> None:
+    frames = make_frames(args.seconds, args.frame_ms)
+    pcm_bytes = sum(len(f) for f in frames)
+    print(f"{args.seconds:.0f}s аудио, {len(frames)} кадров по {args.frame_ms}ms")
+
+    for name, encode in (("pcm", None), ("mulaw", ulaw_encode), ("alaw", alaw_encode)):
+        started = time.process_time()
+        upstream = 0
+        for frame in frames:
+            upstream += len(encode(frame) if encode else frame)
+        cpu = time.process_time() - started
+
+        core_share = cpu / args.seconds
+        kbps = upstream * 8 / args.seconds / 1000
+        per_frame_us = cpu / len(frames) * 1e6
+        streams = f"{1 / core_share:10.0f}" if core_share else "         ∞"
+        print(
+            f"{name:>6}: {kbps:6.0f} kbit/s на поток ({upstream / pcm_bytes:4.0%} от pcm) | "
+            f"{per_frame_us:6.2f} µs/кадр | {core_share:8.4%} ядра на поток | потоков на ядро: {streams}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--frame-ms", type=int, default=20)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
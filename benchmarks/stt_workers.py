@@ -0,0 +1,197 @@
+"""Нагрузочный тест: как число конкурентных STT сессий масштабируется по воркерам.
+
+Адаптер запускается через app.server (тот же супервизор, что в проде) с
+--workers воркерами. В каждом воркере upstream SaluteSpeech имитируется:
+запросы сериализуются в protobuf, на каждый --every кадр возвращается
+transcription с номером кадра. Клиент открывает --sessions WebSocket сессий,
+шлёт кадры 8 кГц по 20 мс в реальном времени и меряет задержку от отправки
+кадра до его transcription. Когда воркеры не успевают, задержка растёт.
+
+Нужны сгенерированные protobuf (./build_protos.sh). Клиент — один процесс:
+на машине с малым числом ядер он сам может стать узким местом.
+
+    python -m benchmarks.stt_workers --workers 1,2,4 --sessions 50,100,200 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import websockets
+from fastapi import FastAPI
+
+from app import stt
+from app.generated import recognitionv2_pb2
+
+FRAME_MS = 20
+FRAME_BYTES = 8000 * FRAME_MS // 1000 * 2
+# Каждый какой кадр получает transcription в воркере
+RESPONSE_EVERY = int(os.getenv("BENCH_RESPONSE_EVERY", "10"))
+
+
+class FakeRecognizeCall:
+    """Recognize: сериализует запросы как gRPC и отвечает номером кадра."""
+
+    def __init__(self, requests, metadata=None):
+        self._requests = requests
+
+    def cancel(self) -> None:
+        pass
+
+    def __aiter__(self):
+        return self._responses()
+
+    async def _responses(self):
+        frames = 0
+        async for request in self._requests:
+            request = recognitionv2_pb2.RecognitionRequest.FromString(request.SerializeToString())
+            if not request.audio_chunk:
+                continue
+            frames += 1
+            if frames % RESPONSE_EVERY:
+                continue
+            seq = str(int.from_bytes(request.audio_chunk[:4], "little"))
+            response = recognitionv2_pb2.RecognitionResponse(
+                transcription=recognitionv2_pb2.Transcription(
+                    results=[recognitionv2_pb2.Hypothesis(text=seq, normalized_text=seq)],
+                )
+            )
+            yield recognitionv2_pb2.RecognitionResponse.FromString(response.SerializeToString())
+
+
+def create_app() -> FastAPI:
+    """Приложение воркера: настоящий /stt, upstream и OAuth подменены."""
+    app = FastAPI()
+    app.include_router(stt.router)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    auth = AsyncMock()
+    auth.get_token.return_value = "token"
+    stt.sber_auth = auth
+    stt.channel_pool = MagicMock()
+    stt.recognitionv2_pb2_grpc = MagicMock()
+    stt.recognitionv2_pb2_grpc.SmartSpeechStub.return_value.Recognize.side_effect = FakeRecognizeCall
+    return app
+
+
+# Импортируется каждым воркером uvicorn
+app = create_app()
+
+
+async def run_session(url: str, seconds: float, latencies: list[float], errors: list[str]) -> None:
+    silence = bytes(FRAME_BYTES)
+    sent: dict[int, float] = {}
+    try:
+        async with websockets.connect(url, max_queue=None) as ws:
+            await ws.send(json.dumps({"type": "start", "language": "ru-RU", "sampleRateHz": 8000}))
+
+            async def read():
+                async for message in ws:
+                    data = json.loads(message)
+                    if data.get("type") == "error":
+                        errors.append(data["error"])
+                        continue
+                    seq = int(data["alternatives"][0]["transcript"])
+                    latencies.append((time.perf_counter() - sent.pop(seq)) * 1000)
+
+            reader = asyncio.create_task(read())
+            started = time.perf_counter()
+            for seq in range(int(seconds * 1000 / FRAME_MS)):
+                if (seq + 1) % RESPONSE_EVERY == 0:
+                    sent[seq] = time.perf_counter()
+                await ws.send(seq.to_bytes(4, "little") + silence[4:])
+                delay = started + (seq + 1) * FRAME_MS / 1000 - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            await asyncio.sleep(0.5)
+            await ws.send(json.dumps({"type": "stop"}))
+            try:
+                await asyncio.wait_for(reader, timeout=5)
+            except asyncio.TimeoutError:
+                reader.cancel()
+            if sent:
+                errors.append(f"{len(sent)} transcriptions lost")
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    code = (
+        "from app.server import run; "
+        f"run('benchmarks.stt_workers:app', host='127.0.0.1', port={port}, workers={workers})"
+    )
+    env = {**os.environ, "LOG_LEVEL": "warning", "BENCH_RESPONSE_EVERY": str(RESPONSE_EVERY)}
+    return subprocess.Popen([sys.executable, "-c", code], env=env)
+
+
+async def wait_healthy(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("adapter did not start")
+            await asyncio.sleep(0.2)
+
+
+async def load(port: int, sessions: int, seconds: float) -> None:
+    latencies: list[float] = []
+    errors: list[str] = []
+    url = f"ws://127.0.0.1:{port}/stt"
+
+    async def staggered(index: int):
+        # Сессии стартуют в течение секунды, а не все в один момент
+        await asyncio.sleep(index / sessions)
+        await run_session(url, seconds, latencies, errors)
+
+    await asyncio.gather(*(staggered(i) for i in range(sessions)))
+
+    if latencies:
+        q = statistics.quantiles(latencies, n=100)
+        summary = f"p50 {q[49]:7.1f}ms | p95 {q[94]:7.1f}ms | p99 {q[98]:7.1f}ms"
+    else:
+        summary = "нет ответов"
+    print(f"  {sessions:5d} сессий: {summary} | ошибок {len(errors)}")
+    for error in sorted(set(errors))[:3]:
+        print(f"      {error}")
+
+
+async def run(args) -> None:
+    print(f"{os.cpu_count()} CPU, {args.seconds:.0f}s аудио на сессию, transcription на каждый {RESPONSE_EVERY} кадр")
+    for workers in (int(w) for w in args.workers.split(",")):
+        print(f"workers={workers}")
+        server = start_server(workers, args.port)
+        try:
+            await wait_healthy(args.port)
+            for sessions in (int(s) for s in args.sessions.split(",")):
+                await load(args.port, sessions, args.seconds)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--sessions", default="50,100,200")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=3901)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
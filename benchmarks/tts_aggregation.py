@@ -0,0 +1,115 @@
+"""Бенчмарк: агрегация токенов LLM в /tts-stream — число gRPC вызовов и time-to-first-audio.
+
+Токены ответа приходят с интервалом --token-interval-ms (как из LLM),
+синтез имитируется: первый chunk через --rpc-latency-ms, длительность
+аудио пропорциональна длине текста. Сравниваются aggregate=0 (вызов на
+каждое stream-сообщение) и aggregate=1 (TextAggregator).
+
+    python -m benchmarks.tts_aggregation --turns 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.segmenter import TextAggregator
+from app.tts_stream import SegmentPipeline
+
+REPLY = (
+    "Здравствуйте! Я проверила ваш заказ, он уже передан в службу доставки. "
+    "Курьер привезёт его завтра, с десяти до двух часов дня, и позвонит за час. "
+    "Если время неудобно, скажите, и я предложу другой интервал."
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Режет текст на фрагменты по словам, как токены LLM."""
+    words = text.split(" ")
+    return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+def make_fake_synthesize(rpc_latency_ms: float, ms_per_char: float, calls: list[str]):
+    async def synthesize(text: str):
+        calls.append(text)
+        await asyncio.sleep(rpc_latency_ms / 1000)
+        # Аудио отдаётся кусками по 20 символов текста
+        for start in range(0, len(text), 20):
+            await asyncio.sleep(ms_per_char * min(20, len(text) - start) / 1000 / 10)
+            yield b"\x00" * 960
+    return synthesize
+
+
+async def run_turn(args, aggregate: bool) -> tuple[int, float, float]:
+    """Один ответ бота; возвращает (вызовов синтеза, ttfa_ms, total_ms)."""
+    calls: list[str] = []
+    first_audio: float | None = None
+    last_audio = 0.0
+
+    async def send(chunk: bytes) -> None:
+        nonlocal first_audio, last_audio
+        last_audio = time.perf_counter()
+        if first_audio is None:
+            first_audio = last_audio
+
+    pipeline = SegmentPipeline(
+        synthesize=make_fake_synthesize(args.rpc_latency_ms, args.ms_per_char, calls),
+        send=send,
+        lookahead=args.lookahead,
+    )
+    pipeline.start()
+
+    queue: asyncio.Queue[str] = asyncio.Queue()
+
+    async def worker() -> None:
+        while True:
+            await pipeline.submit(await queue.get())
+
+    worker_task = asyncio.create_task(worker())
+    aggregator = TextAggregator(on_segment=queue.put_nowait) if aggregate else None
+
+    started = time.perf_counter()
+    tokens = tokenize(REPLY)
+    for token in tokens:
+        if aggregator is not None:
+            aggregator.feed(token)
+        else:
+            queue.put_nowait(token)
+        await asyncio.sleep(args.token_interval_ms / 1000)
+    if aggregator is not None:
+        aggregator.flush()
+
+    while not queue.empty() or pipeline.in_flight:
+        await asyncio.sleep(0.001)
+
+    worker_task.cancel()
+    await asyncio.gather(worker_task, return_exceptions=True)
+    await pipeline.close()
+    return len(calls), (first_audio - started) * 1000, (last_audio - started) * 1000
+
+
+async def run(args) -> None:
+    print(f"ответ: {len(REPLY)} символов, {len(tokenize(REPLY))} токенов")
+    for aggregate in (False, True):
+        results = [await run_turn(args, aggregate) for _ in range(args.turns)]
+        rpcs = [r[0] for r in results]
+        ttfa = [r[1] for r in results]
+        total = [r[2] for r in results]
+        print(
+            f"aggregate={int(aggregate)}: rpc={statistics.median(rpcs):4.0f} | "
+            f"ttfa p50={statistics.median(ttfa):7.1f}ms max={max(ttfa):7.1f}ms | "
+            f"total p50={statistics.median(total):7.1f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--token-interval-ms", type=float, default=30)
+    parser.add_argument("--rpc-latency-ms", type=float, default=150)
+    parser.add_argument("--ms-per-char", type=float, default=60)
+    parser.add_argument("--lookahead", type=int, default=2)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Бенчмарк: задержка /tts от длины текста — синтез целиком и по предложениям.
+
+Upstream имитируется: первый chunk через --first-chunk-ms, синтез идёт со
+скоростью --ms-per-char на символ текста вызова, аудио приходит chunks по
+--chunk-ms. Для каждой длины текста измеряются TTFB и полное время
+буферизованного и chunked ответа при TTS_PARALLEL_MIN_CHARS выкл/вкл.
+
+    python -m benchmarks.tts_parallel --lengths 100,400,1600
+"""
+import argparse
+import asyncio
+import statistics
+from unittest.mock import AsyncMock, patch
+
+from fastapi import FastAPI
+
+from app import tts
+from benchmarks.tts_ttfb import request_ttfb
+
+SENTENCE = "Стоимость заказа включает доставку и сборку мебели на месте. "
+
+
+def make_fake_stream(first_chunk_ms: float, ms_per_char: float, chunk_ms: float):
+    """Synthesize: время синтеза пропорционально длине текста вызова."""
+
+    async def fake_stream(**kwargs):
+        duration_ms = len(kwargs["text"]) * ms_per_char
+        await asyncio.sleep(first_chunk_ms / 1000)
+        chunks = max(1, int(duration_ms // chunk_ms))
+        for i in range(chunks):
+            if i:
+                await asyncio.sleep(chunk_ms / 1000)
+            yield b"\x00" * 960
+    return fake_stream
+
+
+async def run(args) -> None:
+    app = FastAPI()
+    app.include_router(tts.router)
+
+    auth = AsyncMock()
+    auth.get_token.return_value = "token"
+    tts.sber_auth = auth
+    tts.tts_cache = None
+    tts.parallel_concurrency = args.concurrency
+
+    fake = make_fake_stream(args.first_chunk_ms, args.ms_per_char, args.chunk_ms)
+    with patch("app.tts.synthesize_speech_stream", fake):
+        print(f"{'chars':>6} {'mode':>8} | {'whole: ttfb':>11} {'total':>8} | {'split: ttfb':>11} {'total':>8}")
+        for length in args.lengths:
+            text = (SENTENCE * (length // len(SENTENCE) + 1))[:length].rsplit(" ", 1)[0] + "."
+            for mode in ("buffered", "stream"):
+                row = []
+                for split in (False, True):
+                    payload = {"text": text, "voice": "Ost_8000", "stream": mode == "stream", "split": split}
+                    results = [await request_ttfb(app, payload) for _ in range(args.requests)]
+                    row += [statistics.median(r[0] for r in results), statistics.median(r[1] for r in results)]
+                print(
+                    f"{len(text):>6} {mode:>8} | {row[0]:9.0f}ms {row[1]:6.0f}ms | {row[2]:9.0f}ms {row[3]:6.0f}ms"
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=lambda s: [int(x) for x in s.split(",")], default=[100, 400, 1600])
+    parser.add_argument("--requests", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--first-chunk-ms", type=float, default=150)
+    parser.add_argument("--ms-per-char", type=float, default=2.0)
+    parser.add_argument("--chunk-ms", type=float, default=40)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
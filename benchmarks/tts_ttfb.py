@@ -0,0 +1,105 @@
+"""Бенчмарк: time-to-first-byte /tts в буферизованном и chunked режимах.
+
+Upstream имитируется: первый chunk через --first-chunk-ms, далее
+--chunks кусков с интервалом --chunk-interval-ms. Приложение вызывается
+напрямую через ASGI, время первого байта фиксируется в send().
+
+    python -m benchmarks.tts_ttfb --requests 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from unittest.mock import AsyncMock, patch
+
+from fastapi import FastAPI
+
+from app import tts
+
+
+def make_fake_stream(first_chunk_ms: float, chunk_interval_ms: float, chunks: int, chunk_bytes: int):
+    async def fake_stream(**kwargs):
+        await asyncio.sleep(first_chunk_ms / 1000)
+        for i in range(chunks):
+            if i:
+                await asyncio.sleep(chunk_interval_ms / 1000)
+            yield b"\x00" * chunk_bytes
+    return fake_stream
+
+
+async def request_ttfb(app: FastAPI, payload: dict) -> tuple[float, float, int]:
+    """Отправляет POST /tts в ASGI приложение; возвращает (ttfb_ms, total_ms, bytes)."""
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/tts",
+        "raw_path": b"/tts",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 3000),
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    started = time.perf_counter()
+    first_byte = None
+    total_bytes = 0
+
+    async def send(message):
+        nonlocal first_byte, total_bytes
+        if message["type"] == "http.response.body" and message.get("body"):
+            if first_byte is None:
+                first_byte = time.perf_counter()
+            total_bytes += len(message["body"])
+
+    await app(scope, receive, send)
+    finished = time.perf_counter()
+    return (first_byte - started) * 1000, (finished - started) * 1000, total_bytes
+
+
+async def run(args) -> None:
+    app = FastAPI()
+    app.include_router(tts.router)
+
+    auth = AsyncMock()
+    auth.get_token.return_value = "token"
+    tts.sber_auth = auth
+    tts.tts_cache = None
+
+    fake = make_fake_stream(args.first_chunk_ms, args.chunk_interval_ms, args.chunks, args.chunk_bytes)
+    with patch("app.tts.synthesize_speech_stream", fake):
+        for mode in ("buffered", "stream"):
+            payload = {"text": "Тестовый промпт", "voice": "Nec_24000", "stream": mode == "stream"}
+            results = [await request_ttfb(app, payload) for _ in range(args.requests)]
+            ttfb = [r[0] for r in results]
+            total = [r[1] for r in results]
+            print(
+                f"{mode:>8}: ttfb p50={statistics.median(ttfb):7.1f}ms max={max(ttfb):7.1f}ms | "
+                f"total p50={statistics.median(total):7.1f}ms | bytes={results[0][2]}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--first-chunk-ms", type=float, default=150)
+    parser.add_argument("--chunk-interval-ms", type=float, default=40)
+    parser.add_argument("--chunks", type=int, default=25)
+    parser.add_argument("--chunk-bytes", type=int, default=9600)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
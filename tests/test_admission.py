@@ -0,0 +1,127 @@
+import asyncio
+
+import grpc
+import pytest
+from prometheus_client import REGISTRY
+
+from app.admission import BATCH, LIVE, AdmissionRejected, Governor, admitted
+
+
+def rejected(kind: str, reason: str) -> float:
+    return REGISTRY.get_sample_value("admission_rejected_total", {"kind": kind, "reason": reason}) or 0.0
+
+
+def rpc_error(code: grpc.StatusCode) -> grpc.aio.AioRpcError:
+    return grpc.aio.AioRpcError(code, grpc.aio.Metadata(), grpc.aio.Metadata(), code.name)
+
+
+@pytest.mark.asyncio
+async def test_waiter_admitted_when_slot_released():
+    governor = Governor("test", limit=1, max_wait=1.0)
+    await governor.acquire()
+
+    waiter = asyncio.create_task(governor.acquire())
+    await asyncio.sleep(0)
+    assert governor.stats() == {"limit": 1, "active": 1, "waiting": 1, "rejected": 0}
+
+    governor.release()
+    await waiter
+    assert governor.active == 1 and governor.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_longer_than_max_wait_rejected():
+    governor = Governor("test", limit=1, max_wait=0.01)
+    before = rejected("test", "timeout")
+    await governor.acquire()
+
+    with pytest.raises(AdmissionRejected, match="timeout"):
+        await governor.acquire()
+
+    assert governor.waiting == 0
+    assert rejected("test", "timeout") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_live_call_admitted_before_batch():
+    governor = Governor("test", limit=1, max_wait=1.0)
+    await governor.acquire()
+    order = []
+
+    async def wait(name: str, priority: int):
+        await governor.acquire(priority)
+        order.append(name)
+
+    batch = asyncio.create_task(wait("batch", BATCH))
+    await asyncio.sleep(0)
+    live = asyncio.create_task(wait("live", LIVE))
+    await asyncio.sleep(0)
+
+    governor.release()
+    await live
+    governor.release()
+    await batch
+    assert order == ["live", "batch"]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_preempts_batch_for_live_call():
+    governor = Governor("test", limit=1, max_queue=1, max_wait=1.0)
+    await governor.acquire()
+    batch = asyncio.create_task(governor.acquire(BATCH))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected, match="queue_full"):
+        await governor.acquire(BATCH)
+
+    live = asyncio.create_task(governor.acquire(LIVE))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected, match="live call"):
+        await batch
+
+    governor.release()
+    await live
+    assert governor.rejected == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    governor = Governor("test", limit=1, max_wait=1.0)
+    await governor.acquire()
+    waiter = asyncio.create_task(governor.acquire())
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert governor.waiting == 0
+    governor.release()
+    assert governor.active == 0
+
+
+@pytest.mark.asyncio
+async def test_resource_exhausted_lowers_limit_and_success_restores_it():
+    governor = Governor("test", limit=8, cooldown=60)
+
+    with pytest.raises(grpc.aio.AioRpcError):
+        async with governor.slot():
+            raise rpc_error(grpc.StatusCode.RESOURCE_EXHAUSTED)
+    assert governor.limit == 6
+    assert governor.active == 0
+
+    # Повторный RESOURCE_EXHAUSTED в пределах cooldown лимит не снижает
+    governor.report(rpc_error(grpc.StatusCode.RESOURCE_EXHAUSTED))
+    governor.report(rpc_error(grpc.StatusCode.UNAVAILABLE))
+    assert governor.limit == 6
+
+    for _ in range(20):
+        async with governor.slot():
+            pass
+    assert governor.limit == 8
+
+
+@pytest.mark.asyncio
+async def test_admitted_without_governor_is_noop():
+    async with admitted(None, BATCH):
+        pass
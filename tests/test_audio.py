@@ -0,0 +1,87 @@
+import struct
+import warnings
+
+import numpy as np
+import pytest
+
+from app.audio import PcmEncoder, Resampler, alaw_encode, ulaw_encode, voice_sample_rate, wav_header
+
+
+def test_voice_sample_rate_from_voice_name():
+    """Частота голоса определяется по суффиксу имени."""
+    assert voice_sample_rate("Nec_24000") == 24000
+    assert voice_sample_rate("Ost_8000;callSid=abc") == 8000
+    assert voice_sample_rate("Custom") == 24000
+
+
+def test_wav_header_streaming_and_sized():
+    """WAV заголовок: 44 байта, размер data либо неизвестен (стриминг), либо точный."""
+    streaming = wav_header(8000)
+    sized = wav_header(24000, data_size=480)
+
+    assert len(streaming) == len(sized) == 44
+    assert streaming[:4] == b"RIFF" and streaming[8:12] == b"WAVE"
+    assert struct.unpack("<I", streaming[40:44])[0] == 0xFFFFFFFF
+    assert struct.unpack("<I", sized[24:28])[0] == 24000
+    assert struct.unpack("<I", sized[4:8])[0] == 36 + 480
+    assert struct.unpack("<I", sized[40:44])[0] == 480
+
+
+def sine(sample_rate: int, freq: float, seconds: float = 0.5, amplitude: float = 10000) -> bytes:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype("<i2").tobytes()
+
+
+def peak(pcm: bytes, skip: int = 200) -> int:
+    return int(np.abs(np.frombuffer(pcm, dtype="<i2")[skip:-skip]).max())
+
+
+@pytest.mark.parametrize("in_rate,out_rate", [(24000, 8000), (48000, 16000), (24000, 16000)])
+def test_resampler_keeps_passband_and_rejects_aliases(in_rate, out_rate):
+    """Тон в полосе сохраняется, тон выше новой частоты Найквиста подавляется."""
+    out = Resampler(in_rate, out_rate).process(sine(in_rate, 1000))
+    assert len(out) == len(sine(in_rate, 1000)) * out_rate // in_rate
+    assert peak(out) > 9500
+
+    alias = Resampler(in_rate, out_rate).process(sine(in_rate, out_rate * 0.6))
+    assert peak(alias) < 100
+
+
+def test_resampler_is_continuous_across_chunks():
+    """Поток по произвольным chunks (в том числе с нечётным числом байт) совпадает с обработкой целиком."""
+    pcm = sine(24000, 440)
+    whole = Resampler(24000, 8000).process(pcm)
+
+    resampler = Resampler(24000, 8000)
+    chunked = b"".join(resampler.process(pcm[i:i + 333]) for i in range(0, len(pcm), 333))
+
+    assert chunked == whole
+
+
+def test_resampler_passthrough_for_same_rate():
+    pcm = sine(8000, 440)
+    assert Resampler(8000, 8000).process(pcm) is pcm
+
+
+def test_g711_tables_match_reference():
+    """µ-law/A-law коды для всех int16 совпадают с эталоном G.711."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        audioop = pytest.importorskip("audioop")
+    pcm = np.arange(-32768, 32768, dtype="<i2").tobytes()
+
+    assert ulaw_encode(pcm) == audioop.lin2ulaw(pcm, 2)
+    assert alaw_encode(pcm) == audioop.lin2alaw(pcm, 2)
+
+
+def test_pcm_encoder_resamples_and_encodes_across_odd_chunks():
+    """PcmEncoder: ресемплинг + G.711 потоком, нечётный байт chunk переносится."""
+    pcm = sine(8000, 440, seconds=0.1)
+    encoder = PcmEncoder(8000, 8000, "mulaw")
+
+    assert encoder.process(pcm[:101]) + encoder.process(pcm[101:]) == ulaw_encode(pcm)
+
+    resampled = PcmEncoder(24000, 8000, "alaw")
+    source = sine(24000, 440, seconds=0.1)
+    assert len(resampled.process(source)) == pytest.approx(len(source) // 2 / 3, abs=2)
+    assert PcmEncoder(24000, 24000).process(source) == source
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from app.audio_pacer import FramePacer, FrameRing
+
+
+def test_ring_frames_without_copy_and_across_wrap():
+    ring = FrameRing(frame_bytes=4, capacity=8)
+
+    assert ring.write(b"abcdef") == 6
+    frame, size = ring.frame()
+    assert bytes(frame) == b"abcd" and size == 4
+    assert frame.obj is ring._buffer.obj
+    ring.consume(size)
+
+    # Кольцо полно: лишнее не записывается
+    assert ring.write(b"ghijklmn") == 6
+    assert ring.free == 0
+    ring.consume(2)
+    frame, size = ring.frame()
+    assert bytes(frame) == b"ghij"
+    assert frame.obj is not ring._buffer.obj
+
+
+def test_ring_pads_partial_frame_with_silence():
+    ring = FrameRing(frame_bytes=4, capacity=8)
+    ring.write(b"ab")
+
+    assert ring.frame() == (None, 0)
+    frame, size = ring.frame(pad=True)
+    assert bytes(frame) == b"ab\x00\x00" and size == 2
+    assert ring.clear() == 2 and ring.size == 0
+
+
+def test_ring_pads_only_whole_samples():
+    ring = FrameRing(frame_bytes=4, capacity=8)
+    ring.write(b"abc")
+
+    frame, size = ring.frame(pad=True)
+    assert bytes(frame) == b"ab\x00\x00" and size == 2
+    ring.consume(size)
+    # Неполный отсчёт ждёт продолжения
+    ring.write(b"d")
+    assert ring.frame() == (None, 0)
+    ring.write(b"ef")
+    assert bytes(ring.frame()[0]) == b"cdef"
+
+
+@pytest.mark.asyncio
+async def test_pacer_sends_fixed_frames_at_real_time_with_lead():
+    sent = []
+    loop = asyncio.get_running_loop()
+
+    async def send(frame):
+        sent.append((loop.time(), bytes(frame)))
+
+    pacer = FramePacer(send, sample_rate=8000, frame_ms=20, lead_ms=40)
+    pacer.start()
+    started = loop.time()
+    await pacer.write(b"\x01\x00" * 160 * 10)
+    while len(sent) < 10:
+        await asyncio.sleep(0.005)
+    await pacer.close()
+
+    assert all(len(frame) == 320 for _, frame in sent)
+    # Опережение 40 мс: первые кадры сразу, остальные по одному за 20 мс
+    assert sent[2][0] - started < 0.015
+    assert 0.12 <= sent[-1][0] - started < 0.3
+
+
+@pytest.mark.asyncio
+async def test_pacer_clear_drops_queued_audio_and_unblocks_writer():
+    sent = []
+
+    async def send(frame):
+        sent.append(bytes(frame))
+
+    pacer = FramePacer(send, sample_rate=8000, frame_ms=20, lead_ms=0, buffer_ms=100)
+    pacer.start()
+    # Секунда аудио не помещается в буфер на 100 мс: write ждёт места
+    writer = asyncio.create_task(pacer.write(b"\x01\x00" * 8000))
+    await asyncio.sleep(0.05)
+    assert not writer.done()
+
+    dropped = pacer.clear()
+    await asyncio.wait_for(writer, timeout=0.1)
+    frames_at_clear = len(sent)
+    await asyncio.sleep(0.06)
+    await pacer.close()
+
+    assert dropped > 0 and pacer.buffered_bytes == 0
+    assert len(sent) == frames_at_clear
+
+
+@pytest.mark.asyncio
+async def test_pacer_pads_tail_when_audio_stops():
+    sent = []
+
+    async def send(frame):
+        sent.append(bytes(frame))
+
+    pacer = FramePacer(send, sample_rate=8000)
+    pacer.start()
+    await pacer.write(b"\x02\x00" * 200)
+    await asyncio.sleep(0.06)
+    await pacer.close()
+
+    assert sent == [b"\x02\x00" * 160, b"\x02\x00" * 40 + bytes(240)]
+    assert pacer.stats() == {"frames_sent": 2, "padded_frames": 1, "dropped_bytes": 0}
+
+
+@pytest.mark.asyncio
+async def test_pacer_does_not_pad_gaps_shorter_than_lead():
+    """Паузы между chunks короче опережения не вставляют тишину и не сдвигают отсчёты."""
+    sent = []
+
+    async def send(frame):
+        sent.append(bytes(frame))
+
+    pacer = FramePacer(send, sample_rate=8000, frame_ms=20, lead_ms=100)
+    pacer.start()
+    # Chunks по ~50 мс нечётной длины с паузами 30 мс: в пути всегда больше 30 мс аудио
+    audio = b"\x01\x02" * 2000
+    sizes = [801, 799, 803, 797, 800]
+    offset = 0
+    for size in sizes:
+        await pacer.write(audio[offset:offset + size])
+        offset += size
+        await asyncio.sleep(0.03)
+    while sum(map(len, sent)) < offset:
+        await asyncio.sleep(0.01)
+    await pacer.close()
+
+    output = b"".join(sent)
+    assert output.rstrip(b"\x00") == audio[:offset].rstrip(b"\x00")
+    assert pacer.padded_frames == 1
@@ -0,0 +1,164 @@
+import asyncio
+import pytest
+
+from app.audio_queue import AudioQueue, AudioQueueOverflow, ReplayBuffer
+
+# 8 кГц PCM16: 16 байт на мс, кадр 20 мс = 320 байт
+BYTES_PER_SECOND = 16000
+FRAME = b"\x01\x00" * 160
+
+
+async def drain(queue: AudioQueue) -> list[bytes]:
+    chunks = []
+    while (chunk := await queue.get()) is not None:
+        chunks.append(chunk)
+    return chunks
+
+
+@pytest.mark.asyncio
+async def test_frames_pass_through_without_coalescing():
+    """chunk_ms=0 — каждый кадр отдельным chunk."""
+    queue = AudioQueue(BYTES_PER_SECOND)
+    for _ in range(3):
+        await queue.put(FRAME)
+    await queue.close()
+
+    assert await drain(queue) == [FRAME] * 3
+    assert queue.coalesced_frames == 0
+
+
+@pytest.mark.asyncio
+async def test_coalesces_frames_into_chunks():
+    """Кадры по 20 мс склеиваются в chunks по 100 мс, остаток уходит при close."""
+    queue = AudioQueue(BYTES_PER_SECOND, chunk_ms=100)
+    for _ in range(12):
+        await queue.put(FRAME)
+    await queue.close()
+
+    chunks = await drain(queue)
+    assert [len(c) for c in chunks] == [1600, 1600, 640]
+    assert queue.stats() == {
+        "frames": 12,
+        "chunks": 3,
+        "coalesced_frames": 9,
+        "dropped_chunks": 0,
+        "dropped_bytes": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_partial_chunk_flushed_after_max_latency():
+    """Неполный chunk отправляется по таймеру, если новых кадров нет."""
+    queue = AudioQueue(BYTES_PER_SECOND, chunk_ms=200, max_latency_ms=20)
+    await queue.put(FRAME)
+    await queue.put(FRAME)
+
+    chunk = await asyncio.wait_for(queue.get(), timeout=0.5)
+    assert chunk == FRAME * 2
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_bounds_memory():
+    """drop_oldest: при переполнении отбрасываются самые старые chunks."""
+    queue = AudioQueue(BYTES_PER_SECOND, max_queue_ms=60)
+    frames = [bytes([i]) * 320 for i in range(5)]
+    for frame in frames:
+        await queue.put(frame)
+
+    assert queue.queued_bytes <= 960
+    assert queue.dropped_chunks == 2
+    await queue.close()
+    assert await drain(queue) == frames[2:]
+
+
+@pytest.mark.asyncio
+async def test_block_waits_for_reader():
+    """block: put ждёт, пока upstream не заберёт chunk."""
+    queue = AudioQueue(BYTES_PER_SECOND, max_queue_ms=40, overflow="block")
+    await queue.put(FRAME)
+    await queue.put(FRAME)
+
+    blocked = asyncio.create_task(queue.put(FRAME))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    await queue.get()
+    await asyncio.wait_for(blocked, timeout=0.5)
+    assert queue.depth == 2
+    assert queue.dropped_chunks == 0
+
+
+@pytest.mark.asyncio
+async def test_fail_raises_on_overflow():
+    """fail: переполнение завершает сессию ошибкой."""
+    queue = AudioQueue(BYTES_PER_SECOND, max_queue_ms=40, overflow="fail")
+    await queue.put(FRAME)
+    await queue.put(FRAME)
+
+    with pytest.raises(AudioQueueOverflow):
+        await queue.put(FRAME)
+
+
+class CountingGauge:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+@pytest.mark.asyncio
+async def test_depth_gauge_tracks_queue():
+    """depth_gauge: chunks в очереди, с учётом отброшенных и сброшенных discard()."""
+    gauge = CountingGauge()
+    queue = AudioQueue(BYTES_PER_SECOND, max_queue_ms=60, depth_gauge=gauge)
+    for _ in range(5):
+        await queue.put(FRAME)
+    assert gauge.value == queue.depth == 3
+
+    await queue.get()
+    assert gauge.value == 2
+
+    queue.discard()
+    assert gauge.value == 0
+
+
+@pytest.mark.asyncio
+async def test_unget_returns_chunk_to_front():
+    queue = AudioQueue(BYTES_PER_SECOND)
+    await queue.put(b"a" * 2)
+    await queue.put(b"b" * 2)
+
+    chunk = await queue.get()
+    queue.unget(chunk)
+    await queue.close()
+
+    assert await drain(queue) == [b"a" * 2, b"b" * 2]
+
+
+def test_replay_buffer_ack_trims_recognized_audio():
+    replay = ReplayBuffer(max_bytes=1000)
+    for chunk in (b"a" * 100, b"b" * 100, b"c" * 100):
+        replay.append(chunk)
+
+    replay.ack(150)
+
+    assert replay.size == 150
+    assert replay.restart() == [b"b" * 50, b"c" * 100]
+    # После restart позиции отсчитываются от начала нового вызова
+    replay.append(b"d" * 10)
+    assert replay.position == 160
+    replay.ack(None)
+    assert replay.size == 0
+
+
+def test_replay_buffer_drops_oldest_over_limit():
+    replay = ReplayBuffer(max_bytes=250)
+    for chunk in (b"a" * 100, b"b" * 100, b"c" * 100):
+        replay.append(chunk)
+
+    assert replay.restart() == [b"b" * 100, b"c" * 100]
+    assert replay.dropped_bytes == 100
@@ -1,7 +1,11 @@
 # tests/test_auth.py
+import asyncio
+import time
+
+import httpx
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
-from app.auth import SberAuth
+from app.auth import TOKEN_REFRESH_MARGIN_MS, SberAuth
 
 
 @pytest.fixture
@@ -67,3 +71,91 @@ async def test_get_token_refreshes_expired_token(auth):
         token = await auth.get_token()
 
     assert token == "new_token_456"
+
+
+def token_response(token="token", status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = {"access_token": token, "expires_at": 9999999999999}
+    return response
+
+
+@pytest.mark.asyncio
+async def test_concurrent_get_token_single_flight(auth):
+    """Конкурентные вызовы ждут один запрос к OAuth на общем HTTP клиенте."""
+    async def slow_post(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        return token_response("shared")
+
+    mock_client = AsyncMock()
+    mock_client.post.side_effect = slow_post
+
+    with patch("httpx.AsyncClient", return_value=mock_client) as client_cls:
+        tokens = await asyncio.gather(*(auth.get_token() for _ in range(20)))
+        auth._expires_at = 0
+        await auth.get_token()
+
+    assert tokens == ["shared"] * 20
+    assert mock_client.post.await_count == 2
+    assert client_cls.call_count == 1
+    assert auth.stats()["refreshes"] == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_retries_transient_errors():
+    """Сетевые ошибки и 5xx повторяются с backoff, 4xx — нет."""
+    auth = SberAuth("id", "secret", backoff_base=0.001)
+    mock_client = AsyncMock()
+    mock_client.post.side_effect = [
+        httpx.ConnectError("refused"),
+        token_response(status_code=503),
+        token_response("after_retry"),
+    ]
+
+    with patch("httpx.AsyncClient", return_value=mock_client):
+        assert await auth.get_token() == "after_retry"
+    assert auth.retries == 2
+
+    auth._expires_at = 0
+    mock_client.post.side_effect = [token_response(status_code=401)]
+    with patch("httpx.AsyncClient", return_value=mock_client):
+        with pytest.raises(RuntimeError):
+            await auth.get_token()
+    assert auth.refresh_failures == 1
+
+
+@pytest.mark.asyncio
+async def test_background_renewal_before_expiry(auth):
+    """После start() токен обновляется в фоне, до того как get_token сочтёт его истёкшим."""
+    mock_client = AsyncMock()
+    mock_client.aclose = AsyncMock()
+    mock_client.post.return_value = token_response("renewed")
+    # Токен ещё валиден, но уже в окне фонового обновления
+    auth._token = "old"
+    auth._expires_at = int(time.time() * 1000) + TOKEN_REFRESH_MARGIN_MS + 1000
+
+    with patch("httpx.AsyncClient", return_value=mock_client):
+        await auth.start()
+        await asyncio.sleep(0.01)
+        assert auth._token == "renewed"
+        await auth.close()
+
+    mock_client.post.assert_awaited_once()
+    mock_client.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_invalidate_forces_new_token_even_if_stored():
+    """Токен, отвергнутый upstream, не возвращается снова — ни из памяти, ни из store."""
+    store = AsyncMock()
+    store.load.return_value = ("rejected", 9999999999999)
+    auth = SberAuth(client_id="id", client_secret="secret", store=store)
+    auth._token = "rejected"
+    auth._expires_at = 9999999999999
+    auth._request_token = AsyncMock(return_value={"access_token": "fresh", "expires_at": 9999999999999})
+    store.lock = MagicMock(return_value=AsyncMock())
+
+    auth.invalidate("rejected")
+
+    assert await auth.get_token() == "fresh"
+    store.save.assert_awaited_once_with("fresh", 9999999999999)
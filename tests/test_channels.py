@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import grpc
+
+from app.channels import ChannelPool
+
+
+def make_channel(state=grpc.ChannelConnectivity.READY):
+    channel = MagicMock()
+    channel.get_state.return_value = state
+    channel.channel_ready = AsyncMock()
+    channel.close = AsyncMock()
+    return channel
+
+
+@pytest.fixture
+def secure_channel():
+    with patch("grpc.aio.secure_channel", side_effect=lambda *a, **kw: make_channel()) as mock:
+        yield mock
+
+
+@pytest.mark.asyncio
+async def test_pool_warms_channels_on_start(secure_channel):
+    """start() должен открыть и прогреть size каналов."""
+    pool = ChannelPool(size=3)
+    await pool.start()
+
+    assert secure_channel.call_count == 3
+    for pooled in pool.channels:
+        pooled.channel.channel_ready.assert_awaited_once()
+
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_balances_streams_across_channels(secure_channel):
+    """Стримы распределяются на наименее загруженный канал."""
+    pool = ChannelPool(size=2)
+    await pool.start()
+
+    first = pool.acquire()
+    second = pool.acquire()
+
+    assert first.channel is not second.channel
+
+    pool.release(first)
+    third = pool.acquire()
+    assert third.channel is first.channel
+
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_grows_near_stream_limit(secure_channel):
+    """При приближении к лимиту стримов открывается новый канал."""
+    pool = ChannelPool(size=1, max_streams_per_channel=4, max_channels=2, high_water=0.5)
+    await pool.start()
+
+    leases = [pool.acquire() for _ in range(3)]
+
+    assert len(pool.channels) == 2
+    assert leases[2].channel is not leases[0].channel
+
+    # Новый канал прогревается в фоне
+    await asyncio.sleep(0.01)
+    leases[2].channel.channel_ready.assert_awaited_once()
+
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_replaces_broken_channel(secure_channel):
+    """Канал в TRANSIENT_FAILURE пересоздаётся и закрывается после своих стримов."""
+    pool = ChannelPool(size=1)
+    await pool.start()
+
+    lease = pool.acquire()
+    broken = lease.channel
+    broken.get_state.return_value = grpc.ChannelConnectivity.TRANSIENT_FAILURE
+
+    new_lease = pool.acquire()
+    assert new_lease.channel is not broken
+    broken.close.assert_not_called()
+    await asyncio.sleep(0.01)
+    new_lease.channel.channel_ready.assert_awaited_once()
+
+    pool.release(lease)
+    await pool.close()
+    broken.close.assert_awaited()
+
+
+@pytest.mark.asyncio
+async def test_pool_report_failure_retires_channel(secure_channel):
+    """Канал, на котором вызов получил UNAVAILABLE, выводится из ротации."""
+    pool = ChannelPool(size=1)
+    await pool.start()
+
+    lease = pool.acquire()
+    failed = lease.channel
+    pool.report_failure(failed)
+    pool.release(lease)
+
+    assert pool.acquire().channel is not failed
+    await asyncio.sleep(0.01)
+    failed.close.assert_awaited_once()
+
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_close_closes_channels(secure_channel):
+    """close() закрывает все каналы и запрещает новые стримы."""
+    pool = ChannelPool(size=2)
+    await pool.start()
+    channels = [pooled.channel for pooled in pool.channels]
+
+    await pool.close()
+
+    for channel in channels:
+        channel.close.assert_awaited_once()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
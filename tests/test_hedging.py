@@ -0,0 +1,180 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.admission import Governor
+from app.hedging import HedgePolicy, hedged_stream
+
+
+def sample(name: str, endpoint: str) -> float:
+    return REGISTRY.get_sample_value(name, {"endpoint": endpoint}) or 0.0
+
+
+class FakeCalls:
+    """Попытки синтеза: задержка первого chunk по номеру вызова, учёт каналов и отмен."""
+
+    def __init__(self, delays: list[float], errors: dict[int, Exception] | None = None):
+        self.delays = delays
+        self.errors = errors or {}
+        self.excluded: list = []
+        self.closed: list[int] = []
+        self.cancelled: list[int] = []
+
+    def __call__(self, exclude, on_channel):
+        index = len(self.excluded)
+        self.excluded.append(exclude)
+
+        async def call():
+            if on_channel is not None:
+                on_channel(f"channel-{index}")
+            try:
+                await asyncio.sleep(self.delays[index])
+                if index in self.errors:
+                    raise self.errors[index]
+                yield f"{index}:a".encode()
+                yield f"{index}:b".encode()
+            except asyncio.CancelledError:
+                self.cancelled.append(index)
+                raise
+            finally:
+                self.closed.append(index)
+
+        return call()
+
+
+async def collect(stream) -> list[bytes]:
+    return [chunk async for chunk in stream]
+
+
+def test_policy_deadline_follows_percentile():
+    policy = HedgePolicy(percentile=90, min_delay=0.05, initial_delay=1.0, min_samples=10)
+    assert policy.delay() == 1.0
+
+    for i in range(100):
+        policy.observe(0.1 if i < 90 else 2.0)
+
+    assert policy.delay() == 2.0
+    policy = HedgePolicy(percentile=50, min_delay=0.5, min_samples=1)
+    policy.observe(0.1)
+    assert policy.delay() == 0.5
+
+
+def test_policy_budget_caps_hedge_rate():
+    policy = HedgePolicy(budget=0.25, max_tokens=1)
+    assert policy.try_hedge()
+    assert not policy.try_hedge()
+
+    for _ in range(3):
+        policy.on_request()
+    assert not policy.try_hedge()
+    policy.on_request()
+    assert policy.try_hedge()
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    calls = FakeCalls([0.0])
+    policy = HedgePolicy(initial_delay=0.5)
+
+    assert await collect(hedged_stream(calls, policy, "tts")) == [b"0:a", b"0:b"]
+    assert len(calls.excluded) == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_hedged_on_other_channel_and_cancelled():
+    calls = FakeCalls([1.0, 0.0])
+    policy = HedgePolicy(initial_delay=0.05)
+    fired, won = sample("tts_hedges_fired_total", "tts"), sample("tts_hedges_won_total", "tts")
+
+    assert await collect(hedged_stream(calls, policy, "tts")) == [b"1:a", b"1:b"]
+
+    assert calls.excluded == [None, "channel-0"]
+    assert calls.cancelled == [0]
+    assert sorted(calls.closed) == [0, 1]
+    assert sample("tts_hedges_fired_total", "tts") == fired + 1
+    assert sample("tts_hedges_won_total", "tts") == won + 1
+
+
+@pytest.mark.asyncio
+async def test_primary_wins_when_hedge_is_slower():
+    calls = FakeCalls([0.1, 1.0])
+    policy = HedgePolicy(initial_delay=0.05)
+
+    assert await collect(hedged_stream(calls, policy, "tts")) == [b"0:a", b"0:b"]
+    assert calls.cancelled == [1]
+
+
+@pytest.mark.asyncio
+async def test_failed_hedge_falls_back_to_primary():
+    calls = FakeCalls([0.2, 0.0], errors={1: RuntimeError("UNAVAILABLE")})
+    policy = HedgePolicy(initial_delay=0.05)
+
+    assert await collect(hedged_stream(calls, policy, "tts")) == [b"0:a", b"0:b"]
+
+
+@pytest.mark.asyncio
+async def test_primary_error_before_deadline_is_raised_without_hedge():
+    calls = FakeCalls([0.0], errors={0: RuntimeError("boom")})
+    policy = HedgePolicy(initial_delay=0.5)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        await collect(hedged_stream(calls, policy, "tts"))
+    assert len(calls.excluded) == 1
+
+
+@pytest.mark.asyncio
+async def test_exhausted_budget_waits_for_primary():
+    calls = FakeCalls([0.1])
+    policy = HedgePolicy(initial_delay=0.01, max_tokens=0)
+    throttled = sample("tts_hedges_throttled_total", "tts_stream")
+
+    assert await collect(hedged_stream(calls, policy, "tts_stream")) == [b"0:a", b"0:b"]
+    assert len(calls.excluded) == 1
+    assert sample("tts_hedges_throttled_total", "tts_stream") == throttled + 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_cancels_all_calls():
+    calls = FakeCalls([1.0, 1.0])
+    policy = HedgePolicy(initial_delay=0.01)
+
+    task = asyncio.create_task(collect(hedged_stream(calls, policy, "tts")))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert sorted(calls.cancelled) == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_hedge_skipped_without_free_governor_slot():
+    """Лимит 1 занят основным вызовом: хедж не превышает его и не отправляется."""
+    calls = FakeCalls([0.1, 0.0])
+    policy = HedgePolicy(initial_delay=0.01, max_tokens=1)
+    governor = Governor("tts_hedge_test", limit=1)
+
+    async with governor.slot():
+        chunks = await collect(hedged_stream(calls, policy, "tts", governor))
+
+    assert chunks == [b"0:a", b"0:b"]
+    assert len(calls.excluded) == 1
+    # Бюджет хеджа не потрачен
+    assert policy.try_hedge()
+    assert governor.active == 0
+
+
+@pytest.mark.asyncio
+async def test_hedge_holds_governor_slot_until_closed():
+    calls = FakeCalls([1.0, 0.01])
+    policy = HedgePolicy(initial_delay=0.01)
+    governor = Governor("tts_hedge_test", limit=2)
+    active = []
+
+    async with governor.slot():
+        async for _ in hedged_stream(calls, policy, "tts", governor):
+            active.append(governor.active)
+
+    assert active == [2, 2]
+    assert governor.active == 0
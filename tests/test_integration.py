@@ -32,7 +32,9 @@ async def test_auth_gets_real_token():
 @pytest.mark.asyncio
 async def test_tts_synthesizes_audio():
     """Проверяет синтез реального аудио через v2 API."""
+    from app import tts
     from app.auth import SberAuth
+    from app.channels import ChannelPool
     from app.tts import synthesize_speech
 
     auth = SberAuth(
@@ -42,13 +44,19 @@ async def test_tts_synthesizes_audio():
     )
     token = await auth.get_token()
 
-    audio = await synthesize_speech(
-        text="Привет, это тест",
-        voice="Nec_24000",
-        language="ru-RU",
-        content_type="text",
-        token=token,
-    )
+    tts.channel_pool = ChannelPool(size=1)
+    await tts.channel_pool.start()
+    try:
+        audio = await synthesize_speech(
+            text="Привет, это тест",
+            voice="Nec_24000",
+            language="ru-RU",
+            content_type="text",
+            token=token,
+        )
+    finally:
+        await tts.channel_pool.close()
+        tts.channel_pool = None
 
     assert len(audio) > 1000
     assert audio[:4] == b"RIFF"  # WAV header
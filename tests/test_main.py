@@ -34,3 +34,15 @@ def test_routes_registered():
         assert "/tts" in routes
         assert "/stt" in routes
         assert "/health" in routes
+
+
+def test_metrics_endpoint():
+    """/metrics отдаёт метрики в формате Prometheus."""
+    with patch.dict("os.environ", {"SBER_CLIENT_ID": "test_id", "SBER_CLIENT_SECRET": "test_secret"}):
+        from app.main import app
+        client = TestClient(app)
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert "stt_session_setup_seconds" in response.text
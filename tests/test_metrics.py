@@ -0,0 +1,43 @@
+from unittest.mock import MagicMock
+
+import grpc
+from prometheus_client import REGISTRY
+
+from app import metrics
+
+
+def sample(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_grpc_errors_counted_by_endpoint_and_code():
+    error = MagicMock(spec=grpc.aio.AioRpcError)
+    error.code.return_value = grpc.StatusCode.UNAVAILABLE
+    labels = {"endpoint": "stt", "code": "UNAVAILABLE"}
+    before = sample("grpc_errors_total", labels)
+
+    metrics.count_grpc_error("stt", error)
+
+    assert sample("grpc_errors_total", labels) == before + 1
+
+
+def test_render_exposes_hot_path_metrics(monkeypatch):
+    """render() отдаёт формат Prometheus со всеми метриками адаптера."""
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    metrics.STT_BYTES_IN.inc(320)
+
+    content, content_type = metrics.render()
+
+    assert content_type.startswith("text/plain")
+    text = content.decode()
+    for name in (
+        "stt_session_setup_seconds_bucket",
+        "stt_first_partial_seconds_bucket",
+        "stt_first_final_seconds_bucket",
+        "tts_first_audio_seconds_bucket",
+        "tts_synthesis_seconds_bucket",
+        "oauth_refresh_seconds_bucket",
+        'queue_depth{queue="stt_request_queue"}',
+        'audio_bytes_total{direction="in",endpoint="stt"}',
+    ):
+        assert name in text
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import sys
+sys.modules["app.generated"] = MagicMock()
+sys.modules["app.generated.synthesisv2_pb2"] = MagicMock()
+sys.modules["app.generated.synthesisv2_pb2_grpc"] = MagicMock()
+
+from app.presynth import PresynthJob, parse_manifest, router, run_presynthesis
+
+app = FastAPI()
+app.include_router(router)
+client = TestClient(app)
+
+
+def test_parse_manifest_json_and_jsonl():
+    """Манифест принимается как JSON-список и как JSONL."""
+    json_manifest = json.dumps([{"text": "Привет"}, {"ssml": "<speak>Пока</speak>", "voice": "Ost_24000"}])
+    jsonl_manifest = '{"text": "Привет"}\n{"ssml": "<speak>Пока</speak>", "voice": "Ost_24000"}\n'
+
+    for manifest in (json_manifest, jsonl_manifest):
+        prompts = parse_manifest(manifest)
+        assert [p.content_type for p in prompts] == ["text", "ssml"]
+        assert prompts[1].voice == "Ost_24000"
+
+
+def test_parse_manifest_rejects_empty_prompt():
+    """Промпт без text/ssml — ошибка манифеста."""
+    with pytest.raises(ValueError):
+        parse_manifest('[{"voice": "Nec_24000"}]')
+
+
+@pytest.mark.asyncio
+async def test_run_presynthesis_respects_concurrency_and_reports():
+    """Предсинтез ограничен concurrency и считает ошибки и байты."""
+    active = 0
+    max_active = 0
+
+    async def fake_synth(text, voice, language, content_type, priority=None):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if text == "bad":
+            raise RuntimeError("upstream failed")
+        return b"x" * 10
+
+    prompts = parse_manifest(json.dumps([{"text": f"t{i}"} for i in range(7)] + [{"text": "bad"}]))
+    job = PresynthJob(total=len(prompts), concurrency=2)
+
+    with patch("app.tts.get_or_synthesize", side_effect=fake_synth):
+        await run_presynthesis(prompts, job)
+
+    assert max_active == 2
+    assert job.status == "done"
+    assert job.completed == 7
+    assert job.failed == 1
+    assert job.bytes == 70
+    assert job.errors[0]["index"] == 7
+
+
+def test_presynth_endpoint_runs_job():
+    """Admin endpoint запускает задачу и отдаёт её прогресс."""
+    headers = {"Authorization": "Bearer secret"}
+    with patch.dict("os.environ", {"ADMIN_TOKEN": "secret"}):
+        with patch("app.tts.get_or_synthesize", new_callable=AsyncMock) as mock_synth:
+            mock_synth.return_value = b"audio"
+            response = client.post(
+                "/admin/presynth?concurrency=3", content='{"text": "a"}\n{"text": "b"}', headers=headers
+            )
+
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        status = client.get(f"/admin/presynth/{job_id}", headers=headers).json()
+    assert status["status"] == "done"
+    assert status["completed"] == 2
+    assert status["bytes"] == 10
+
+
+def test_presynth_endpoint_requires_admin_token():
+    """При заданном ADMIN_TOKEN запрос без токена отклоняется."""
+    with patch.dict("os.environ", {"ADMIN_TOKEN": "secret"}):
+        response = client.post("/admin/presynth", content='{"text": "a"}')
+    assert response.status_code == 401
+
+
+def test_presynth_endpoint_disabled_without_admin_token():
+    """Без ADMIN_TOKEN admin endpoints закрыты."""
+    with patch.dict("os.environ", {}, clear=True):
+        response = client.post("/admin/presynth", content='{"text": "a"}')
+    assert response.status_code == 403
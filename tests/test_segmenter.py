@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+
+from app.segmenter import TextAggregator, split_ssml, split_text
+
+
+def make_aggregator(**kwargs):
+    segments: list[str] = []
+    kwargs.setdefault("idle_timeout", 0)
+    return TextAggregator(on_segment=segments.append, **kwargs), segments
+
+
+@pytest.mark.asyncio
+async def test_cuts_on_sentence_end():
+    """Сегмент уходит на границе предложения, остаток ждёт продолжения."""
+    aggregator, segments = make_aggregator(min_chars=10)
+    for token in ["Здравствуйте", ", это ", "банк. ", "Чем могу"]:
+        aggregator.feed(token)
+
+    assert segments == ["Здравствуйте, это банк."]
+    assert aggregator.pending == " Чем могу"
+
+
+@pytest.mark.asyncio
+async def test_short_sentence_waits_for_min_chars():
+    """Короткое предложение не режется раньше min_chars."""
+    aggregator, segments = make_aggregator(min_chars=20)
+    aggregator.feed("Да. Конечно, сейчас проверю. ")
+
+    assert segments == ["Да. Конечно, сейчас проверю."]
+
+
+@pytest.mark.asyncio
+async def test_cuts_at_first_sentence_boundary():
+    """Несколько предложений в одном фрагменте дают несколько сегментов."""
+    aggregator, segments = make_aggregator(min_chars=5)
+    aggregator.feed("Первое предложение. Второе предложение. Третье")
+
+    assert segments == ["Первое предложение.", "Второе предложение."]
+    assert aggregator.pending == " Третье"
+
+
+@pytest.mark.asyncio
+async def test_cuts_on_clause_after_clause_chars():
+    """Без конца предложения режем по запятой, когда набрано clause_chars."""
+    aggregator, segments = make_aggregator(min_chars=5, clause_chars=30, max_chars=200)
+    aggregator.feed("Коротко, ")
+    assert segments == []
+
+    aggregator.feed("а теперь длинная клауза без точки, и продолжение")
+    assert segments == ["Коротко, а теперь длинная клауза без точки,"]
+
+
+@pytest.mark.asyncio
+async def test_max_chars_caps_every_segment():
+    """Ни один сегмент не длиннее max_chars, даже если граница есть дальше."""
+    aggregator, segments = make_aggregator(min_chars=5, clause_chars=40, max_chars=40)
+    text = "слово " * 30 + "конец. "
+    aggregator.feed(text)
+    aggregator.flush()
+
+    assert all(len(s) <= 40 for s in segments)
+    assert " ".join(segments).split() == text.split()
+
+
+@pytest.mark.asyncio
+async def test_idle_timeout_flushes_pending():
+    """Без нового текста idle_timeout накопленное уходит в синтез."""
+    aggregator, segments = make_aggregator(idle_timeout=0.02)
+    aggregator.feed("Одну секунду")
+    await asyncio.sleep(0.05)
+
+    assert segments == ["Одну секунду"]
+    assert aggregator.pending == ""
+
+
+@pytest.mark.asyncio
+async def test_flush_and_clear():
+    """flush отдаёт остаток, clear сбрасывает его без синтеза и таймера."""
+    aggregator, segments = make_aggregator(idle_timeout=0.02)
+    aggregator.feed("Первый ответ")
+    aggregator.flush()
+    aggregator.feed("Перебитый ответ")
+    aggregator.clear()
+    await asyncio.sleep(0.05)
+
+    assert segments == ["Первый ответ"]
+    assert aggregator.pending == ""
+
+
+def test_split_text_into_sentences():
+    text = "Ваш заказ номер сорок два принят в обработку. Доставка ожидается завтра до обеда. Спасибо!"
+    assert split_text(text) == [
+        "Ваш заказ номер сорок два принят в обработку.",
+        "Доставка ожидается завтра до обеда. Спасибо!",
+    ]
+
+    assert split_text(text, min_chars=20) == [
+        "Ваш заказ номер сорок два принят в обработку.",
+        "Доставка ожидается завтра до обеда.",
+        "Спасибо!",
+    ]
+    assert split_text("Коротко.") == ["Коротко."]
+
+
+def test_split_ssml_only_at_top_level():
+    ssml = (
+        '<speak lang="ru">Первое предложение достаточно длинное. '
+        '<prosody rate="slow">Внутри тега. Не режем.</prosody> Второе предложение. '
+        '<break time="1s"/>Хвост</speak>'
+    )
+
+    assert split_ssml(ssml, min_chars=20) == [
+        '<speak lang="ru">Первое предложение достаточно длинное.</speak>',
+        '<speak lang="ru"><prosody rate="slow">Внутри тега. Не режем.</prosody> Второе предложение.</speak>',
+        '<speak lang="ru"><break time="1s"/>Хвост</speak>',
+    ]
+
+
+def test_split_ssml_keeps_malformed_markup_whole():
+    assert split_ssml("<speak>Первое. <prosody>Второе. </speak>", min_chars=1) == [
+        "<speak>Первое. <prosody>Второе. </speak>"
+    ]
+    assert split_ssml("Без speak. Текст.", min_chars=1) == ["Без speak. Текст."]
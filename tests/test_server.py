@@ -0,0 +1,52 @@
+import os
+
+import pytest
+from unittest.mock import patch
+
+from app import server
+
+
+@pytest.fixture
+def uvicorn_run(monkeypatch):
+    # run() выставляет окружение воркеров; monkeypatch вернёт его после теста
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    with patch("uvicorn.run") as mock:
+        yield mock
+
+
+def test_single_worker_keeps_token_in_process(uvicorn_run, monkeypatch):
+    """Один воркер — общее хранилище токена не нужно."""
+    monkeypatch.delenv("SBER_TOKEN_FILE", raising=False)
+    monkeypatch.delenv("SBER_TOKEN_REDIS_URL", raising=False)
+
+    server.run(port=3000, workers=1)
+
+    assert uvicorn_run.call_args.kwargs["workers"] == 1
+    assert "SBER_TOKEN_FILE" not in server.os.environ
+
+
+def test_workers_share_token_file(uvicorn_run, monkeypatch):
+    """Несколько воркеров получают общий файл токена через окружение супервизора."""
+    monkeypatch.delenv("SBER_TOKEN_FILE", raising=False)
+    monkeypatch.delenv("SBER_TOKEN_REDIS_URL", raising=False)
+    monkeypatch.setenv("WORKERS", "4")
+
+    server.run(port=3100)
+
+    assert uvicorn_run.call_args.args == ("app.main:app",)
+    assert uvicorn_run.call_args.kwargs["workers"] == 4
+    token_dir = os.path.dirname(server.os.environ["SBER_TOKEN_FILE"])
+    # Каталог токена — приватный и со случайным именем, а не предсказуемый файл в /tmp
+    assert os.stat(token_dir).st_mode & 0o777 == 0o700
+    assert token_dir != server.tempfile.gettempdir()
+    assert os.path.isdir(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def test_workers_keep_configured_store(uvicorn_run, monkeypatch):
+    """Заданное хранилище токена не переопределяется."""
+    monkeypatch.delenv("SBER_TOKEN_FILE", raising=False)
+    monkeypatch.setenv("SBER_TOKEN_REDIS_URL", "redis://redis:6379/0")
+
+    server.run(port=3000, workers=2)
+
+    assert "SBER_TOKEN_FILE" not in server.os.environ
@@ -66,3 +66,340 @@ def test_stt_interim_message_format():
 
     assert result["type"] == "transcription"
     assert result["is_final"] == False
+
+
+def test_stt_upstream_g711_from_start_message():
+    """options.upstreamEncoding выбирает G.711 для 8 кГц, для других частот остаётся pcm."""
+    from app.stt import build_recognition_options, parse_start_message, recognitionv2_pb2
+
+    options = parse_start_message({"type": "start", "sampleRateHz": 8000, "options": {"upstreamEncoding": "mulaw"}})
+    assert options["upstream_encoding"] == "mulaw"
+
+    build_recognition_options(options)
+    kwargs = recognitionv2_pb2.RecognitionOptions.call_args.kwargs
+    assert kwargs["audio_encoding"] is recognitionv2_pb2.RecognitionOptions.AudioEncoding.MULAW
+
+    wideband = parse_start_message({"type": "start", "sampleRateHz": 16000, "options": {"upstreamEncoding": "alaw"}})
+    assert wideband["upstream_encoding"] == "pcm"
+
+
+def test_stt_upstream_encoding_default_from_settings():
+    """Без upstreamEncoding в start message используется настройка процесса."""
+    import app.stt as stt_module
+
+    with patch.object(stt_module, "upstream_encoding", "alaw"):
+        options = stt_module.parse_start_message({"type": "start", "sampleRateHz": 8000})
+    assert options["upstream_encoding"] == "alaw"
+
+
+def test_stt_vad_hangover_covers_no_speech_timeout():
+    """С no_speech_timeout VAD-гейт не подавляет тишину короче таймаута."""
+    from app import stt
+    from app.stt import build_vad_gate, parse_start_message
+
+    options = parse_start_message({"type": "start", "sampleRateHz": 8000, "options": {"vad": True}})
+    assert build_vad_gate(options)._hangover_frames == stt.vad_hangover_ms // 20
+
+    options = parse_start_message(
+        {"type": "start", "sampleRateHz": 8000, "options": {"vad": True, "no_speech_timeout": 5000}}
+    )
+    assert build_vad_gate(options)._hangover_frames == 5000 // 20
+
+    assert build_vad_gate(parse_start_message({"type": "start"})) is None
+
+
+def test_stt_channels_from_start_message():
+    """channels из start message доходит до channels_count; неподдерживаемое значение — моно."""
+    from app.stt import build_recognition_options, parse_start_message, recognitionv2_pb2
+
+    options = parse_start_message({"type": "start", "sampleRateHz": 8000, "channels": 2})
+    assert options["channels"] == 2
+    build_recognition_options(options)
+    assert recognitionv2_pb2.RecognitionOptions.call_args.kwargs["channels_count"] == 2
+
+    assert parse_start_message({"type": "start", "options": {"channels": 2}})["channels"] == 2
+    assert parse_start_message({"type": "start"})["channels"] == 1
+    assert parse_start_message({"type": "start", "channels": 6})["channels"] == 1
+
+
+def test_stt_transcription_reports_channel():
+    from app.stt import format_transcription
+
+    assert format_transcription(text="алло", is_final=True)["channel"] == 1
+    assert format_transcription(text="алло", is_final=True, channel=2)["channel"] == 2
+
+
+def test_stt_trace_metadata_from_start_message():
+    """callSid и метаданные звонка для trace берутся из start message и options."""
+    from app.stt import trace_metadata
+
+    msg = {"type": "start", "callSid": "abc", "options": {"env": "dev", "hints": ["x"]}}
+
+    assert trace_metadata(msg) == {"callSid": "abc", "env": "dev"}
+
+
+class FakeTranscription:
+    def __init__(self, text: str, eou: bool, channel: int = 0):
+        from types import SimpleNamespace
+
+        self.results = [SimpleNamespace(normalized_text=text, text=text)]
+        self.eou = eou
+        self.channel = channel
+        self.processed_audio_end = SimpleNamespace(seconds=0, nanos=0)
+
+
+class FakeResponse:
+    def __init__(self, transcription: FakeTranscription):
+        self.transcription = transcription
+
+    def HasField(self, name: str) -> bool:
+        return name == "transcription"
+
+
+class FakeRecognizeCall:
+    """Recognize: читает запросы как gRPC; fail_after — оборвать вызов после стольких chunks."""
+
+    def __init__(self, requests, fail_after: int | None = None, fail_code: str = "UNAVAILABLE"):
+        import asyncio
+
+        self.audio: list[bytes] = []
+        self.fail_after = fail_after
+        self.fail_code = fail_code
+        self.finished = asyncio.Event()
+        self.enough_audio = asyncio.Event()
+        self._reader = asyncio.ensure_future(self._consume(requests))
+
+    async def _consume(self, requests):
+        async for request in requests:
+            if "audio_chunk" in request:
+                self.audio.append(request["audio_chunk"])
+                if self.fail_after is not None and len(self.audio) >= self.fail_after:
+                    self.enough_audio.set()
+        self.finished.set()
+
+    def cancel(self):
+        self._reader.cancel()
+
+    def __aiter__(self):
+        return self._responses()
+
+    async def _responses(self):
+        import grpc
+
+        if self.fail_after is not None:
+            await self.enough_audio.wait()
+            yield FakeResponse(FakeTranscription("при", eou=False))
+            code = getattr(grpc.StatusCode, self.fail_code)
+            raise grpc.aio.AioRpcError(code, grpc.aio.Metadata(), grpc.aio.Metadata(), "down")
+        await self.finished.wait()
+        yield FakeResponse(FakeTranscription("привет мир", eou=True))
+
+
+def test_stt_reconnects_and_replays_audio_after_upstream_failure(monkeypatch):
+    """Обрыв Recognize не виден jambonz: новый вызов на другом канале получает повтор аудио."""
+    from app import stt
+
+    calls = []
+
+    def recognize(requests, metadata):
+        calls.append(FakeRecognizeCall(requests, fail_after=2 if not calls else None))
+        return calls[-1]
+
+    stub = MagicMock()
+    stub.Recognize.side_effect = recognize
+    auth = AsyncMock()
+    auth.get_token.return_value = "token"
+    pool = MagicMock()
+    pool.acquire.side_effect = lambda exclude=None: MagicMock(channel=f"channel-{pool.acquire.call_count}")
+
+    monkeypatch.setattr(stt, "sber_auth", auth)
+    monkeypatch.setattr(stt, "channel_pool", pool)
+    monkeypatch.setattr(stt, "reconnect_backoff", 0)
+    monkeypatch.setattr(stt.recognitionv2_pb2_grpc, "SmartSpeechStub", lambda channel: stub)
+    monkeypatch.setattr(stt.recognitionv2_pb2, "RecognitionRequest", lambda **kwargs: kwargs)
+    monkeypatch.setattr(stt, "build_recognition_options", lambda options: "options")
+
+    app = FastAPI()
+    app.include_router(stt.router)
+    frames = [bytes([i]) * 320 for i in range(1, 4)]
+    with TestClient(app).websocket_connect("/stt") as ws:
+        ws.send_text(json.dumps({"type": "start", "sampleRateHz": 8000}))
+        for frame in frames[:2]:
+            ws.send_bytes(frame)
+        partial = ws.receive_json()
+        ws.send_bytes(frames[2])
+        ws.send_text(json.dumps({"type": "stop"}))
+        final = ws.receive_json()
+
+    assert partial["is_final"] is False
+    assert final == stt.format_transcription(text="привет мир", is_final=True)
+    assert len(calls) == 2
+    assert pool.acquire.call_args_list[1].args == ("channel-1",)
+    assert calls[1].audio == frames
+    assert auth.get_token.await_count == 2
+    # Токен не отвергнут upstream — переподключение берёт действующий
+    auth.invalidate.assert_not_called()
+
+
+def test_stt_reconnect_after_unauthenticated_refreshes_token(monkeypatch):
+    """UNAUTHENTICATED: отвергнутый токен сбрасывается, новый вызов идёт с новым токеном."""
+    from app import stt
+
+    calls, tokens = [], []
+
+    def recognize(requests, metadata):
+        tokens.append(dict(metadata)["authorization"])
+        calls.append(FakeRecognizeCall(requests, fail_after=1 if not calls else None, fail_code="UNAUTHENTICATED"))
+        return calls[-1]
+
+    stub = MagicMock()
+    stub.Recognize.side_effect = recognize
+    auth = MagicMock()
+    auth.get_token = AsyncMock(side_effect=["expired", "fresh"])
+
+    monkeypatch.setattr(stt, "sber_auth", auth)
+    monkeypatch.setattr(stt, "channel_pool", MagicMock())
+    monkeypatch.setattr(stt, "reconnect_backoff", 0)
+    monkeypatch.setattr(stt.recognitionv2_pb2_grpc, "SmartSpeechStub", lambda channel: stub)
+    monkeypatch.setattr(stt.recognitionv2_pb2, "RecognitionRequest", lambda **kwargs: kwargs)
+    monkeypatch.setattr(stt, "build_recognition_options", lambda options: "options")
+
+    app = FastAPI()
+    app.include_router(stt.router)
+    with TestClient(app).websocket_connect("/stt") as ws:
+        ws.send_text(json.dumps({"type": "start", "sampleRateHz": 8000}))
+        ws.send_bytes(b"\x01" * 320)
+        ws.receive_json()
+        ws.send_text(json.dumps({"type": "stop"}))
+        final = ws.receive_json()
+
+    assert final["is_final"] is True
+    auth.invalidate.assert_called_once_with("expired")
+    assert tokens == ["Bearer expired", "Bearer fresh"]
+
+
+
+class StereoRecognizeCall(FakeRecognizeCall):
+    """Результаты обоих плеч звонка в одном Recognize; каналы SaluteSpeech — с нуля."""
+
+    async def _responses(self):
+        await self.finished.wait()
+        yield FakeResponse(FakeTranscription("добрый день", eou=False, channel=0))
+        yield FakeResponse(FakeTranscription("здравствуйте", eou=True, channel=1))
+
+
+def test_stt_stereo_session_maps_channels(monkeypatch):
+    """Стерео идёт в upstream одним вызовом как есть, channel результата — номер плеча для jambonz."""
+    from app import stt
+
+    calls = []
+    recognition_options = []
+
+    def recognize(requests, metadata):
+        calls.append(StereoRecognizeCall(requests))
+        return calls[-1]
+
+    stub = MagicMock()
+    stub.Recognize.side_effect = recognize
+    auth = AsyncMock()
+    auth.get_token.return_value = "token"
+
+    monkeypatch.setattr(stt, "sber_auth", auth)
+    monkeypatch.setattr(stt, "channel_pool", MagicMock())
+    monkeypatch.setattr(stt.recognitionv2_pb2_grpc, "SmartSpeechStub", lambda channel: stub)
+    monkeypatch.setattr(stt.recognitionv2_pb2, "RecognitionRequest", lambda **kwargs: kwargs)
+    monkeypatch.setattr(stt, "build_recognition_options", lambda options: recognition_options.append(options))
+
+    app = FastAPI()
+    app.include_router(stt.router)
+    # 20 мс стерео 8 кГц: отсчёты левого и правого каналов чередуются
+    frame = b"\x01\x00\x02\x00" * 160
+    with TestClient(app).websocket_connect("/stt") as ws:
+        ws.send_text(json.dumps({"type": "start", "sampleRateHz": 8000, "channels": 2}))
+        ws.send_bytes(frame)
+        ws.send_text(json.dumps({"type": "stop"}))
+        first = ws.receive_json()
+        second = ws.receive_json()
+
+    assert recognition_options[0]["channels"] == 2
+    assert len(calls) == 1 and calls[0].audio == [frame]
+    assert (first["channel"], first["is_final"]) == (1, False)
+    assert (second["channel"], second["is_final"]) == (2, True)
+    assert second["alternatives"][0]["transcript"] == "здравствуйте"
+
+
+class SlowConnectCall(FakeRecognizeCall):
+    """Recognize, который начинает читать запросы после подключения канала (50 мс)."""
+
+    async def _consume(self, requests):
+        import asyncio
+
+        await asyncio.sleep(0.05)
+        await super()._consume(requests)
+
+
+def test_stt_channel_ready_marked_after_options_written(monkeypatch, caplog):
+    """channel_ready — когда Options ушёл в поток, а не когда создан объект вызова."""
+    import logging
+    from app import stt, tracing
+
+    stub = MagicMock()
+    stub.Recognize.side_effect = lambda requests, metadata: SlowConnectCall(requests)
+    auth = AsyncMock()
+    auth.get_token.return_value = "token"
+
+    monkeypatch.setattr(stt, "sber_auth", auth)
+    monkeypatch.setattr(stt, "channel_pool", MagicMock())
+    monkeypatch.setattr(stt.recognitionv2_pb2_grpc, "SmartSpeechStub", lambda channel: stub)
+    monkeypatch.setattr(stt.recognitionv2_pb2, "RecognitionRequest", lambda **kwargs: kwargs)
+    monkeypatch.setattr(stt, "build_recognition_options", lambda options: "options")
+    tracing.configure(1.0, "json")
+    caplog.set_level(logging.INFO, logger="app.tracing")
+
+    app = FastAPI()
+    app.include_router(stt.router)
+    try:
+        with TestClient(app).websocket_connect("/stt") as ws:
+            ws.send_text(json.dumps({"type": "start", "sampleRateHz": 8000}))
+            ws.send_text(json.dumps({"type": "stop"}))
+            ws.receive_json()
+            assert ws.receive()["type"] == "websocket.close"
+    finally:
+        tracing.configure(0)
+
+    [span] = [json.loads(r.getMessage()) for r in caplog.records if r.name == "app.tracing"]
+    events = {event["name"]: event["offset_ms"] for event in span["events"]}
+    assert events["channel_ready"] - events["start"] >= 45
+
+
+def test_stt_session_setup_excludes_wait_for_start_message(monkeypatch):
+    """stt_session_setup_seconds не включает паузу jambonz перед start message."""
+    import time
+    from prometheus_client import REGISTRY
+    from app import stt
+
+    stub = MagicMock()
+    stub.Recognize.side_effect = lambda requests, metadata: FakeRecognizeCall(requests)
+    auth = AsyncMock()
+    auth.get_token.return_value = "token"
+
+    monkeypatch.setattr(stt, "sber_auth", auth)
+    monkeypatch.setattr(stt, "channel_pool", MagicMock())
+    monkeypatch.setattr(stt.recognitionv2_pb2_grpc, "SmartSpeechStub", lambda channel: stub)
+    monkeypatch.setattr(stt.recognitionv2_pb2, "RecognitionRequest", lambda **kwargs: kwargs)
+    monkeypatch.setattr(stt, "build_recognition_options", lambda options: "options")
+
+    def setup_sum():
+        return REGISTRY.get_sample_value("stt_session_setup_seconds_sum") or 0.0
+
+    app = FastAPI()
+    app.include_router(stt.router)
+    before = setup_sum()
+    with TestClient(app).websocket_connect("/stt") as ws:
+        time.sleep(0.2)
+        ws.send_text(json.dumps({"type": "start", "sampleRateHz": 8000}))
+        ws.send_text(json.dumps({"type": "stop"}))
+        ws.receive_json()
+        assert ws.receive()["type"] == "websocket.close"
+
+    assert setup_sum() - before < 0.1
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.auth import SberAuth
+from app.token_store import FileTokenStore, InMemoryKeyValue, KeyValueTokenStore
+
+FRESH_EXPIRES_AT = 9999999999999
+
+
+def make_client(token="shared"):
+    async def slow_post(*args, **kwargs):
+        await asyncio.sleep(0.02)
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"access_token": token, "expires_at": FRESH_EXPIRES_AT}
+        return response
+
+    client = AsyncMock()
+    client.post.side_effect = slow_post
+    return client
+
+
+@pytest.fixture(params=["file", "kv"])
+def store_factory(request, tmp_path):
+    """Фабрика store: каждый вызов — «отдельный процесс» со своим объектом store."""
+    if request.param == "file":
+        path = str(tmp_path / "token.json")
+        return lambda: FileTokenStore(path)
+    kv = InMemoryKeyValue()
+    return lambda: KeyValueTokenStore(kv)
+
+
+@pytest.mark.asyncio
+async def test_store_roundtrip(store_factory):
+    store = store_factory()
+    assert await store.load() is None
+
+    await store.save("token", FRESH_EXPIRES_AT)
+
+    assert await store_factory().load() == ("token", FRESH_EXPIRES_AT)
+
+
+@pytest.mark.asyncio
+async def test_file_store_refuses_symlinks(tmp_path):
+    """Подложенный symlink на месте токена или lock не читается и не создаёт файл по ссылке."""
+    target = tmp_path / "victim"
+    target.write_text('{"access_token": "stolen", "expires_at": 1}')
+    path = tmp_path / "token.json"
+    os.symlink(target, path)
+    os.symlink(tmp_path / "created-by-lock", tmp_path / "token.json.lock")
+    store = FileTokenStore(str(path))
+
+    assert await store.load() is None
+    with pytest.raises(OSError):
+        async with store.lock():
+            pass
+    assert not (tmp_path / "created-by-lock").exists()
+
+    os.unlink(path)
+    await store.save("token", FRESH_EXPIRES_AT)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+@pytest.mark.asyncio
+async def test_store_lock_is_exclusive(store_factory):
+    """Пока один держит lock, второй ждёт."""
+    first, second = store_factory(), store_factory()
+    order = []
+
+    async def hold(store, name):
+        async with store.lock():
+            order.append(f"{name} in")
+            await asyncio.sleep(0.05)
+            order.append(f"{name} out")
+
+    await asyncio.gather(hold(first, "a"), hold(second, "b"))
+
+    assert order in (["a in", "a out", "b in", "b out"], ["b in", "b out", "a in", "a out"])
+
+
+@pytest.mark.asyncio
+async def test_workers_share_one_oauth_request(store_factory):
+    """Несколько SberAuth (воркеров) с общим store делают один запрос к OAuth."""
+    client = make_client()
+    workers = [SberAuth("id", "secret", store=store_factory()) for _ in range(4)]
+
+    with patch("httpx.AsyncClient", return_value=client):
+        tokens = await asyncio.gather(*(worker.get_token() for worker in workers))
+
+    assert tokens == ["shared"] * 4
+    assert client.post.await_count == 1
+    assert sum(worker.store_hits for worker in workers) == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_stored_token_is_refreshed(store_factory):
+    """Токен в store, который пора обновлять, не используется — воркер берёт новый."""
+    store = store_factory()
+    await store.save("stale", int(time.time() * 1000) + 30_000)
+    client = make_client("fresh")
+    auth = SberAuth("id", "secret", store=store)
+
+    with patch("httpx.AsyncClient", return_value=client):
+        assert await auth.get_token() == "fresh"
+
+    assert await store_factory().load() == ("fresh", FRESH_EXPIRES_AT)
+
+
+@pytest.mark.asyncio
+async def test_unavailable_store_falls_back_to_oauth():
+    """Если store недоступен, токен всё равно получается напрямую."""
+    store = MagicMock()
+    store.load = AsyncMock(side_effect=ConnectionError("store down"))
+    client = make_client("direct")
+    auth = SberAuth("id", "secret", store=store)
+
+    with patch("httpx.AsyncClient", return_value=client):
+        assert await auth.get_token() == "direct"
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+
+import httpx
+import pytest
+
+from app import tracing
+
+
+@pytest.fixture
+def json_traces(caplog):
+    """Трассировка всех сессий в JSON лог; возвращает экспортированные span."""
+    tracing.configure(1.0, "json")
+    caplog.set_level(logging.INFO, logger="app.tracing")
+    yield lambda: [json.loads(r.getMessage()) for r in caplog.records if r.name == "app.tracing"]
+    tracing.configure(0)
+
+
+def test_split_voice_extracts_call_metadata():
+    assert tracing.split_voice("Ost_8000;callSid=abc-123,env=dev") == ("Ost_8000", {"callSid": "abc-123", "env": "dev"})
+    assert tracing.split_voice("Nec_24000") == ("Nec_24000", {})
+    assert tracing.split_voice("Nec_24000;callSid=1;tenant=acme") == ("Nec_24000", {"callSid": "1", "tenant": "acme"})
+
+
+def test_disabled_tracing_returns_noop():
+    tracing.configure(0)
+
+    span = tracing.start("stt", callSid="abc")
+
+    assert span is tracing.NOOP
+    assert tracing.current() is tracing.NOOP
+    assert tracing.child("tts_segment") is tracing.NOOP
+    span.mark("token")
+    span.end()
+
+
+def test_sampling_rate_applied(monkeypatch):
+    tracing.configure(0.5, "json")
+    try:
+        monkeypatch.setattr(tracing.random, "random", lambda: 0.7)
+        assert tracing.start("stt") is tracing.NOOP
+        monkeypatch.setattr(tracing.random, "random", lambda: 0.2)
+        assert tracing.start("stt") is not tracing.NOOP
+    finally:
+        tracing.configure(0)
+
+
+def test_json_export_links_segments_to_session(json_traces):
+    async def session():
+        span = tracing.start("tts_stream", callSid="abc")
+        tracing.mark("connect")
+
+        async def segment():
+            child = tracing.child("tts_segment", index=0)
+            tracing.mark("first_chunk")
+            child.end()
+
+        await asyncio.create_task(segment())
+        # Дочерний span задачи не подменяет span сессии
+        assert tracing.current() is span
+        tracing.mark("clear", cancelled=1)
+        span.end()
+        span.end()
+
+    asyncio.run(session())
+
+    segment, session_span = json_traces()
+    assert session_span["name"] == "tts_stream"
+    assert session_span["attributes"] == {"callSid": "abc"}
+    assert [e["name"] for e in session_span["events"]] == ["connect", "clear"]
+    assert session_span["events"][1]["cancelled"] == 1
+    assert segment["parent_id"] == session_span["span_id"]
+    assert segment["trace_id"] == session_span["trace_id"]
+    assert [e["name"] for e in segment["events"]] == ["first_chunk"]
+
+
+def test_otlp_exporter_posts_batched_spans():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return httpx.Response(200)
+
+    async def run():
+        exporter = tracing.configure(1.0, "otlp", "http://collector/v1/traces")
+        exporter._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        span = tracing.start("stt", callSid="abc", sample_rate=8000)
+        span.mark("first_partial")
+        span.end()
+        await exporter.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        tracing.configure(0)
+
+    (payload,) = requests
+    (otlp_span,) = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert otlp_span["name"] == "stt"
+    assert len(otlp_span["traceId"]) == 32 and len(otlp_span["spanId"]) == 16
+    assert {"key": "callSid", "value": {"stringValue": "abc"}} in otlp_span["attributes"]
+    assert {"key": "sample_rate", "value": {"intValue": "8000"}} in otlp_span["attributes"]
+    assert otlp_span["events"][0]["name"] == "first_partial"
+    assert int(otlp_span["endTimeUnixNano"]) >= int(otlp_span["startTimeUnixNano"])
+
+
+def test_configure_rejects_unknown_exporter():
+    with pytest.raises(ValueError):
+        tracing.configure(1.0, "zipkin")
@@ -1,4 +1,5 @@
 # tests/test_tts.py
+import asyncio
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi import FastAPI
@@ -84,3 +85,311 @@ def test_tts_endpoint_returns_502_on_error():
         )
 
     assert response.status_code == 502
+
+
+def test_tts_endpoint_serves_repeated_request_from_cache():
+    """Повторный запрос того же текста отдаётся из кэша без синтеза."""
+    from app.tts_cache import TTSCache
+
+    tts_module.tts_cache = TTSCache()
+    try:
+        with patch("app.tts.synthesize_speech", new_callable=AsyncMock) as mock_synth:
+            mock_synth.return_value = b"cached_audio"
+
+            for _ in range(2):
+                response = client.post(
+                    "/tts",
+                    json={"text": "Привет", "voice": "Nec_24000;callSid=1", "language": "ru-RU", "type": "text"},
+                )
+                assert response.content == b"cached_audio"
+
+        assert mock_synth.await_count == 1
+    finally:
+        tts_module.tts_cache = None
+
+
+def fake_stream(chunks, closed=None):
+    async def _stream(**kwargs):
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            if closed is not None:
+                closed.append(True)
+    return _stream
+
+
+def test_tts_streaming_mode_returns_wav_header_and_chunks():
+    """В режиме stream аудио отдаётся chunked с WAV заголовком стриминга."""
+    from app.audio import wav_header
+
+    with patch("app.tts.synthesize_speech_stream", fake_stream([b"\x01\x00" * 4, b"\x02\x00" * 4])):
+        response = client.post(
+            "/tts",
+            json={"text": "Привет", "voice": "Ost_8000;callSid=1", "language": "ru-RU", "type": "text", "stream": True},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/wav"
+    assert response.content == wav_header(8000) + b"\x01\x00" * 4 + b"\x02\x00" * 4
+
+
+def test_tts_streaming_trace_carries_call_sid(caplog):
+    """Trace запроса несёт callSid из имени голоса и закрывается после отправки тела."""
+    import json
+    import logging
+    from app import tracing
+
+    tracing.configure(1.0, "json")
+    caplog.set_level(logging.INFO, logger="app.tracing")
+    try:
+        with patch("app.tts.synthesize_speech_stream", fake_stream([b"\x01\x00" * 4])):
+            response = client.post(
+                "/tts",
+                json={"text": "Привет", "voice": "Ost_8000;callSid=abc,env=dev", "stream": True},
+            )
+    finally:
+        tracing.configure(0)
+
+    assert response.status_code == 200
+    (span,) = [json.loads(r.getMessage()) for r in caplog.records if r.name == "app.tracing"]
+    assert span["name"] == "tts"
+    assert span["attributes"]["callSid"] == "abc"
+    assert span["attributes"]["env"] == "dev"
+    assert span["attributes"]["voice"] == "Ost_8000"
+    assert span["attributes"]["bytes"] == 8
+    assert "token" in [e["name"] for e in span["events"]]
+
+
+def test_tts_streaming_mode_returns_502_before_first_chunk():
+    """Ошибка до первого chunk возвращается как 502."""
+    async def failing_stream(**kwargs):
+        raise RuntimeError("SaluteSpeech unavailable")
+        yield b""
+
+    with patch("app.tts.synthesize_speech_stream", failing_stream):
+        response = client.post("/tts", json={"text": "Тест", "stream": True})
+
+    assert response.status_code == 502
+
+
+@pytest.mark.asyncio
+async def test_streaming_miss_coalesces_with_concurrent_requests():
+    """Одновременный запрос того же текста ждёт идущий stream синтез, а не вызывает upstream."""
+    from app.tts_cache import TTSCache
+
+    calls = []
+
+    async def slow_stream(**kwargs):
+        calls.append(kwargs["text"])
+        for chunk in (b"\x01\x00", b"\x02\x00"):
+            await asyncio.sleep(0.01)
+            yield chunk
+
+    body = []
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    async def receive():
+        return {"type": "http.request"}
+
+    tts_module.tts_cache = TTSCache()
+    try:
+        with patch("app.tts.synthesize_speech_stream", slow_stream), \
+                patch("app.tts.synthesize_speech", new_callable=AsyncMock) as mock_synth:
+            leader = await tts_module.stream_audio_response("Привет", "Nec_24000", "ru-RU", "text")
+            follower = asyncio.create_task(tts_module.get_or_synthesize("Привет", "Nec_24000", "ru-RU", "text"))
+            await leader({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+            audio = await follower
+
+        assert calls == ["Привет"]
+        mock_synth.assert_not_awaited()
+        assert audio.endswith(b"\x01\x00\x02\x00")
+        assert tts_module.tts_cache.coalesced == 1
+    finally:
+        tts_module.tts_cache = None
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_closes_generator_on_disconnect():
+    """Обрыв клиента посреди ответа закрывает генератор (и gRPC вызов)."""
+    closed = []
+    response = tts_module.ClosingStreamingResponse(fake_stream([b"a", b"b", b"c"], closed)())
+    sent = []
+
+    async def send(message):
+        if message["type"] == "http.response.body" and sent:
+            raise OSError("client disconnected")
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    with pytest.raises(Exception):
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+    assert closed == [True]
+
+
+def sentence_stream(delays: dict[str, float], calls: list | None = None):
+    """Синтез предложения: «PCM» — первая буква текста дважды, после задержки delays[text]."""
+    async def _stream(**kwargs):
+        text = kwargs["text"]
+        if calls is not None:
+            calls.append(text)
+        await asyncio.sleep(delays.get(text, 0))
+        yield text[0].encode()
+        yield text[0].encode()
+    return _stream
+
+
+def test_tts_long_text_split_into_parallel_sentences():
+    """split=True: предложения синтезируются параллельно, PCM склеивается по порядку за одним заголовком."""
+    from app.audio import wav_header
+
+    text = (
+        "Александр оформил заказ сегодня рано утром. "
+        "Банк подтвердил оплату заказа без всяких ошибок. "
+        "Выдача заказа назначена на завтра."
+    )
+    calls = []
+    stream = sentence_stream({"Александр оформил заказ сегодня рано утром.": 0.05}, calls)
+    with patch("app.tts.synthesize_speech_stream", stream), \
+            patch("app.tts.synthesize_speech", new_callable=AsyncMock) as mock_synth:
+        buffered = client.post("/tts", json={"text": text, "voice": "Ost_8000", "split": True})
+        streamed = client.post("/tts", json={"text": text, "voice": "Ost_8000", "split": True, "stream": True})
+
+    mock_synth.assert_not_awaited()
+    assert len(calls) == 6
+    pcm = "ААББВВ".encode()
+    assert buffered.content == wav_header(8000, data_size=len(pcm)) + pcm
+    assert streamed.content == wav_header(8000) + pcm
+
+
+def test_tts_split_threshold_from_settings():
+    """Без поля split параллельный режим включается по длине текста (TTS_PARALLEL_MIN_CHARS)."""
+    assert tts_module.split_for_synthesis("Первое длинное предложение. Второе тоже.", "text") == [
+        "Первое длинное предложение. Второе тоже."
+    ]
+    with patch.object(tts_module, "parallel_min_chars", 10):
+        assert tts_module.split_for_synthesis(
+            "Первое предложение достаточно длинное для разреза. Второе предложение.", "text"
+        ) == ["Первое предложение достаточно длинное для разреза.", "Второе предложение."]
+        assert tts_module.split_for_synthesis("Коротко.", "text", split=False) == ["Коротко."]
+
+
+@pytest.mark.asyncio
+async def test_sentence_failure_cancels_remaining_calls():
+    """Ошибка предложения прерывает синтез, остальные вызовы отменяются."""
+    cancelled = []
+
+    async def stream(**kwargs):
+        if kwargs["text"] == "bad":
+            raise RuntimeError("SaluteSpeech unavailable")
+        try:
+            await asyncio.sleep(1)
+            yield b"x"
+        except asyncio.CancelledError:
+            cancelled.append(kwargs["text"])
+            raise
+
+    with patch("app.tts.synthesize_speech_stream", stream), patch.object(tts_module, "parallel_concurrency", 3):
+        chunks = tts_module.synthesize_sentences_stream(["bad", "slow", "other"], "Nec_24000", "ru-RU", "text", "t")
+        with pytest.raises(RuntimeError):
+            async for _ in chunks:
+                pass
+
+    assert sorted(cancelled) == ["other", "slow"]
+
+
+def test_negotiate_format_from_body_and_accept():
+    """Формат: поле format важнее Accept, Accept выбирается по q, rate — из параметра media type."""
+    from app.tts import negotiate_format
+
+    fmt = negotiate_format("Nec_24000", accept="audio/wav;q=0.5, audio/l16;rate=8000")
+    assert (fmt.name, fmt.sample_rate, fmt.media_type) == ("l16", 8000, "audio/l16;rate=8000")
+    assert fmt.cache_encoding == "l16@8000"
+
+    fmt = negotiate_format("Ost_8000", requested="alaw", accept="audio/l16")
+    assert (fmt.media_type, fmt.cache_encoding) == ("audio/pcma;rate=8000", "alaw")
+    assert fmt.upstream_encoding is tts_module.synthesisv2_pb2.Options.AudioEncoding.PCM_ALAW
+    assert negotiate_format("Ost_8000", requested="l16").encoder() is None
+
+    assert negotiate_format("Nec_24000", accept="*/*").media_type == "audio/wav"
+    assert negotiate_format("Nec_24000", accept="audio/ogg").media_type == "audio/ogg;codecs=opus"
+    assert negotiate_format("Nec_24000", accept="application/json").media_type == "audio/wav"
+    with pytest.raises(ValueError):
+        negotiate_format("Nec_24000", accept="audio/l16;rate=11025")
+
+
+def test_tts_mulaw_response_encoded_from_pcm():
+    """µ-law SaluteSpeech не синтезирует: запрашивается PCM и кодируется на лету."""
+    from app.audio import ulaw_encode
+
+    pcm = b"\x10\x00\xf0\xff" * 40
+    calls = []
+
+    async def stream(**kwargs):
+        calls.append(kwargs)
+        yield pcm[:61]
+        yield pcm[61:]
+
+    with patch("app.tts.synthesize_speech_stream", stream):
+        buffered = client.post("/tts", json={"text": "Привет", "voice": "Ost_8000", "format": "mulaw"})
+        streamed = client.post(
+            "/tts", json={"text": "Привет", "voice": "Ost_8000", "stream": True}, headers={"Accept": "audio/pcmu"}
+        )
+
+    for response in (buffered, streamed):
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "audio/pcmu;rate=8000"
+        assert response.content == ulaw_encode(pcm)
+    assert calls[0]["audio_encoding"] is tts_module.synthesisv2_pb2.Options.AudioEncoding.PCM_S16LE
+
+
+def test_tts_formats_cached_separately():
+    """У каждого формата своя запись кэша: повтор отдаётся без синтеза и без перекодирования."""
+    from app.tts_cache import TTSCache
+
+    calls = []
+
+    async def stream(**kwargs):
+        calls.append(kwargs["audio_encoding"])
+        yield b"\x01\x00" * 8
+
+    tts_module.tts_cache = TTSCache()
+    try:
+        with patch("app.tts.synthesize_speech_stream", stream):
+            for _ in range(2):
+                l16 = client.post("/tts", json={"text": "Привет", "voice": "Ost_8000", "format": "l16"})
+                alaw = client.post("/tts", json={"text": "Привет", "voice": "Ost_8000", "format": "alaw"})
+    finally:
+        tts_module.tts_cache = None
+
+    assert l16.content == b"\x01\x00" * 8
+    assert l16.headers["content-type"] == "audio/l16;rate=8000"
+    assert alaw.content == b"\x01\x00" * 8
+    encodings = tts_module.synthesisv2_pb2.Options.AudioEncoding
+    assert calls == [encodings.PCM_S16LE, encodings.PCM_ALAW]
+
+
+def test_tts_non_audio_accept_returns_wav():
+    """Accept: application/json от HTTP клиента общего назначения — WAV, как до согласования формата."""
+    with patch("app.tts.synthesize_speech", new_callable=AsyncMock) as mock_synth:
+        mock_synth.return_value = b"fake_audio_data"
+        response = client.post(
+            "/tts", json={"text": "Привет", "voice": "Nec_24000"}, headers={"Accept": "application/json"}
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/wav"
+    assert response.content == b"fake_audio_data"
+
+
+def test_tts_rejects_unsupported_format_requests():
+    """Неподдерживаемая частота в Accept — 406, в теле запроса — 422."""
+    assert client.post("/tts", json={"text": "Тест"}, headers={"Accept": "audio/l16;rate=11025"}).status_code == 406
+    assert client.post("/tts", json={"text": "Тест", "format": "l16", "sample_rate": 11025}).status_code == 422
+    assert client.post("/tts", json={"text": "Тест", "format": "mp3"}).status_code == 422
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+
+from app.tts_cache import TTSCache, make_cache_key
+
+
+def test_cache_key_normalizes_request():
+    """Ключ не зависит от пробелов, метаданных голоса и формата языка."""
+    key = make_cache_key("Привет,  мир ", "Nec_24000;callSid=abc", "ru_RU", "TEXT", "wav")
+
+    assert key == make_cache_key("Привет, мир", "Nec_24000", "ru-RU", "text", "wav")
+    assert key != make_cache_key("Привет, мир", "Nec_24000", "ru-RU", "text", "pcm16")
+
+
+@pytest.mark.asyncio
+async def test_memory_lru_evicts_by_bytes():
+    """LRU в памяти вытесняет давно не использованные записи при превышении лимита."""
+    cache = TTSCache(memory_max_bytes=10)
+    await cache.put("a", b"aaaa")
+    await cache.put("b", b"bbbb")
+    await cache.get("a")
+    await cache.put("c", b"cccc")
+
+    assert await cache.get("a") == b"aaaa"
+    assert await cache.get("b") is None
+    assert await cache.get("c") == b"cccc"
+    assert cache.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl():
+    """Записи старше TTL не возвращаются."""
+    cache = TTSCache(ttl_seconds=60)
+    with patch("app.tts_cache.time.time", return_value=1000.0):
+        await cache.put("a", b"audio")
+    with patch("app.tts_cache.time.time", return_value=1061.0):
+        assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_restart(tmp_path):
+    """Дисковый уровень читается новым экземпляром кэша."""
+    cache = TTSCache(disk_dir=str(tmp_path))
+    await cache.put("ab12", b"RIFF-audio")
+
+    restarted = TTSCache(disk_dir=str(tmp_path))
+
+    assert await restarted.get("ab12") == b"RIFF-audio"
+    assert restarted.disk_hits == 1
+    assert await restarted.get("ab12") == b"RIFF-audio"
+    assert restarted.memory_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_reads_entries_of_other_process(tmp_path):
+    """Запись presynth в общий каталог видна уже работающему адаптеру без рестарта."""
+    adapter = TTSCache(memory_max_bytes=0, disk_dir=str(tmp_path))
+    presynth = TTSCache(memory_max_bytes=0, disk_dir=str(tmp_path))
+
+    await presynth.put("key1", b"audio")
+
+    assert await adapter.get("key1") == b"audio"
+    assert adapter.disk_hits == 1
+    assert adapter.stats()["disk_entries"] == 1
+    assert await adapter.get("key2") is None
+
+
+@pytest.mark.asyncio
+async def test_disk_limit_counts_files_of_all_workers(tmp_path):
+    """Воркеры с общим каталогом вытесняют по общему объёму файлов, а не по своим записям."""
+    first = TTSCache(memory_max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=10, disk_rescan_seconds=0)
+    second = TTSCache(memory_max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=10, disk_rescan_seconds=0)
+
+    await first.put("aa1", b"aaaa")
+    await second.put("bb1", b"bbbb")
+    await first.put("cc1", b"cccc")
+
+    files = sorted(p.name for p in tmp_path.rglob("*.audio"))
+    assert files == ["bb1.audio", "cc1.audio"]
+    assert first.stats()["disk_bytes"] == 8
+    assert await second.get("cc1") == b"cccc"
+
+
+@pytest.mark.asyncio
+async def test_disk_read_runs_off_event_loop(tmp_path):
+    """Файл с диска читается в потоке, а не в event loop."""
+    cache = TTSCache(memory_max_bytes=0, disk_dir=str(tmp_path))
+    await cache.put("ab12", b"RIFF-audio")
+
+    threads = []
+    disk_read = cache._disk_read
+
+    def tracking_read(*args):
+        threads.append(threading.current_thread())
+        return disk_read(*args)
+
+    cache._disk_read = tracking_read
+
+    assert await cache.get("ab12") == b"RIFF-audio"
+    assert threads and threads[0] is not threading.main_thread()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_evicts_by_size(tmp_path):
+    """Дисковый уровень удаляет старые файлы при превышении лимита."""
+    cache = TTSCache(memory_max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=8)
+    await cache.put("aa01", b"1234")
+    await cache.put("aa02", b"5678")
+    await cache.put("aa03", b"9012")
+
+    assert await cache.get("aa01") is None
+    assert await cache.get("aa03") == b"9012"
+    assert len(list(tmp_path.rglob("*.audio"))) == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_deduplicates_misses():
+    """Одновременные промахи по одному ключу выполняют один вызов factory."""
+    cache = TTSCache()
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return b"audio"
+
+    results = await asyncio.gather(*(cache.get_or_create("k", factory) for _ in range(5)))
+
+    assert results == [b"audio"] * 5
+    assert calls == 1
+    assert cache.misses == 1
+    assert cache.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors():
+    """Ошибка factory получают все ожидающие, в кэш ничего не пишется."""
+    cache = TTSCache()
+
+    async def factory():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream failed")
+
+    results = await asyncio.gather(
+        *(cache.get_or_create("k", factory) for _ in range(3)),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert await cache.get("k") is None
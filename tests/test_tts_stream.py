@@ -0,0 +1,480 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import sys
+sys.modules["app.generated"] = MagicMock()
+sys.modules["app.generated.synthesisv2_pb2"] = MagicMock()
+sys.modules["app.generated.synthesisv2_pb2_grpc"] = MagicMock()
+
+import app.tts_stream as tts_stream_module
+from app.tts_stream import SegmentPipeline, router
+
+app = FastAPI()
+app.include_router(router)
+client = TestClient(app)
+
+
+def fake_synthesize(delays: dict[str, float], chunks: int = 2, started: list | None = None):
+    """Фейковый upstream: для каждого текста chunks кусков после задержки."""
+    async def _synthesize(text):
+        if started is not None:
+            started.append(text)
+        await asyncio.sleep(delays.get(text, 0))
+        for i in range(chunks):
+            yield f"{text}:{i}".encode()
+    return _synthesize
+
+
+@pytest.fixture
+def unframed(monkeypatch):
+    """Аудио уходит chunks как от синтеза, без нарезки на кадры и темпа."""
+    monkeypatch.setattr(tts_stream_module, "output_frame_ms", 0)
+
+
+async def wait_for(predicate, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_keeps_playback_order():
+    """Быстрый сегмент N+1 не обгоняет медленный сегмент N."""
+    sent = []
+    pipeline = SegmentPipeline(
+        synthesize=fake_synthesize({"a": 0.05, "b": 0.0, "c": 0.01}),
+        send=AsyncMock(side_effect=sent.append),
+        lookahead=3,
+    )
+    pipeline.start()
+    for text in ("a", "b", "c"):
+        await pipeline.submit(text)
+
+    await wait_for(lambda: len(sent) == 6)
+    await pipeline.close()
+
+    assert sent == [b"a:0", b"a:1", b"b:0", b"b:1", b"c:0", b"c:1"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_limits_lookahead():
+    """Одновременно синтезируется не больше lookahead сегментов."""
+    started = []
+    sent = []
+    pipeline = SegmentPipeline(
+        synthesize=fake_synthesize({"a": 0.05, "b": 0.05, "c": 0.05}, started=started),
+        send=AsyncMock(side_effect=sent.append),
+        lookahead=2,
+    )
+    pipeline.start()
+    await pipeline.submit("a")
+    await pipeline.submit("b")
+    submit_c = asyncio.create_task(pipeline.submit("c"))
+
+    await asyncio.sleep(0.01)
+    assert started == ["a", "b"]
+
+    await submit_c
+    await wait_for(lambda: len(sent) == 6)
+    await pipeline.close()
+    assert started == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_bounds_reorder_buffer():
+    """Упреждающий сегмент приостанавливается при заполнении буфера."""
+    release_head = asyncio.Event()
+
+    async def synthesize(text):
+        if text == "head":
+            await release_head.wait()
+            yield b"h"
+            return
+        for _ in range(10):
+            yield b"x" * 10
+
+    pipeline = SegmentPipeline(synthesize=synthesize, send=AsyncMock(), lookahead=2, max_buffer_bytes=30)
+    pipeline.start()
+    await pipeline.submit("head")
+    await pipeline.submit("next")
+
+    await asyncio.sleep(0.01)
+    assert pipeline.buffered_bytes == 30
+
+    release_head.set()
+    await wait_for(lambda: pipeline.in_flight == 0)
+    await pipeline.close()
+
+
+def endless_synthesize(closed: list | None = None, interval: float = 0.002):
+    """Фейковый upstream, который синтезирует бесконечно (длинная реплика)."""
+    async def _synthesize(text):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                yield text.encode()
+        finally:
+            if closed is not None:
+                closed.append(text)
+    return _synthesize
+
+
+@pytest.mark.asyncio
+async def test_pipeline_clear_cancels_head_and_silences():
+    """clear отменяет все сегменты, включая играющий: upstream закрыт, аудио больше не идёт."""
+    sent, closed = [], []
+    pipeline = SegmentPipeline(
+        synthesize=endless_synthesize(closed),
+        send=AsyncMock(side_effect=sent.append),
+        lookahead=3,
+    )
+    pipeline.start()
+    for text in ("a", "b", "c"):
+        await pipeline.submit(text)
+    await wait_for(lambda: len(sent) >= 3)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await pipeline.clear() == 3
+    clear_to_silence = loop.time() - started
+
+    sent_at_clear = len(sent)
+    await asyncio.sleep(0.02)
+    assert len(sent) == sent_at_clear
+    assert sorted(closed) == ["a", "b", "c"]
+    assert pipeline.buffered_bytes == 0
+    assert pipeline.in_flight == 0
+    assert clear_to_silence < 0.05
+
+    # После clear конвейер принимает новые сегменты
+    pipeline._synthesize = fake_synthesize({})
+    await pipeline.submit("d")
+    await wait_for(lambda: sent[-1:] == [b"d:1"])
+    await pipeline.close()
+
+
+def test_tts_stream_endpoint_streams_segments_in_order(unframed):
+    """Endpoint отправляет connect и аудио сегментов по порядку."""
+    with patch("app.tts_stream.synthesize_segment", side_effect=lambda text, voice, language: fake_synthesize({})(text)):
+        with client.websocket_connect("/tts-stream?voice=Ost_8000;callSid=1&lookahead=2") as ws:
+            connect = json.loads(ws.receive_text())
+            assert connect["type"] == "connect"
+
+            ws.send_text(json.dumps({"type": "stream", "text": "one"}))
+            ws.send_text(json.dumps({"type": "stream", "text": "two"}))
+
+            received = [ws.receive_bytes() for _ in range(4)]
+            ws.send_text(json.dumps({"type": "stop"}))
+
+    assert received == [b"one:0", b"one:1", b"two:0", b"two:1"]
+
+
+def test_tts_stream_endpoint_clear_acks_and_silences(unframed):
+    """clear прерывает играющую реплику и подтверждается сообщением cleared."""
+    def synthesize(text, voice, language):
+        if text == "long":
+            return endless_synthesize()(text)
+        return fake_synthesize({})(text)
+
+    with patch("app.tts_stream.synthesize_segment", side_effect=synthesize):
+        with client.websocket_connect("/tts-stream?voice=Ost_8000") as ws:
+            assert json.loads(ws.receive_text())["type"] == "connect"
+            ws.send_text(json.dumps({"type": "stream", "text": "long"}))
+            assert ws.receive_bytes() == b"long"
+
+            ws.send_text(json.dumps({"type": "clear"}))
+            while True:
+                message = ws.receive()
+                if message.get("text"):
+                    break
+            assert json.loads(message["text"]) == {"type": "cleared"}
+
+            ws.send_text(json.dumps({"type": "stream", "text": "next"}))
+            assert ws.receive_bytes() == b"next:0"
+            assert ws.receive_bytes() == b"next:1"
+            ws.send_text(json.dumps({"type": "stop"}))
+
+
+def test_tts_stream_endpoint_resamples_to_announced_rate(unframed):
+    """Голос 24 кГц ресемплируется к частоте, объявленной в connect."""
+    pcm = b"\x00\x10" * 2400
+
+    async def synthesize(text, voice, language):
+        yield pcm
+
+    with patch("app.tts_stream.synthesize_segment", side_effect=synthesize):
+        with client.websocket_connect("/tts-stream?voice=Nec_24000&sample_rate=8000") as ws:
+            connect = json.loads(ws.receive_text())
+            ws.send_text(json.dumps({"type": "stream", "text": "one"}))
+            audio = ws.receive_bytes()
+            ws.send_text(json.dumps({"type": "stop"}))
+
+    assert connect["data"]["sample_rate"] == 8000
+    assert len(audio) == len(pcm) // 3
+
+
+def test_tts_stream_endpoint_sends_fixed_frames(monkeypatch):
+    """Аудио уходит кадрами по 20 мс, хвост реплики дополняется тишиной."""
+    monkeypatch.setattr(tts_stream_module, "output_lead_ms", 1000)
+    pcm = bytes(range(256)) * 5
+
+    async def synthesize(text, voice, language):
+        yield pcm[:700]
+        yield pcm[700:]
+
+    with patch("app.tts_stream.synthesize_segment", side_effect=synthesize):
+        with client.websocket_connect("/tts-stream?voice=Ost_8000&sample_rate=8000") as ws:
+            assert json.loads(ws.receive_text())["type"] == "connect"
+            ws.send_text(json.dumps({"type": "stream", "text": "one"}))
+            frames = [ws.receive_bytes() for _ in range(4)]
+            ws.send_text(json.dumps({"type": "stop"}))
+            # Ждём закрытия сервером: выход из контекста отменил бы его завершение
+            assert ws.receive()["type"] == "websocket.close"
+
+    assert [len(frame) for frame in frames] == [320] * 4
+    assert b"".join(frames) == pcm + bytes(4 * 320 - len(pcm))
+
+
+class FakeMessage:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeSynthesisPb:
+    """Минимальная замена synthesisv2_pb2: сообщения хранят свои поля."""
+    class Options(FakeMessage):
+        AudioEncoding = FakeMessage(PCM_S16LE=1)
+
+    class Text(FakeMessage):
+        ContentType = FakeMessage(TEXT=0)
+
+    class SynthesisRequest:
+        def __init__(self, options=None, text=None):
+            self.options = options
+            self.text = text
+
+
+class FakeAudioResponse:
+    def __init__(self, chunk):
+        self.audio = FakeMessage(audio_chunk=chunk)
+
+    def HasField(self, name):
+        return name == "audio"
+
+
+class FakeSessionCall:
+    """Фейковый двунаправленный Synthesize: на каждый Text отвечает двумя chunks.
+
+    Размер chunks соответствует PCM 24 кГц с темпом SESSION_CHARS_PER_SEC,
+    jitter — пауза внутри аудио текста, pause — после него.
+    """
+
+    def __init__(self, requests, texts_before_end=None, jitter=0.0, pause=0.03):
+        self.requests = requests
+        self.texts = []
+        self.cancelled = False
+        self._texts_before_end = texts_before_end
+        self._jitter = jitter
+        self._pause = pause
+
+    def cancel(self):
+        self.cancelled = True
+
+    async def __aiter__(self):
+        async for request in self.requests:
+            if request.text is None:
+                continue
+            text = request.text.text
+            self.texts.append(text)
+            chunk_bytes = int(len(text) / tts_stream_module.SESSION_CHARS_PER_SEC * 48000 / 2)
+            for i in range(2):
+                if i:
+                    await asyncio.sleep(self._jitter)
+                yield FakeAudioResponse(f"{text}:{i}".encode().ljust(chunk_bytes))
+            await asyncio.sleep(self._pause)
+            if self._texts_before_end and len(self.texts) >= self._texts_before_end:
+                return
+
+
+def labels(sent):
+    return [chunk.rstrip() for chunk in sent]
+
+
+def make_session(sent, calls, open_error=None, on_error=None, **call_kwargs):
+    from app.tts_stream import SynthesisSession
+
+    async def open_call(requests):
+        # open_error — ошибка каждого открытия или список ошибок по очереди (None — успех)
+        error = open_error.pop(0) if isinstance(open_error, list) else open_error
+        if error is not None:
+            raise error
+        call = FakeSessionCall(requests, **call_kwargs)
+        calls.append(call)
+        return call, lambda failed=False: None
+
+    fallback = SegmentPipeline(synthesize=fake_synthesize({}), send=AsyncMock(side_effect=sent.append))
+    return SynthesisSession(
+        voice="Nec_24000",
+        language="ru-RU",
+        send=AsyncMock(side_effect=sent.append),
+        fallback=fallback,
+        on_error=on_error,
+        open_call=open_call,
+    )
+
+
+@pytest.mark.asyncio
+async def test_session_pushes_texts_into_one_call():
+    """В режиме session все сегменты идут одним Synthesize вызовом."""
+    sent, calls = [], []
+    with patch("app.tts_stream.synthesisv2_pb2", FakeSynthesisPb):
+        session = make_session(sent, calls)
+        session.start()
+        for text in ("a", "b", "c"):
+            await session.submit(text)
+
+        await wait_for(lambda: len(sent) == 6)
+        await session.close()
+
+    assert len(calls) == 1
+    assert calls[0].texts == ["a", "b", "c"]
+    assert labels(sent) == [b"a:0", b"a:1", b"b:0", b"b:1", b"c:0", b"c:1"]
+
+
+@pytest.mark.asyncio
+async def test_session_falls_back_when_server_ends_stream():
+    """Если сервер закрыл поток после первого текста, остальные синтезируются отдельными вызовами."""
+    sent, calls = [], []
+    with patch("app.tts_stream.synthesisv2_pb2", FakeSynthesisPb):
+        session = make_session(sent, calls, texts_before_end=1)
+        session.start()
+        await session.submit("a")
+        await wait_for(lambda: len(sent) == 2)
+        await session.submit("b")
+        await session.submit("c")
+
+        await wait_for(lambda: len(sent) == 6)
+        assert session.use_fallback
+        await session.submit("d")
+        await wait_for(lambda: len(sent) == 8)
+        await session.close()
+
+    assert labels(sent) == [b"a:0", b"a:1", b"b:0", b"b:1", b"c:0", b"c:1", b"d:0", b"d:1"]
+
+
+@pytest.mark.asyncio
+async def test_session_clear_resets_call():
+    """clear в режиме session отменяет вызов; следующий текст открывает новый."""
+    sent, calls = [], []
+    with patch("app.tts_stream.synthesisv2_pb2", FakeSynthesisPb):
+        session = make_session(sent, calls)
+        session.start()
+        await session.submit("a")
+        await session.submit("b")
+
+        assert await session.clear() == 2
+        assert calls[0].cancelled
+
+        await session.submit("c")
+        await wait_for(lambda: b"c:1" in labels(sent))
+        await session.close()
+
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_session_back_to_back_audio_not_repeated():
+    """Аудио двух текстов без паузы и конец потока: ничего не синтезируется повторно."""
+    sent, calls = [], []
+    with patch("app.tts_stream.synthesisv2_pb2", FakeSynthesisPb):
+        session = make_session(sent, calls, texts_before_end=2, pause=0)
+        session.start()
+        await session.submit("first sentence")
+        await session.submit("second phrase.")
+
+        await wait_for(lambda: len(sent) == 4)
+        await asyncio.sleep(0.05)
+        assert not session.use_fallback
+        await session.close()
+
+    assert labels(sent) == [b"first sentence:0", b"first sentence:1", b"second phrase.:0", b"second phrase.:1"]
+
+
+@pytest.mark.asyncio
+async def test_session_jitter_pause_does_not_drop_segment():
+    """Пауза внутри аудио первого текста не засчитывается второму: он уходит в fallback."""
+    sent, calls = [], []
+    with patch("app.tts_stream.synthesisv2_pb2", FakeSynthesisPb):
+        session = make_session(sent, calls, texts_before_end=1, jitter=0.2)
+        session.start()
+        await session.submit("first sentence")
+        await session.submit("second phrase.")
+
+        await wait_for(lambda: len(sent) == 4)
+        assert session.use_fallback
+        await session.close()
+
+    assert labels(sent) == [b"first sentence:0", b"first sentence:1", b"second phrase.:0", b"second phrase.:1"]
+
+
+@pytest.mark.asyncio
+async def test_session_open_error_reported_and_falls_back():
+    """Ошибка открытия вызова (токен/канал) сообщается через on_error, текст синтезируется отдельно."""
+    sent, calls = [], []
+    on_error = AsyncMock()
+    error = RuntimeError("token unavailable")
+    with patch("app.tts_stream.synthesisv2_pb2", FakeSynthesisPb):
+        session = make_session(sent, calls, open_error=error, on_error=on_error)
+        session.start()
+        await session.submit("a")
+
+        await wait_for(lambda: len(sent) == 2)
+        await session.close()
+
+    on_error.assert_awaited_once_with(error)
+    assert not session.use_fallback
+    assert sent == [b"a:0", b"a:1"]
+
+
+@pytest.mark.asyncio
+async def test_session_retries_open_after_transient_error():
+    """Разовый отказ (например, admission) не переводит всю сессию на отдельные вызовы."""
+    from app.admission import AdmissionRejected
+
+    sent, calls = [], []
+    with patch("app.tts_stream.synthesisv2_pb2", FakeSynthesisPb):
+        session = make_session(sent, calls, open_error=[AdmissionRejected("busy"), None])
+        session.start()
+        await session.submit("a")
+        await wait_for(lambda: len(sent) == 2)
+        await session.submit("b")
+        await session.submit("c")
+
+        await wait_for(lambda: len(sent) == 6)
+        await session.close()
+
+    assert not session.use_fallback
+    assert len(calls) == 1 and calls[0].texts == ["b", "c"]
+    assert labels(sent) == [b"a:0", b"a:1", b"b:0", b"b:1", b"c:0", b"c:1"]
+
+
+@pytest.mark.asyncio
+async def test_session_stays_on_fallback_after_repeated_open_errors():
+    sent, calls = [], []
+    with patch("app.tts_stream.synthesisv2_pb2", FakeSynthesisPb):
+        session = make_session(sent, calls, open_error=[RuntimeError("down")] * 3 + [None])
+        session.start()
+        for text in ("a", "b", "c", "d"):
+            await session.submit(text)
+            await wait_for(lambda: session.in_flight == 0)
+
+        await session.close()
+
+    assert session.use_fallback
+    assert calls == []
+    assert labels(sent) == [b"a:0", b"a:1", b"b:0", b"b:1", b"c:0", b"c:1", b"d:0", b"d:1"]
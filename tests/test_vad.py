@@ -0,0 +1,84 @@
+import numpy as np
+
+from app.vad import VadGate, frame_levels_db
+
+# 8 кГц PCM16, кадр 20 мс = 160 отсчётов
+SAMPLE_RATE = 8000
+FRAME_SAMPLES = 160
+
+
+def tone(frames: int, amplitude: int = 8000) -> bytes:
+    t = np.arange(frames * FRAME_SAMPLES) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * 440 * t) * amplitude).astype("<i2").tobytes()
+
+
+def silence(frames: int) -> bytes:
+    return bytes(frames * FRAME_SAMPLES * 2)
+
+
+def test_frame_levels_db():
+    """Уровень синуса с амплитудой 1/4 — около -15 dBFS, цифровая тишина — нижняя граница."""
+    levels = frame_levels_db(tone(2, 8192) + silence(1) + b"\x01\x00", FRAME_SAMPLES)
+
+    assert len(levels) == 3
+    assert np.allclose(levels[:2], -15.05, atol=0.2)
+    assert levels[2] == -120.0
+
+
+def test_frame_levels_db_takes_loudest_channel():
+    """Стерео: уровень кадра — по громкому каналу, даже если второй молчит."""
+    voice = np.frombuffer(tone(2, 8192), dtype="<i2")
+    stereo = np.column_stack([np.zeros_like(voice), voice]).astype("<i2").tobytes()
+
+    levels = frame_levels_db(stereo, FRAME_SAMPLES, channels=2)
+
+    assert len(levels) == 2
+    assert np.allclose(levels, -15.05, atol=0.2)
+
+
+def test_gate_suppresses_silence_after_hangover():
+    """После hangover тишина не отправляется, доля подавленного считается от всего аудио."""
+    gate = VadGate(SAMPLE_RATE, hangover_ms=100, preroll_ms=0)
+
+    out = gate.process(tone(5)) + gate.process(silence(20))
+
+    assert len(out) == len(tone(5)) + len(silence(5))
+    assert not gate.is_open
+    assert gate.suppressed_bytes == len(silence(15))
+    assert gate.suppressed_fraction == 15 / 25
+
+
+def test_gate_preroll_keeps_speech_onset():
+    """Начало речи приходит вместе с pre-roll кадрами перед ним."""
+    gate = VadGate(SAMPLE_RATE, hangover_ms=20, preroll_ms=60)
+    gate.process(silence(10))
+    assert not gate.is_open
+
+    quiet_onset = tone(3, amplitude=10)
+    out = gate.process(quiet_onset + tone(2))
+
+    assert gate.is_open
+    assert out == quiet_onset + tone(2)
+    # 1 кадр ушёл до закрытия гейта, тихое начало речи вернул pre-roll
+    assert gate.suppressed_bytes == len(silence(9))
+
+
+def test_gate_buffers_partial_frames():
+    """Кадры jambonz произвольной длины режутся на кадры VAD без потерь."""
+    gate = VadGate(SAMPLE_RATE)
+    audio = tone(10)
+
+    out = b"".join(gate.process(audio[i:i + 250]) for i in range(0, len(audio), 250))
+
+    assert out + gate.flush() == audio
+
+
+def test_gate_keepalive_sends_zero_frames():
+    """keepalive_ms: закрытый гейт шлёт кадр нулей на каждые keepalive_ms тишины."""
+    gate = VadGate(SAMPLE_RATE, hangover_ms=20, preroll_ms=0, keepalive_ms=100)
+    gate.process(silence(1))
+
+    out = gate.process(silence(20) + b"\x00\x00" * 10 + tone(1, amplitude=3))
+
+    assert out == silence(4)
+    assert gate.keepalive_bytes == len(silence(4))